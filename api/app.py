@@ -0,0 +1,49 @@
+"""
+API App - ASGI application exposing the services over HTTP
+
+Usage:
+    uvicorn api.app:app --host 0.0.0.0 --port 8000
+"""
+import contextlib
+
+from starlette.applications import Starlette
+from starlette.routing import Route
+
+from api import routes
+from api.responses import APIJSONResponse
+from utils.async_storage import run_sync
+from utils.output_log import logger
+from utils.replication import ReadOnlyReplicaError
+from utils.storage_setup import setup_storage
+
+
+async def bad_request(request, exc):
+    return APIJSONResponse({'success': False, 'message': str(exc)}, status_code=400)
+
+
+async def read_only(request, exc):
+    return APIJSONResponse({'success': False, 'message': str(exc)}, status_code=503)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await run_sync(setup_storage)
+    logger.info("API started")
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route('/api/token', routes.create_token, methods=['POST']),
+        Route('/api/accounts', routes.list_accounts),
+        Route('/api/transactions', routes.list_transactions),
+        Route('/api/transactions/search', routes.search_transactions),
+        Route('/api/transactions/aggregate', routes.aggregate_transactions),
+        Route('/api/imports', routes.import_file, methods=['POST']),
+        Route('/api/categories', routes.list_categories),
+        Route('/api/categories/unmapped', routes.list_unmapped),
+        Route('/api/categories/mappings', routes.save_category_mappings, methods=['POST']),
+    ],
+    exception_handlers={routes.BadRequest: bad_request, ReadOnlyReplicaError: read_only},
+    lifespan=lifespan,
+)
@@ -0,0 +1,31 @@
+"""
+API Auth - Bearer JWT authentication for API routes
+"""
+import functools
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from utils import async_storage
+from utils.auth import get_username_from_token, is_token_valid
+
+
+def bearer_token(request: Request) -> str:
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' else ''
+
+
+def requires_user(handler):
+    """Resolve the Authorization bearer token to request.state.username or answer 401"""
+    @functools.wraps(handler)
+    async def wrapper(request: Request):
+        token = bearer_token(request)
+        username = get_username_from_token(token) if is_token_valid(token) else None
+        if not username or not await async_storage.get_user(username):
+            return JSONResponse(
+                {'success': False, 'message': 'Invalid or expired token.'},
+                status_code=401, headers={'WWW-Authenticate': 'Bearer'}
+            )
+        request.state.username = username
+        return await handler(request)
+    return wrapper
@@ -0,0 +1,38 @@
+"""
+API Responses - JSON and NDJSON encoding of service DataFrames
+"""
+import json
+
+import pandas as pd
+from starlette.responses import JSONResponse, StreamingResponse
+
+
+def frame_records(df: pd.DataFrame) -> list:
+    """DataFrame rows as JSON-ready dicts: dates as YYYY-MM-DD, missing values as None"""
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime('%Y-%m-%d')
+    df = df.astype(object)
+    return df.where(df.notna(), None).to_dict(orient='records')
+
+
+def ndjson_response(frames) -> StreamingResponse:
+    """Stream an iterable of DataFrames as newline-delimited JSON, one transaction per line"""
+    def lines():
+        for df in frames:
+            yield ''.join(json.dumps(record, default=_encode) + '\n' for record in frame_records(df))
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+class APIJSONResponse(JSONResponse):
+    """JSONResponse that also encodes numpy scalars and timestamps returned by the services"""
+
+    def render(self, content) -> bytes:
+        return json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=_encode).encode('utf-8')
+
+
+def _encode(value):
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
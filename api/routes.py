@@ -0,0 +1,178 @@
+"""
+API Routes - HTTP handlers for transactions, imports and categories
+"""
+import io
+
+import pandas as pd
+from starlette.requests import Request
+
+from api.auth import requires_user
+from api.responses import APIJSONResponse, frame_records, ndjson_response
+from services.auth_service import AuthService
+from services.category_service import CategoryService
+from services.input_service import InputService
+from services.transaction_service import TransactionService
+
+MAX_PAGE_SIZE = 1000
+
+
+class BadRequest(ValueError):
+    """Invalid request parameters; answered with 400"""
+
+
+class UploadedBytes(io.BytesIO):
+    """Request body presented to InputService like a Streamlit UploadedFile"""
+
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+def _int_param(request: Request, name: str, default: int, maximum: int | None = None) -> int:
+    try:
+        value = int(request.query_params.get(name, default))
+    except ValueError:
+        raise BadRequest(f"'{name}' must be an integer") from None
+    if value < 1:
+        raise BadRequest(f"'{name}' must be at least 1")
+    return min(value, maximum) if maximum else value
+
+
+def _date_param(request: Request, name: str):
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    try:
+        return pd.Timestamp(value)
+    except ValueError:
+        raise BadRequest(f"'{name}' must be a date") from None
+
+
+def _filters(request: Request) -> dict:
+    return {
+        'accounts': request.query_params.getlist('account'),
+        'categories': request.query_params.getlist('category'),
+        'merchants': request.query_params.getlist('merchant'),
+        'start_date': _date_param(request, 'start_date'),
+        'end_date': _date_param(request, 'end_date'),
+    }
+
+
+def _wants_ndjson(request: Request) -> bool:
+    return request.query_params.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('accept', '')
+
+
+async def _json_body(request: Request) -> dict:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise BadRequest('Request body must be JSON') from None
+    if not isinstance(body, dict):
+        raise BadRequest('Request body must be a JSON object')
+    return body
+
+
+async def create_token(request: Request):
+    body = await _json_body(request)
+    result = await AuthService.login_user_async(body.get('username', ''), body.get('password', ''))
+    if not result['success']:
+        return APIJSONResponse(result, status_code=401)
+    return APIJSONResponse({'success': True, 'token': result['token']})
+
+
+@requires_user
+async def list_accounts(request: Request):
+    return APIJSONResponse({'accounts': await InputService.get_accounts_async()})
+
+
+@requires_user
+async def list_transactions(request: Request):
+    """Paged JSON by default; ?format=ndjson (or Accept: application/x-ndjson) streams every match"""
+    username, filters = request.state.username, _filters(request)
+    if _wants_ndjson(request):
+        return ndjson_response(TransactionService.iter_transactions(username, filters))
+    page = _int_param(request, 'page', 1)
+    page_size = _int_param(request, 'page_size', 100, MAX_PAGE_SIZE)
+    result = await TransactionService.get_transactions_page_async(username, filters, page, page_size)
+    return APIJSONResponse({
+        'items': frame_records(result['results']), 'total': result['total'],
+        'page': result['page'], 'page_size': result['page_size'],
+    })
+
+
+@requires_user
+async def search_transactions(request: Request):
+    page = _int_param(request, 'page', 1)
+    page_size = _int_param(request, 'page_size', 50, MAX_PAGE_SIZE)
+    filters = _filters(request)
+    result = await TransactionService.search_async(
+        request.state.username, request.query_params.get('q', ''),
+        {'accounts': filters['accounts'], 'categories': filters['categories']}, page, page_size
+    )
+    return APIJSONResponse({
+        'items': frame_records(result['results']), 'total': result['total'],
+        'page': result['page'], 'page_size': result['page_size'],
+    })
+
+
+@requires_user
+async def aggregate_transactions(request: Request):
+    params = request.query_params
+    try:
+        df = await TransactionService.aggregate_transactions_async(
+            request.state.username, params.getlist('group_by'),
+            params.get('start_date'), params.get('end_date'), params.getlist('account') or None
+        )
+    except ValueError as e:
+        raise BadRequest(str(e)) from None
+    return APIJSONResponse({'items': frame_records(df)})
+
+
+@requires_user
+async def import_file(request: Request):
+    """
+    Import a statement sent as the raw request body; ?filename= names the file in the import journal
+    and its extension picks the format (CSV by default, .ofx/.qfx or .xlsx). ?account= selects a saved
+    mapping; without it the mapping is detected from the statement's columns, or for OFX/QFX from the
+    statement's account id.
+    """
+    uploaded = UploadedBytes(await request.body(), request.query_params.get('filename', 'upload.csv'))
+    if not uploaded.getvalue():
+        raise BadRequest('Request body is empty')
+    extension = uploaded.name.rsplit('.', 1)[-1].lower() if '.' in uploaded.name else 'csv'
+    if extension not in InputService.get_supported_types():
+        raise BadRequest(f"Unsupported statement type '.{extension}'")
+    account = request.query_params.get('account')
+    if account:
+        mappings = await InputService.get_saved_mappings_async(account)
+        detected = {'account': account, 'mappings': mappings} if mappings else None
+    else:
+        detected = await InputService.detect_mapping_async(uploaded)
+    if not detected:
+        raise BadRequest('No saved mapping for this account or file; set one up in the app first')
+    result = await InputService.quick_import_async(detected, uploaded, request.state.username)
+    return APIJSONResponse({**result, 'account': detected['account']})
+
+
+@requires_user
+async def list_categories(request: Request):
+    return APIJSONResponse({'categories': await CategoryService.get_existing_categories_async()})
+
+
+@requires_user
+async def list_unmapped(request: Request):
+    df = await CategoryService.get_unmapped_transactions_async(request.state.username)
+    return APIJSONResponse({'items': frame_records(df), 'total': len(df)})
+
+
+@requires_user
+async def save_category_mappings(request: Request):
+    body = await _json_body(request)
+    fields = ('original_category', 'merchant_name', 'description', 'target_category')
+    mappings = body.get('mappings')
+    if not isinstance(mappings, list) or not all(isinstance(m, dict) and 'target_category' in m for m in mappings):
+        raise BadRequest("'mappings' must be a list of objects with a target_category")
+    updated = await CategoryService.save_category_mappings_async(
+        [tuple(m.get(field) for field in fields) for m in mappings], request.state.username
+    )
+    return APIJSONResponse({'success': True, 'saved': len(mappings), 'updated': updated})
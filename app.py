@@ -3,20 +3,20 @@ import os
 import sys
 import importlib
 
-from config.configure import Config
-from utils.minio_storage import download_db
-from utils.sqlite_storage import initialize_db
+from utils import replication, storage_setup
 from utils.output_log import logger
 from services.auth_service import AuthService
 
 # Add project root to sys.path for module resolution
 sys.path.insert(0, os.path.abspath('.'))
 
-# Setup on first run
-if not os.path.exists(Config.LOCAL_DB_PATH):
-    os.makedirs(os.path.dirname(Config.LOCAL_DB_PATH), exist_ok=True)
-    download_db()
-    initialize_db()
+# Setup once per process
+@st.cache_resource
+def setup_storage():
+    storage_setup.setup_storage()
+
+
+setup_storage()
 
 # Configure page
 st.set_page_config(
@@ -55,6 +55,8 @@ except ModuleNotFoundError as e:
     logger.error(f"Module import error: {e}")
     st.session_state['page'] = 'home'
     st.rerun()
+except replication.ReadOnlyReplicaError as e:
+    st.warning(str(e))
 except Exception as e:
     st.error(f"Error loading page: {str(e)}")
     logger.error(f"Page loading error: {e}")
@@ -0,0 +1 @@
+# Benchmark Suite Module
@@ -0,0 +1,56 @@
+"""
+Benchmark Compare - Diff two benchmark JSON reports and flag regressions
+
+Usage:
+    python -m benchmarks.compare baseline.json current.json --threshold 1.10
+"""
+import argparse
+import json
+import sys
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        report = json.load(f)
+    return {(r['benchmark'], r['size']): r for r in report['results']}
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Return one row per benchmark present in both reports"""
+    rows = []
+    for key in sorted(baseline.keys() & current.keys()):
+        base, cur = baseline[key], current[key]
+        time_ratio = cur['timings_s']['median'] / max(base['timings_s']['median'], 1e-9)
+        memory_ratio = cur['peak_memory_bytes'] / max(base['peak_memory_bytes'], 1)
+        rows.append({
+            'benchmark': key[0],
+            'size': key[1],
+            'baseline_s': base['timings_s']['median'],
+            'current_s': cur['timings_s']['median'],
+            'time_ratio': time_ratio,
+            'memory_ratio': memory_ratio,
+            'regression': time_ratio > threshold or memory_ratio > threshold,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark reports')
+    parser.add_argument('baseline', help='Baseline JSON report')
+    parser.add_argument('current', help='Current JSON report')
+    parser.add_argument('--threshold', type=float, default=1.10, help='Ratio above which a change is a regression')
+    args = parser.parse_args(argv)
+
+    rows = compare(load_results(args.baseline), load_results(args.current), args.threshold)
+    print(f"{'benchmark':<32} {'size':>8} {'baseline_s':>12} {'current_s':>12} {'time':>7} {'memory':>7}")
+    for row in rows:
+        flag = '  REGRESSION' if row['regression'] else ''
+        print(
+            f"{row['benchmark']:<32} {row['size']:>8} {row['baseline_s']:>12.4f} {row['current_s']:>12.4f} "
+            f"{row['time_ratio']:>6.2f}x {row['memory_ratio']:>6.2f}x{flag}"
+        )
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
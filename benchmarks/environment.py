@@ -0,0 +1,46 @@
+"""
+Benchmark Environment - Isolated temp SQLite database and fake MinIO client
+"""
+import os
+import sys
+import tempfile
+
+from benchmarks.fake_minio import FakeMinio
+
+
+def bootstrap(work_dir: str | None = None, latency: float = 0.0) -> FakeMinio:
+    """
+    Point the app configuration at a temp directory and swap in a fake MinIO client.
+    Must run before anything imports config.configure.
+    """
+    if 'config.configure' in sys.modules:
+        raise RuntimeError('bootstrap() must be called before the app modules are imported')
+
+    work_dir = work_dir or tempfile.mkdtemp(prefix='peng-finance-bench-')
+    os.environ['LOCAL_DB_PATH'] = os.path.join(work_dir, 'main.db')
+    os.environ['DB_S3_PATH'] = 'bench'
+    os.environ['MINIO_BUCKET'] = 'peng-finance-bench'
+    os.environ.setdefault('MINIO_ENDPOINT', 'localhost:9000')
+    os.environ.setdefault('JWT_SECRET', 'bench-secret')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    from utils import minio_storage
+    fake = FakeMinio(latency=latency)
+    minio_storage.client = fake
+
+    reset_db()
+    return fake
+
+
+def reset_db():
+    """Drop the benchmark database file and recreate an empty schema"""
+    from config.configure import Config
+    from utils.minio_storage import wait_for_uploads
+    from utils.sqlite_storage import engine, initialize_db
+
+    # Background archival still writes journal rows to the old database
+    wait_for_uploads()
+    engine.dispose()
+    if os.path.exists(Config.LOCAL_DB_PATH):
+        os.remove(Config.LOCAL_DB_PATH)
+    initialize_db()
@@ -0,0 +1,98 @@
+"""
+Fake MinIO - In-memory object store implementing the subset of the Minio client used by the app
+"""
+import datetime
+import hashlib
+import io
+import threading
+
+
+class FakeObject:
+    """Stat result returned by FakeMinio.stat_object"""
+
+    def __init__(self, object_name: str, data: bytes, last_modified: datetime.datetime | None = None):
+        self.object_name = object_name
+        self.size = len(data)
+        self.etag = hashlib.md5(data).hexdigest()
+        self.last_modified = last_modified
+
+
+class FakeResponse(io.BytesIO):
+    """Response body returned by FakeMinio.get_object"""
+
+    def release_conn(self):
+        pass
+
+
+class FakeMinio:
+    """Thread-safe in-memory replacement for minio.Minio"""
+
+    def __init__(self, latency: float = 0.0):
+        self.objects = {}
+        self.modified = {}
+        self.latency = latency
+        self.calls = {}
+        self.bytes_uploaded = 0
+        self._lock = threading.Lock()
+
+    def _record(self, method: str):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            threading.Event().wait(self.latency)
+
+    def fput_object(self, bucket_name, object_name, file_path, **kwargs):
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        return self._put(bucket_name, object_name, data, 'fput_object')
+
+    def put_object(self, bucket_name, object_name, data, length, **kwargs):
+        return self._put(bucket_name, object_name, data.read(length), 'put_object')
+
+    def _put(self, bucket_name, object_name, data: bytes, method: str):
+        self._record(method)
+        modified = datetime.datetime.now(datetime.UTC)
+        with self._lock:
+            self.objects[(bucket_name, object_name)] = data
+            self.modified[(bucket_name, object_name)] = modified
+            self.bytes_uploaded += len(data)
+        return FakeObject(object_name, data, modified)
+
+    def fget_object(self, bucket_name, object_name, file_path, **kwargs):
+        self._record('fget_object')
+        data = self._get(bucket_name, object_name)
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        return FakeObject(object_name, data)
+
+    def get_object(self, bucket_name, object_name, **kwargs):
+        self._record('get_object')
+        return FakeResponse(self._get(bucket_name, object_name))
+
+    def stat_object(self, bucket_name, object_name, **kwargs):
+        self._record('stat_object')
+        return FakeObject(object_name, self._get(bucket_name, object_name), self.modified.get((bucket_name, object_name)))
+
+    def remove_object(self, bucket_name, object_name, **kwargs):
+        self._record('remove_object')
+        with self._lock:
+            self.objects.pop((bucket_name, object_name), None)
+            self.modified.pop((bucket_name, object_name), None)
+
+    def list_objects(self, bucket_name, prefix=None, recursive=False, **kwargs):
+        self._record('list_objects')
+        with self._lock:
+            items = [(name, data, self.modified[(bucket, name)])
+                     for (bucket, name), data in self.objects.items() if bucket == bucket_name]
+        return [FakeObject(name, data, modified) for name, data, modified in sorted(items)
+                if not prefix or name.startswith(prefix)]
+
+    def _get(self, bucket_name, object_name) -> bytes:
+        with self._lock:
+            try:
+                return self.objects[(bucket_name, object_name)]
+            except KeyError:
+                raise FileNotFoundError(f"{bucket_name}/{object_name}") from None
+
+    def reset_stats(self):
+        self.calls = {}
+        self.bytes_uploaded = 0
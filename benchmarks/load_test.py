@@ -0,0 +1,294 @@
+"""
+Load Test - Concurrent user sessions driving the real pages through Streamlit's AppTest
+
+Each simulated session is a worker process that logs in, imports a statement, categorizes a
+transaction and filters the home page, all through the page code, against one shared temp SQLite
+file and one fake MinIO store served by the parent process. Sessions run in separate processes
+because AppTest swaps process-global Streamlit runtime state for the length of every script run.
+Runs fully offline; set STORAGE_MODE=sharded or PARTITION_HOT_YEARS before running to load test
+those layouts.
+
+Usage:
+    python -m benchmarks.load_test --sessions 8 --iterations 5 --output load.json
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+
+from benchmarks.environment import bootstrap
+from benchmarks.run_benchmarks import git_commit
+from benchmarks.synthetic import DEFAULT_MAPPINGS, generate_upload
+
+FLOWS = ['login', 'import', 'categorize', 'filter']
+LOAD_ACCOUNT = 'Visa'
+LOAD_PASSWORD = 'load-test-password'
+SEED_CATEGORIES = ['Groceries', 'Dining', 'Transport', 'Shopping']
+LOCK_MARKERS = ('database is locked', 'database table is locked', 'database is busy')
+
+
+class MinioManager(BaseManager):
+    """Serves the parent's FakeMinio to the session processes over a local socket"""
+
+
+def _page_script():
+    # Runs inside AppTest: the page named by session_state['load_page'], as app.py would route it
+    import importlib
+
+    import streamlit as st
+    importlib.import_module(f"pages.{st.session_state['load_page']}_page").main()
+
+
+def _import_script():
+    # Runs inside AppTest: the Input page after a statement whose layout is already known was uploaded
+    import streamlit as st
+
+    from benchmarks.synthetic import generate_upload
+    from pages import input_page
+    from services.input_service import InputService
+    state = st.session_state
+    uploaded = generate_upload(state['load_rows'], seed=state['load_seed'])
+    input_page.parse_upload(InputService.file_hash(uploaded), uploaded, '')
+    detected = InputService.detect_mapping(uploaded)
+    input_page.render_quick_import(detected, uploaded, state['username'])
+
+
+class Session:
+    """One simulated browser session; each flow is a sequence of AppTest script runs"""
+
+    def __init__(self, index: int, timeout: float, rows: int, seed: int):
+        self.index = index
+        self.username = f'load-{index}'
+        self.timeout = timeout
+        self.rows = rows
+        self.seed = seed
+        self.iteration = 0
+
+    def _app(self, page: str | None = None, script=_page_script):
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_function(script, default_timeout=self.timeout)
+        at.session_state['load_page'] = page
+        if page != 'login':
+            at.session_state['username'] = self.username
+        return at
+
+    def login(self):
+        at = self._app('login').run()
+        at.text_input[0].input(self.username)
+        at.text_input[1].input(LOAD_PASSWORD)
+        at.button[0].click().run()
+        return at, 'username' in at.session_state
+
+    def import_statement(self):
+        at = self._app(script=_import_script)
+        at.session_state['load_rows'] = self.rows
+        # A new statement every iteration so the import is never skipped as already seen
+        at.session_state['load_seed'] = self.seed + 1000 * (self.index + 1) + self.iteration
+        at.run()
+        at.button[0].click().run()
+        return at, any('Successfully imported' in s.value for s in at.success)
+
+    def categorize(self):
+        at = self._app('category').run()
+        selects = [s for s in at.selectbox if s.key and s.key.startswith('cat_')]
+        if not selects:
+            # Everything categorized already; loading the page was the whole flow
+            return at, not at.exception
+        select = selects[0]
+        categories = [option for option in select.options if option not in ('', '<New Category>')]
+        select.set_value(categories[self.iteration % len(categories)])
+        at.button(key=f"save_{select.key[len('cat_'):]}").click().run()
+        # A save reruns the page, so the success message is gone; the session counter is not
+        return at, at.session_state['categorized_count'] == 1
+
+    def filter(self):
+        at = self._app('home').run()
+        next(s for s in at.selectbox if s.label == 'Period').set_value('All time').run()
+        accounts = next(m for m in at.multiselect if m.label == 'Account')
+        accounts.set_value([accounts.options[-1]]).run()
+        return at, not at.exception and bool(at.metric)
+
+    def run_flow(self, flow: str) -> dict:
+        steps = {'login': self.login, 'import': self.import_statement,
+                 'categorize': self.categorize, 'filter': self.filter}
+        record = {'session': self.index, 'flow': flow, 'start': time.time(), 'error': None, 'lock_error': False}
+        start = time.perf_counter()
+        try:
+            at, ok = steps[flow]()
+            messages = [str(e.value) for e in at.exception] + [str(e.value) for e in at.error]
+            if messages:
+                record['error'] = messages[0]
+            elif not ok:
+                record['error'] = 'flow did not reach its expected end state'
+        except (RuntimeError, LookupError) as e:
+            # Script run timeouts and missing widgets
+            record['error'] = f'{type(e).__name__}: {e}'
+        record['duration'] = time.perf_counter() - start
+        if record['error']:
+            record['lock_error'] = any(marker in record['error'].lower() for marker in LOCK_MARKERS)
+        return record
+
+
+def session_worker(index: int, args: dict, address: str, authkey: bytes, barrier, results):
+    """Entry point of a session process: connect to the shared store, warm up, then run the flows"""
+    MinioManager.register('minio')
+    manager = MinioManager(address=address, authkey=authkey)
+    manager.connect()
+    from utils import minio_storage
+    minio_storage.client = manager.minio()
+
+    session = Session(index, args['timeout'], args['rows'], args['seed'])
+    # Untimed first run pays for importing Streamlit and the pages
+    session._app('login').run()
+    records = []
+    barrier.wait()
+    try:
+        for iteration in range(args['iterations']):
+            session.iteration = iteration
+            for flow in args['flows']:
+                records.append(session.run_flow(flow))
+        minio_storage.wait_for_uploads()
+    finally:
+        results.put(records)
+
+
+def seed_users(sessions: int, rows: int, seed: int):
+    """One user per session with one imported statement and a few categories to choose from"""
+    from services.category_service import CategoryService
+    from services.input_service import InputService
+    from utils.auth import hash_password
+    from utils.minio_storage import wait_for_uploads
+    from utils.sqlite_storage import create_user, engine
+
+    for index in range(sessions):
+        username = f'load-{index}'
+        create_user(username, hash_password(LOAD_PASSWORD), f'{username}@example.com', None)
+        InputService.save_mappings_and_import(LOAD_ACCOUNT, DEFAULT_MAPPINGS, generate_upload(rows, seed=seed + index), username)
+    unmapped = CategoryService.get_unmapped_transactions('load-0')
+    for category, (_, row) in zip(SEED_CATEGORIES, unmapped.iterrows()):
+        CategoryService.save_transaction_category(row['original_category'], row['merchant_name'], row['description'], category, 'load-0')
+    wait_for_uploads()
+    # Session processes open their own connections
+    engine.dispose()
+
+
+def percentiles(durations: list) -> dict:
+    if not durations:
+        return {}
+    p50, p90, p95, p99 = np.percentile(durations, [50, 90, 95, 99])
+    return {'p50': p50, 'p90': p90, 'p95': p95, 'p99': p99, 'max': max(durations), 'mean': float(np.mean(durations))}
+
+
+def summarize(records: list, wall_time: float) -> dict:
+    flows = []
+    for flow in dict.fromkeys(r['flow'] for r in records):
+        subset = [r for r in records if r['flow'] == flow]
+        flows.append({
+            'flow': flow,
+            'count': len(subset),
+            'errors': sum(1 for r in subset if r['error']),
+            'lock_errors': sum(1 for r in subset if r['lock_error']),
+            'latency_s': percentiles([r['duration'] for r in subset]),
+        })
+    completed = sum(1 for r in records if not r['error'])
+    return {
+        'flows': flows,
+        'totals': {
+            'flows': len(records),
+            'completed': completed,
+            'errors': len(records) - completed,
+            'lock_errors': sum(1 for r in records if r['lock_error']),
+            'wall_time_s': wall_time,
+            'throughput_flows_per_s': completed / wall_time if wall_time else 0.0,
+            'latency_s': percentiles([r['duration'] for r in records]),
+        },
+        # First few distinct failures, enough to tell lock waits from timeouts and page errors
+        'error_samples': list(dict.fromkeys(f"{r['flow']}: {r['error']}" for r in records if r['error']))[:10],
+    }
+
+
+def run(sessions: int, iterations: int, flows: list, rows: int, seed: int, timeout: float, latency: float = 0.0) -> dict:
+    work_dir = tempfile.mkdtemp(prefix='peng-finance-load-')
+    os.environ.setdefault('LOG_LEVEL', 'CRITICAL')  # pages log every lock error they show
+    fake_minio = bootstrap(work_dir, latency=latency)
+    print(f"Seeding {sessions} users in {work_dir} ...", file=sys.stderr, flush=True)
+    seed_users(sessions, rows, seed)
+    fake_minio.reset_stats()
+
+    authkey = os.urandom(16)
+    MinioManager.register('minio', callable=lambda: fake_minio)
+    server = MinioManager(address=os.path.join(work_dir, 'minio.sock'), authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(sessions + 1)
+    results = context.Queue()
+    args = {'iterations': iterations, 'flows': flows, 'rows': rows, 'seed': seed, 'timeout': timeout}
+    workers = [
+        context.Process(target=session_worker, args=(i, args, server.address, authkey, barrier, results))
+        for i in range(sessions)
+    ]
+    for worker in workers:
+        worker.start()
+    print(f"Waiting for {sessions} sessions to warm up ...", file=sys.stderr, flush=True)
+    barrier.wait(timeout=300)
+    start = time.time()
+    records = []
+    for _ in workers:
+        records.extend(results.get())
+    wall_time = time.time() - start
+    for worker in workers:
+        worker.join()
+
+    return {
+        'meta': {
+            'git_commit': git_commit(),
+            'timestamp': datetime.datetime.now(datetime.UTC).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sessions': sessions,
+            'iterations': iterations,
+            'flows': flows,
+            'rows': rows,
+            'seed': seed,
+            'minio_latency_s': latency,
+            'storage_mode': os.environ.get('STORAGE_MODE', 'shared'),
+        },
+        **summarize(records, wall_time),
+        'minio_calls': dict(fake_minio.calls),
+        'minio_bytes_uploaded': fake_minio.bytes_uploaded,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test Peng Finance with concurrent AppTest sessions')
+    parser.add_argument('--sessions', type=int, default=4, help='Concurrent sessions, one process each')
+    parser.add_argument('--iterations', type=int, default=3, help='Times each session runs the flows')
+    parser.add_argument('--flows', nargs='+', choices=FLOWS, default=FLOWS, help='Flows to run, in order')
+    parser.add_argument('--rows', type=int, default=200, help='Transactions per imported statement')
+    parser.add_argument('--seed', type=int, default=42, help='Synthetic data seed')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds allowed per script run')
+    parser.add_argument('--minio-latency', type=float, default=0.0, help='Simulated seconds per MinIO call')
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    report = run(args.sessions, args.iterations, args.flows, args.rows, args.seed, args.timeout, latency=args.minio_latency)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
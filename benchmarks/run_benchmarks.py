@@ -0,0 +1,214 @@
+"""
+Benchmark Runner - Timing and memory benchmarks for the import, query and categorize paths
+
+Usage:
+    python -m benchmarks.run_benchmarks --sizes 1000 5000 20000 --output results.json
+"""
+import argparse
+import datetime
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.environment import bootstrap, reset_db
+from benchmarks.synthetic import DEFAULT_MAPPINGS, generate_amounts, generate_upload
+
+DEFAULT_SIZES = [1000, 5000, 20000]
+BENCH_USER = 'bench'
+BENCH_ACCOUNT = 'Visa'
+
+
+class Benchmark:
+    """A named benchmark with an untimed setup and a timed run step"""
+
+    def __init__(self, name: str, run, setup=None, needs_data: bool = True):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda: None)
+        self.needs_data = needs_data
+
+
+def measure(benchmark: Benchmark, repeat: int, fake_minio) -> dict:
+    """Time `repeat` runs, then one more run under tracemalloc for peak memory"""
+    timings = []
+    for _ in range(repeat):
+        args = benchmark.setup()
+        fake_minio.reset_stats()
+        gc.collect()
+        start = time.perf_counter()
+        benchmark.run(args)
+        timings.append(time.perf_counter() - start)
+    calls = dict(fake_minio.calls)
+    bytes_uploaded = fake_minio.bytes_uploaded
+
+    args = benchmark.setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        output = benchmark.run(args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    extra = {}
+    if isinstance(output, pd.DataFrame):
+        # Resident size of the returned frame, including string payloads
+        extra['frame_bytes'] = int(output.memory_usage(deep=True).sum())
+    return {
+        'timings_s': {
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'mean': statistics.fmean(timings),
+            'max': max(timings),
+        },
+        'peak_memory_bytes': peak,
+        'minio_calls': calls,
+        'minio_bytes_uploaded': bytes_uploaded,
+        **extra,
+    }
+
+
+def load_dataset(size: int, seed: int):
+    """Reset the database and import one synthetic statement of `size` rows"""
+    from services.input_service import InputService
+
+    reset_db()
+    upload = generate_upload(size, seed=seed)
+    InputService.save_mappings_and_import(BENCH_ACCOUNT, dict(DEFAULT_MAPPINGS), upload, BENCH_USER)
+
+
+def build_benchmarks(size: int, seed: int) -> list:
+    """Benchmarks for one data size; they run in order and share the loaded dataset"""
+    from services.category_service import CategoryService
+    from services.input_service import InputService
+    from services.transaction_service import TransactionService
+    from utils.amount_parsing import parse_amounts
+    from utils.sqlite_storage import (
+        Detail,
+        get_session,
+        match_transactions,
+        remove_duplicates,
+        save_category_mapping,
+        save_category_mappings,
+    )
+
+    def import_setup():
+        reset_db()
+        return generate_upload(size, seed=seed)
+
+    def import_run(upload):
+        InputService.save_mappings_and_import(BENCH_ACCOUNT, dict(DEFAULT_MAPPINGS), upload, BENCH_USER)
+
+    def filters_setup():
+        df = TransactionService.get_user_transactions(BENCH_USER)
+        options = TransactionService.get_filter_options(df)
+        return (
+            df,
+            options['accounts'],
+            options['post_dates'][: max(1, len(options['post_dates']) // 2)],
+            options['categories'] + [''],
+            options['merchants'][: max(1, len(options['merchants']) // 2)],
+        )
+
+    def categorize_setup():
+        unmapped = CategoryService.get_unmapped_transactions(BENCH_USER)
+        triples = unmapped[['original_category', 'merchant_name', 'description']].drop_duplicates()
+        return [tuple(t) for t in triples.head(25).itertuples(index=False)]
+
+    def categorize_run(triples):
+        for original_category, merchant_name, description in triples:
+            save_category_mapping(original_category, merchant_name, description, f"Bench {original_category}")
+
+    def legacy_frame_run(_):
+        # The previous loader: ORM rows into an all-object frame, kept as the memory baseline
+        session = get_session()
+        try:
+            rows = session.query(Detail).filter(Detail.username == BENCH_USER).all()
+            return pd.DataFrame([{
+                'id': row.id, 'account': row.account, 'post_date': row.post_date, 'category': row.category,
+                'merchant_name': row.merchant_name, 'description': row.description, 'amount': row.amount,
+            } for row in rows])
+        finally:
+            session.close()
+
+    def categorize_batch_run(triples):
+        save_category_mappings([(*triple, f"Batch {triple[0]}") for triple in triples])
+
+    return [
+        Benchmark('save_mappings_and_import', import_run, import_setup),
+        Benchmark('get_user_transactions', lambda _: TransactionService.get_user_transactions(BENCH_USER)),
+        Benchmark('legacy_get_user_transactions', legacy_frame_run),
+        Benchmark('apply_filters', lambda args: TransactionService.apply_filters(*args), filters_setup),
+        Benchmark('save_category_mapping_x25', categorize_run, categorize_setup),
+        Benchmark('save_category_mappings_batch_x25', categorize_batch_run, categorize_setup),
+        Benchmark('suggest_categories', CategoryService.suggest_categories,
+                  lambda: CategoryService.get_unmapped_transactions(BENCH_USER)),
+        Benchmark('remove_duplicates', lambda _: remove_duplicates(BENCH_USER), lambda: load_dataset(size, seed)),
+        Benchmark('match_transactions', lambda _: match_transactions(BENCH_USER), lambda: load_dataset(size, seed)),
+        Benchmark('parse_amounts', parse_amounts, lambda: generate_amounts(size, seed=seed), needs_data=False),
+    ]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run(sizes: list, repeat: int, seed: int, only: list | None = None, latency: float = 0.0) -> dict:
+    fake_minio = bootstrap(latency=latency)
+    results = []
+    for size in sizes:
+        benchmarks = [b for b in build_benchmarks(size, seed) if not only or b.name in only]
+        if any(b.needs_data for b in benchmarks):
+            load_dataset(size, seed)
+        for benchmark in benchmarks:
+            print(f"[{size:>7}] {benchmark.name} ...", file=sys.stderr, flush=True)
+            result = measure(benchmark, repeat, fake_minio)
+            results.append({'benchmark': benchmark.name, 'size': size, **result})
+    return {
+        'meta': {
+            'git_commit': git_commit(),
+            'timestamp': datetime.datetime.now(datetime.UTC).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sizes': sizes,
+            'repeat': repeat,
+            'seed': seed,
+            'minio_latency_s': latency,
+        },
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run Peng Finance benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Transaction counts to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per benchmark')
+    parser.add_argument('--seed', type=int, default=42, help='Synthetic data seed')
+    parser.add_argument('--only', nargs='+', help='Run only the named benchmarks')
+    parser.add_argument('--minio-latency', type=float, default=0.0, help='Simulated seconds per MinIO call')
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.repeat, args.seed, only=args.only, latency=args.minio_latency)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,3 +14,30 @@ class Config:
     JWT_SECRET = os.getenv("JWT_SECRET")
     ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
     ENV = os.getenv("ENV", "development")
+    IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", os.cpu_count() or 1))  # process pool size for batch imports
+    IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))  # rows per journaled import commit
+    ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "")  # "duckdb" enables the columnar mirror of Detail
+    ANALYTICS_DB_PATH = os.getenv("ANALYTICS_DB_PATH", "data/analytics.duckdb")
+    ARCHIVE_WORKERS = int(os.getenv("ARCHIVE_WORKERS", "2"))  # background threads archiving raw uploads
+    ARCHIVE_RETRIES = int(os.getenv("ARCHIVE_RETRIES", "3"))  # retries per archive upload after the first attempt
+    ARCHIVE_BACKOFF = float(os.getenv("ARCHIVE_BACKOFF", "0.5"))  # seconds before the first retry, doubled each time
+    OBJECT_STORE = os.getenv("OBJECT_STORE", "minio")  # "local" keeps objects on disk, e.g. for multi-instance testing
+    LOCAL_OBJECT_STORE_PATH = os.getenv("LOCAL_OBJECT_STORE_PATH", "data/object-store")
+    DB_ROLE = os.getenv("DB_ROLE", "standalone")  # standalone | writer | follower
+    INSTANCE_ID = os.getenv("INSTANCE_ID", "")  # defaults to hostname-pid
+    WRITER_LEASE_TTL = float(os.getenv("WRITER_LEASE_TTL", "60"))  # seconds a writer lease stays valid without renewal
+    REPLICA_POLL_INTERVAL = float(os.getenv("REPLICA_POLL_INTERVAL", "15"))  # seconds between follower ETag checks
+    MATCH_WINDOW_DAYS = int(os.getenv("MATCH_WINDOW_DAYS", "3"))  # max days between the two sides of a transfer
+    STORAGE_MODE = os.getenv("STORAGE_MODE", "shared")  # "sharded" keeps each user's transactions in their own SQLite file
+    SHARD_DIR = os.getenv("SHARD_DIR", "data/shards")
+    SHARD_CACHE_SIZE = int(os.getenv("SHARD_CACHE_SIZE", "16"))  # user shard engines kept open, least recently used first out
+    PARTITION_HOT_YEARS = int(os.getenv("PARTITION_HOT_YEARS", "0"))  # calendar years kept in the hot DB; older ones move to per-year files, 0 disables
+    PARTITION_DIR = os.getenv("PARTITION_DIR", "data/partitions")
+    SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "3600"))  # min seconds between automatic snapshots before dedupe and recategorization, 0 disables
+    SNAPSHOT_CHUNK_SIZE = int(os.getenv("SNAPSHOT_CHUNK_SIZE", "1048576"))  # bytes per snapshot chunk; a multiple of the 4 KiB page size keeps page edits in one chunk
+    SNAPSHOT_KEEP_LAST = int(os.getenv("SNAPSHOT_KEEP_LAST", "5"))  # newest snapshots always kept, e.g. the one taken before a restore
+    SNAPSHOT_KEEP_HOURLY = int(os.getenv("SNAPSHOT_KEEP_HOURLY", "24"))  # newest snapshot of each of this many recent hours is kept
+    SNAPSHOT_KEEP_DAILY = int(os.getenv("SNAPSHOT_KEEP_DAILY", "7"))
+    SNAPSHOT_KEEP_WEEKLY = int(os.getenv("SNAPSHOT_KEEP_WEEKLY", "4"))
+    SNAPSHOT_GC_GRACE = float(os.getenv("SNAPSHOT_GC_GRACE", "3600"))  # seconds an unreferenced chunk is kept, covering snapshots still uploading elsewhere
+    ASYNC_IO_WORKERS = int(os.getenv("ASYNC_IO_WORKERS", "8"))  # threads running blocking storage calls for async callers
@@ -0,0 +1,65 @@
+"""
+Budget Page - Frontend UI for setting monthly category budgets and tracking spend against them
+"""
+import streamlit as st
+from sqlalchemy.exc import SQLAlchemyError
+
+from services.budget_service import BudgetService
+from services.category_service import CategoryService
+from services.navigation_service import NavigationService
+from utils.output_log import logger
+
+
+def main():
+    # Check authentication
+    if NavigationService.redirect_to_login_if_not_authenticated():
+        st.warning('Please login first.')
+        return
+
+    username = st.session_state['username']
+
+    st.header('Budgets')
+
+    month = BudgetService.current_month()
+    status = BudgetService.get_budget_status(username, month)
+
+    st.subheader(f'Spending this month ({month})')
+    if status.empty:
+        st.info('No budgets yet. Add one below.')
+    else:
+        st.dataframe(
+            status, use_container_width=True, hide_index=True,
+            column_config={
+                'used_pct': st.column_config.ProgressColumn('used', format='%.0f%%', min_value=0, max_value=100),
+            }
+        )
+
+    # Add or update a budget
+    st.subheader('Set a Budget')
+    categories = CategoryService.get_existing_categories()
+    with st.form('budget_form'):
+        category = st.selectbox('Category', categories) if categories else st.text_input('Category')
+        limit = st.number_input('Monthly limit', min_value=0.0, step=50.0, format='%.2f')
+        if st.form_submit_button('Save Budget', type='primary'):
+            try:
+                BudgetService.save_budget(username, category, limit)
+                st.success(f'Budget for {category} saved.')
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+            except (SQLAlchemyError, RuntimeError) as e:
+                st.error(f'Error saving budget: {e}')
+                logger.error(f"Error saving budget: {e}")
+
+    # Remove a budget
+    if not status.empty:
+        st.subheader('Remove a Budget')
+        category = st.selectbox('Budget', status['category'].tolist(), key='delete_budget_category')
+        if st.button('Delete Budget'):
+            BudgetService.delete_budget(username, category)
+            st.success(f'Budget for {category} deleted.')
+            st.rerun()
+
+
+if __name__ == '__main__':
+    main()
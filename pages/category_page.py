@@ -2,10 +2,14 @@
 Category Page - Frontend UI for categorizing transactions
 """
 import streamlit as st
-from services.category_service import CategoryService
+from sqlalchemy.exc import SQLAlchemyError
+from services.category_service import CategoryService, AUTO_APPLY_THRESHOLD
 from services.navigation_service import NavigationService
 from utils.output_log import logger
 
+# Failures saving categories can run into: bad input, partition files, read-only replicas and the database
+_SAVE_ERRORS = (ValueError, OSError, RuntimeError, SQLAlchemyError)
+
 
 def main():
     # Check authentication
@@ -30,101 +34,134 @@ def main():
     # Get existing categories
     categories = CategoryService.get_existing_categories()
 
+    # Ranked suggestions per unmapped (original category, merchant, description) group
+    suggestions = CategoryService.suggest_categories(df)
+    df = df.merge(suggestions, on=['original_category', 'merchant_name', 'description'], how='left')
+    suggested = sorted(set(suggestions['suggested_category']) - set(categories) - {''})
+    categories = sorted(categories + suggested)
+
+    if (suggestions['suggested_category'] != '').any():
+        with st.expander('Auto-apply suggestions'):
+            render_auto_apply(username, suggestions)
+
     # Progress tracking
     if 'categorized_count' not in st.session_state:
         st.session_state['categorized_count'] = 0
-
-    progress_bar = st.progress(0)
-    progress_text = st.empty()
+    st.progress(min(st.session_state['categorized_count'] / (st.session_state['categorized_count'] + len(df)), 1.0))
+    st.text(f"Progress: {st.session_state['categorized_count']} categorized this session, {len(df)} to go")
 
     # Category assignment interface
     st.subheader('Assign Categories')
-    
-    for idx, row in df.iterrows():
+
+    for _, row in df.iterrows():
         with st.container():
             st.divider()
-            
-            # Transaction details
-            col1, col2 = st.columns([2, 1])
-            
-            with col1:
-                st.write(f"**Transaction ID:** {row['id']}")
-                st.write(f"**Original Category:** {row['original_category']}")
-                st.write(f"**Merchant:** {row['merchant_name']}")
-                st.write(f"**Description:** {row['description']}")
-            
-            with col2:
-                # Category selection
-                options = [''] + categories + ['<New Category>']
-                choice = st.selectbox(
-                    'Select Category', 
-                    options, 
-                    key=f"cat_{row['id']}",
-                    help="Choose an existing category or create a new one"
-                )
-                
-                if choice == '<New Category>':
-                    choice = st.text_input(
-                        'Enter new category', 
-                        key=f"new_cat_{row['id']}",
-                        help="This will create a new category"
-                    )
-                
-                # Save button
-                if st.button('Save Category', key=f"save_{row['id']}", type='primary'):
-                    if choice and choice != '':
-                        try:
-                            CategoryService.save_transaction_category(
-                                row['original_category'],
-                                row['merchant_name'],
-                                row['description'],
-                                choice
-                            )
-                            st.success(f'Category "{choice}" saved successfully!')
-                            st.session_state['categorized_count'] += 1
-                            
-                            # Update progress
-                            progress = st.session_state['categorized_count'] / len(df)
-                            progress_bar.progress(min(progress, 1.0))
-                            progress_text.text(f'Progress: {st.session_state["categorized_count"]}/{len(df)} transactions categorized')
-                            
-                            # Refresh page after a short delay
-                            st.rerun()
-                            
-                        except Exception as e:
-                            st.error(f'Error saving category: {str(e)}')
-                            logger.error(f"Category save error: {str(e)}")
-                    else:
-                        st.warning('Please select or enter a category.')
+            render_transaction(row, categories)
 
     # Bulk operations section
     if len(df) > 1:
         st.subheader('Bulk Operations')
         with st.expander('Apply category to multiple transactions'):
-            bulk_category = st.selectbox('Select category for bulk assignment', [''] + categories + ['<New Category>'], key='bulk_category')
-            if bulk_category == '<New Category>':
-                bulk_category = st.text_input('Enter new category for bulk assignment', key='bulk_new_category')
-            
-            selected_transactions = st.multiselect(
-                'Select transactions',
-                options=df['id'].tolist(),
-                format_func=lambda x: f"ID {x}: {df[df['id']==x]['merchant_name'].iloc[0]}"
+            render_bulk_assignment(df, categories)
+
+
+# Each fragment below reruns on its own when its widgets change; only a save reruns the page and
+# reloads the unmapped transactions and suggestions
+@st.fragment
+def render_auto_apply(username: str, suggestions):
+    threshold = st.slider('Minimum confidence', 0.5, 1.0, AUTO_APPLY_THRESHOLD, 0.01)
+    confident = (suggestions['suggested_category'] != '') & (suggestions['confidence'] >= threshold)
+    st.write(f'{confident.sum()} of {len(suggestions)} groups are suggested at or above this confidence.')
+    if st.button('Apply Suggestions', disabled=not confident.any()):
+        try:
+            updated = CategoryService.auto_apply_suggestions(username, threshold)
+            st.success(f'Categorized {updated} transactions from suggestions.')
+            st.rerun()
+        except _SAVE_ERRORS as e:
+            st.error(f'Error applying suggestions: {e}')
+            logger.error(f"Suggestion auto-apply error: {e}")
+
+
+@st.fragment
+def render_transaction(row, categories: list):
+    """Details, category choice and save button for one unmapped transaction"""
+    # Transaction details
+    col1, col2 = st.columns([2, 1])
+
+    with col1:
+        st.write(f"**Transaction ID:** {row['id']}")
+        st.write(f"**Original Category:** {row['original_category']}")
+        st.write(f"**Merchant:** {row['merchant_name']}")
+        st.write(f"**Description:** {row['description']}")
+
+    with col2:
+        # Category selection
+        options = [''] + categories + ['<New Category>']
+        suggestion = row['suggested_category']
+        choice = st.selectbox(
+            'Select Category',
+            options,
+            index=options.index(suggestion) if suggestion else 0,
+            key=f"cat_{row['id']}",
+            help="Choose an existing category or create a new one"
+        )
+        if suggestion:
+            alternatives = ', '.join(row['alternatives'])
+            st.caption(f"Suggested {suggestion} ({row['confidence']:.0%})"
+                       + (f"; also {alternatives}" if alternatives else ''))
+
+        if choice == '<New Category>':
+            choice = st.text_input(
+                'Enter new category',
+                key=f"new_cat_{row['id']}",
+                help="This will create a new category"
             )
-            
-            if st.button('Apply to Selected', key='bulk_save') and bulk_category and selected_transactions:
+
+        # Save button
+        if st.button('Save Category', key=f"save_{row['id']}", type='primary'):
+            if choice and choice != '':
                 try:
-                    for transaction_id in selected_transactions:
-                        row = df[df['id'] == transaction_id].iloc[0]
-                        CategoryService.save_transaction_category(
-                            row['original_category'],
-                            row['merchant_name'],
-                            row['description'],
-                            bulk_category
-                        )
-                    st.success(f'Applied category "{bulk_category}" to {len(selected_transactions)} transactions!')
+                    CategoryService.save_transaction_category(
+                        row['original_category'],
+                        row['merchant_name'],
+                        row['description'],
+                        choice,
+                        st.session_state['username']
+                    )
+                    st.success(f'Category "{choice}" saved successfully!')
+                    st.session_state['categorized_count'] += 1
+                    # The mapping may categorize other listed transactions too, so reload the page
                     st.rerun()
-                except Exception as e:
-                    st.error(f'Error in bulk categorization: {str(e)}')
+
+                except _SAVE_ERRORS as e:
+                    st.error(f'Error saving category: {e}')
+                    logger.error(f"Category save error: {e}")
+            else:
+                st.warning('Please select or enter a category.')
+
+
+@st.fragment
+def render_bulk_assignment(df, categories: list):
+    bulk_category = st.selectbox('Select category for bulk assignment', [''] + categories + ['<New Category>'], key='bulk_category')
+    if bulk_category == '<New Category>':
+        bulk_category = st.text_input('Enter new category for bulk assignment', key='bulk_new_category')
+
+    merchants = dict(zip(df['id'], df['merchant_name']))
+    selected_transactions = st.multiselect(
+        'Select transactions',
+        options=df['id'].tolist(),
+        format_func=lambda x: f"ID {x}: {merchants[x]}"
+    )
+
+    if st.button('Apply to Selected', key='bulk_save') and bulk_category and selected_transactions:
+        try:
+            CategoryService.save_transaction_categories(
+                df[df['id'].isin(selected_transactions)], bulk_category, st.session_state['username']
+            )
+            st.success(f'Applied category "{bulk_category}" to {len(selected_transactions)} transactions!')
+            st.rerun()
+        except _SAVE_ERRORS as e:
+            st.error(f'Error in bulk categorization: {e}')
 
 
 if __name__ == '__main__':
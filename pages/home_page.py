@@ -1,10 +1,17 @@
 """
 Home Page - Frontend UI for displaying transactions with filters
 """
+import pandas as pd
 import streamlit as st
-from services.transaction_service import TransactionService
+
+from services.budget_service import BudgetService
 from services.navigation_service import NavigationService
-from utils.sqlite_storage import remove_duplicates
+from services.recurring_service import RecurringService
+from services.transaction_service import TransactionService
+from utils.sqlite_storage import clear_matches, match_transactions, remove_duplicates
+
+# Months of history loaded per period; older years stay in their archive files unless asked for
+PERIODS = {'Last 12 months': 12, 'Last 3 years': 36, 'All time': None}
 
 
 def main():
@@ -15,8 +22,18 @@ def main():
     # After authentication check
     username = st.session_state['username']
     
+    # Budgets over or close to their limit this month
+    for alert in BudgetService.get_alerts(username):
+        st.warning(alert)
+
+    # Full history as before; only users with archived years start on the recent months
+    default_period = 'Last 12 months' if TransactionService.has_archived_years(username) else 'All time'
+    period = st.sidebar.selectbox('Period', list(PERIODS), index=list(PERIODS).index(default_period))
+    months = PERIODS[period]
+    start_date = pd.Timestamp.today().normalize().replace(day=1) - pd.DateOffset(months=months - 1) if months else None
+
     # Get transactions using service
-    df = TransactionService.get_user_transactions(username)
+    df = TransactionService.get_user_transactions(username, start_date=start_date)
     
     if df.empty:
         st.info('No transactions found.')
@@ -35,7 +52,7 @@ def main():
     
     # Post Date filter with "All" option
     date_options = ['All'] + filter_options['post_dates']
-    selected_dates_raw = st.sidebar.multiselect('Post Date', date_options, default=['All'])
+    selected_dates_raw = st.sidebar.multiselect('Post Date', date_options, default=['All'], format_func=format_date_option)
     selected_dates = filter_options['post_dates'] + [""] if 'All' in selected_dates_raw else selected_dates_raw
     
     # Category filter with "All" option
@@ -54,23 +71,87 @@ def main():
     # Display summary
     st.subheader('Transaction Summary')
     total_transactions = len(filtered_df)
-    total_amount = filtered_df['amount'].sum()
+    # Matched transfers and near-duplicates would be counted twice
+    total_amount = filtered_df.loc[filtered_df['match_type'] == '', 'amount_cents'].sum() / 100
     st.metric("Total Transactions", total_transactions)
     st.metric("Total Amount", f"${total_amount:,.2f}")
 
+    # Spending breakdown over the full history
+    if st.toggle('Show spending breakdown'):
+        group_by = st.selectbox('Group by', ['category', 'month', 'year', 'account', 'canonical_merchant'], key='breakdown_group_by')
+        breakdown = TransactionService.aggregate_transactions(
+            username, [group_by], accounts=None if 'All' in selected_accounts_raw else selected_accounts_raw
+        )
+        st.bar_chart(breakdown, x=group_by, y='total_amount')
+
+    # Subscriptions and other regular charges, from precomputed per-merchant statistics
+    with st.expander('Recurring charges'):
+        recurring = RecurringService.get_recurring(username)
+        if recurring.empty:
+            st.info('No recurring charges detected yet.')
+        else:
+            st.dataframe(recurring, use_container_width=True, hide_index=True)
+
+    # Full-text search within the sidebar account/category filters
+    query = st.text_input('Search transactions', placeholder='Merchant or description, e.g. "tim hortons"')
+    if query:
+        render_search_results(username, query, {
+            'accounts': None if 'All' in selected_accounts_raw else selected_accounts_raw,
+            'categories': None if 'All' in selected_categories_raw else selected_categories_raw,
+        })
+        return
+
     # Display transactions
     st.subheader('Transactions')
     if not filtered_df.empty:
         # Remove ID column and display without row numbers
-        display_df = filtered_df.drop(columns=['id'], errors='ignore')
-        st.dataframe(display_df, use_container_width=True, hide_index=True)
+        display_df = filtered_df.drop(columns=['id', 'amount_cents'], errors='ignore')
+        st.dataframe(display_df, use_container_width=True, hide_index=True,
+                     column_config={'post_date': st.column_config.DateColumn('post_date', format='YYYY-MM-DD')})
 
         if st.button('Remove Duplication'):
             remove_duplicates(username)
             st.success('Duplicates removed successfully!')
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button('Match Transfers & Near-Duplicates'):
+                matched = match_transactions(username)
+                st.success(f'{matched} transactions matched and excluded from totals.')
+        with col2:
+            if st.button('Clear Matches'):
+                clear_matches(username)
+                st.success('Matches cleared.')
     else:
         st.info('No transactions match the selected filters.')
 
 
+def format_date_option(option) -> str:
+    if isinstance(option, str):
+        return option
+    return '(no date)' if pd.isna(option) else option.strftime('%Y-%m-%d')
+
+
+def render_search_results(username: str, query: str, filters: dict):
+    """Ranked, paged search results"""
+    page_size = 50
+    page = st.session_state.get('search_page', 1)
+    result = TransactionService.search(username, query, filters, page=page, page_size=page_size)
+
+    pages = max(1, -(-result['total'] // page_size))
+    if page > pages:
+        # The query changed and the old page no longer exists
+        st.session_state['search_page'] = 1
+        st.rerun()
+
+    st.subheader(f"Search Results ({result['total']})")
+    if result['results'].empty:
+        st.info('No transactions match your search.')
+        return
+    st.dataframe(result['results'].drop(columns=['id']), use_container_width=True, hide_index=True)
+
+    if pages > 1:
+        st.number_input(f'Page (of {pages})', min_value=1, max_value=pages, key='search_page')
+
 if __name__ == '__main__':
     main()
@@ -2,10 +2,14 @@
 Input Page - Frontend UI for uploading and mapping transaction data
 """
 import streamlit as st
+from sqlalchemy.exc import SQLAlchemyError
 from services.input_service import InputService
 from services.navigation_service import NavigationService
 from utils.output_log import logger
 
+# Failures an import can run into: unreadable files or mappings, storage and database errors
+_IMPORT_ERRORS = (ValueError, KeyError, OSError, RuntimeError, SQLAlchemyError)
+
 
 def main():
     # Check authentication
@@ -17,6 +21,12 @@ def main():
     
     st.header('Import Transactions')
 
+    mode = st.radio('Import Mode', ['Single File', 'Batch'], horizontal=True,
+                    help='Batch mode imports many statements at once using each account\'s saved mapping')
+    if mode == 'Batch':
+        render_batch_import(username)
+        return
+
     # Account selection
     accounts = InputService.get_accounts()
     account = st.selectbox('Select Account', ['New Account'] + accounts)
@@ -24,149 +34,262 @@ def main():
         account = st.text_input('Enter new account name')
 
     # File upload
-    uploaded = st.file_uploader('Upload CSV', type=['csv'])
+    uploaded = st.file_uploader('Upload Statement', type=InputService.get_supported_types(),
+                                help='CSV, OFX/QFX or Excel (.xlsx) export from your bank')
     if uploaded:
         try:
-            df = InputService.process_csv_upload(uploaded, account)
+            df = parse_upload(InputService.file_hash(uploaded), uploaded, account)
             
             st.success(f'File uploaded successfully! Found {len(df)} transactions.')
             st.write('Preview of uploaded data:')
             st.dataframe(df.head(), use_container_width=True)
+
+            # Known file layout: import directly with the saved mapping
+            detected = InputService.detect_mapping(uploaded)
+            if detected and account in ('', detected['account']):
+                st.success(f"Recognized this file layout from account '{detected['account']}'.")
+                if not st.checkbox('Review field mapping', key='review_detected_mapping'):
+                    render_quick_import(detected, uploaded, username)
+                    return
+                account = detected['account']
+
+            saved = InputService.get_saved_mappings(account) or InputService.suggested_mappings(uploaded)
+            render_field_mapping(df.columns.tolist(), saved, account, uploaded, username)
+
+        except _IMPORT_ERRORS as e:
+            st.error(f'Error processing file: {e}')
+            logger.error(f"File processing error: {e}")
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def parse_upload(file_hash: str, _uploaded, _account: str):
+    """Parsed statement keyed by content hash, so reruns never parse the same upload again"""
+    return InputService.process_upload(_uploaded, _account)
+
+
+# Widget changes inside a fragment rerun only the fragment, not the upload parsing and lookups above
+@st.fragment
+def render_quick_import(detected: dict, uploaded, username: str):
+    """Import button for a file whose layout matched a saved mapping"""
+    if st.button('Import', type='primary'):
+        try:
+            with st.spinner('Processing and importing transactions...'):
+                result = InputService.quick_import(detected, uploaded, username)
+            show_import_result(result)
+        except _IMPORT_ERRORS as e:
+            st.error(f'Error importing transactions: {e}')
+            logger.error(f"Import error for user {username}: {e}")
+
+
+@st.fragment
+def render_field_mapping(csv_columns: list, saved: dict, account: str, uploaded, username: str):
+    """Field mapping widgets for the uploaded file's columns, prefilled from the account's saved or the format's suggested mapping"""
+    st.subheader('Field Mapping')
+    st.write('Required fields: date, post_date, original_category, merchant_name, description, amount')
+    
+    mappings = {}
+    
+    required_fields = ['account_type', 'date', 'post_date', 'original_category', 'merchant_name', 'description', 'currency', 'amount']
+    
+    # Create mapping interface
+    col1, col2 = st.columns(2)
+    
+    for i, field in enumerate(required_fields):
+        saved_value = saved.get(field, '')
+        
+        # Parse saved value to handle multiple selections or manual input
+        if saved_value and saved_value not in ['USD', 'CAD'] and saved_value != '<manual>':
+            if ';' in saved_value:
+                # Multiple columns were previously selected
+                default_columns = [col for col in saved_value.split(';') if col in csv_columns]
+                default_manual = '' if default_columns else saved_value
+            else:
+                # Single column or manual value
+                default_columns = [saved_value] if saved_value in csv_columns else []
+                default_manual = saved_value if saved_value not in csv_columns else ''
+        elif saved_value in ['USD', 'CAD']:
+            default_columns = []
+            default_manual = saved_value
+        else:
+            default_columns = []
+            default_manual = ''
+        
+        with col1 if i % 2 == 0 else col2:
+            if field == 'account_type':
+                # Account type selection
+                account_type = st.selectbox(
+                    'Select Account Type',
+                    ['debit', 'credit'],
+                    index=0 if saved_value == 'debit' else 1,
+                    key=f"account_type_{field}",
+                    help="Select the type of account for this mapping"
+                )
+                mappings[field] = account_type
+                continue
+            # Multi-select for CSV columns
+            selected_columns = st.multiselect(
+                f'Select column(s) for {field}',
+                csv_columns,
+                default=default_columns,
+                key=f"multiselect_{field}",
+                help=f"Select one or more columns for {field}. Multiple columns will be joined with ';'"
+            )
             
-            # Field mapping section
-            st.subheader('Field Mapping')
-            st.write('Required fields: date, post_date, original_category, merchant_name, description, amount')
-            
-            mappings = {}
-            saved = InputService.get_saved_mappings(account)
-            
-            required_fields = ['account_type', 'date', 'post_date', 'original_category', 'merchant_name', 'description', 'currency', 'amount']
-            
-            # Create mapping interface
-            col1, col2 = st.columns(2)
-            
-            for i, field in enumerate(required_fields):
-                csv_columns = df.columns.tolist()
-                saved_value = saved.get(field, '')
+            # Manual input option
+            use_manual = False  # Initialize for non-currency fields
+            if field == 'currency':
+                manual_options = ['', 'USD', 'CAD', '<manual>']
+                # Determine default selection for currency
+                if default_manual in ['USD', 'CAD', '']:
+                    manual_default = default_manual
+                else:
+                    manual_default = '<manual>'
                 
-                # Parse saved value to handle multiple selections or manual input
-                if saved_value and saved_value not in ['USD', 'CAD'] and saved_value != '<manual>':
-                    if ';' in saved_value:
-                        # Multiple columns were previously selected
-                        default_columns = [col for col in saved_value.split(';') if col in csv_columns]
-                        default_manual = '' if default_columns else saved_value
-                    else:
-                        # Single column or manual value
-                        default_columns = [saved_value] if saved_value in csv_columns else []
-                        default_manual = saved_value if saved_value not in csv_columns else ''
-                elif saved_value in ['USD', 'CAD']:
-                    default_columns = []
-                    default_manual = saved_value
+                manual_selection = st.selectbox(
+                    f'Or use fixed value for {field}',
+                    manual_options,
+                    index=manual_options.index(manual_default) if manual_default in manual_options else 0,
+                    key=f"manual_select_{field}",
+                    help="Use a fixed value for all transactions"
+                )
+                
+                if manual_selection == '<manual>':
+                    manual_value = st.text_input(
+                        f'Enter custom value for {field}',
+                        value=default_manual if default_manual not in ['USD', 'CAD', ''] else '',
+                        key=f"manual_input_{field}"
+                    )
                 else:
-                    default_columns = []
-                    default_manual = ''
+                    manual_value = manual_selection
+            else:
+                # For other fields, show manual input option
+                use_manual = st.checkbox(
+                    f'Use fixed value for {field}',
+                    value=bool(default_manual and not selected_columns),
+                    key=f"use_manual_{field}",
+                    help="Check to enter a fixed value for all transactions"
+                )
                 
-                with col1 if i % 2 == 0 else col2:
-                    if field == 'account_type':
-                        # Account type selection
-                        account_type = st.selectbox(
-                            'Select Account Type',
-                            ['debit', 'credit'],
-                            index=0 if saved_value == 'debit' else 1,
-                            key=f"account_type_{field}",
-                            help="Select the type of account for this mapping"
-                        )
-                        mappings[field] = account_type
-                        continue
-                    # Multi-select for CSV columns
-                    selected_columns = st.multiselect(
-                        f'Select column(s) for {field}',
-                        csv_columns,
-                        default=default_columns,
-                        key=f"multiselect_{field}",
-                        help=f"Select one or more columns for {field}. Multiple columns will be joined with ';'"
+                if use_manual:
+                    manual_value = st.text_input(
+                        f'Enter fixed value for {field}',
+                        value=default_manual,
+                        key=f"manual_{field}",
+                        help="This value will be used for all transactions"
                     )
-                    
-                    # Manual input option
-                    use_manual = False  # Initialize for non-currency fields
-                    if field == 'currency':
-                        manual_options = ['', 'USD', 'CAD', '<manual>']
-                        # Determine default selection for currency
-                        if default_manual in ['USD', 'CAD', '']:
-                            manual_default = default_manual
-                        else:
-                            manual_default = '<manual>'
-                        
-                        manual_selection = st.selectbox(
-                            f'Or use fixed value for {field}',
-                            manual_options,
-                            index=manual_options.index(manual_default) if manual_default in manual_options else 0,
-                            key=f"manual_select_{field}",
-                            help="Use a fixed value for all transactions"
-                        )
-                        
-                        if manual_selection == '<manual>':
-                            manual_value = st.text_input(
-                                f'Enter custom value for {field}',
-                                value=default_manual if default_manual not in ['USD', 'CAD', ''] else '',
-                                key=f"manual_input_{field}"
-                            )
-                        else:
-                            manual_value = manual_selection
-                    else:
-                        # For other fields, show manual input option
-                        use_manual = st.checkbox(
-                            f'Use fixed value for {field}',
-                            value=bool(default_manual and not selected_columns),
-                            key=f"use_manual_{field}",
-                            help="Check to enter a fixed value for all transactions"
-                        )
-                        
-                        if use_manual:
-                            manual_value = st.text_input(
-                                f'Enter fixed value for {field}',
-                                value=default_manual,
-                                key=f"manual_{field}",
-                                help="This value will be used for all transactions"
-                            )
-                        else:
-                            manual_value = ''
-                    
-                    # Determine final mapping value
-                    if selected_columns:
-                        mappings[field] = ';'.join(selected_columns)
-                    elif field == 'currency' and manual_value:
-                        mappings[field] = manual_value
-                    elif field != 'currency' and use_manual and manual_value:
-                        mappings[field] = manual_value
-                    else:
-                        mappings[field] = ''
-
-            # Import button
-            if st.button('Save Mapping & Import', type='primary'):
-                if not account:
-                    st.error('Please select or enter an account name.')
-                elif not all(mappings.values()):
-                    st.error('Please map all required fields.')
                 else:
-                    try:
-                        with st.spinner('Processing and importing transactions...'):
-                            count = InputService.save_mappings_and_import(account, mappings, uploaded, username)
-                        
-                        st.success(f'Successfully imported {count} transactions!')
-                        
-                        # Offer to navigate to home page
-                        if st.button('View Transactions'):
-                            st.session_state['page'] = 'home'
-                            st.rerun()
-                            
-                    except Exception as e:
-                        st.error(f'Error importing transactions: {str(e)}')
-                        logger.error(f"Import error for user {username}: {str(e)}")
-
-        except Exception as e:
-            st.error(f'Error processing file: {str(e)}')
-            logger.error(f"File processing error: {str(e)}")
+                    manual_value = ''
+            
+            # Determine final mapping value
+            if selected_columns:
+                mappings[field] = ';'.join(selected_columns)
+            elif field == 'currency' and manual_value:
+                mappings[field] = manual_value
+            elif field != 'currency' and use_manual and manual_value:
+                mappings[field] = manual_value
+            else:
+                mappings[field] = ''
+
+    # Amount format is saved with the mapping
+    amount_formats = InputService.get_amount_formats()
+    format_options = list(amount_formats)
+    saved_format = saved.get('amount_format', format_options[0])
+    mappings['amount_format'] = st.selectbox(
+        'Amount format',
+        format_options,
+        index=format_options.index(saved_format) if saved_format in format_options else 0,
+        format_func=lambda name: amount_formats[name],
+        key='amount_format',
+        help='Parentheses, CR/DR suffixes and currency symbols are handled for every format'
+    )
+
+    # Import button
+    if st.button('Save Mapping & Import', type='primary'):
+        if not account:
+            st.error('Please select or enter an account name.')
+        elif not all(mappings.values()):
+            st.error('Please map all required fields.')
+        else:
+            try:
+                with st.spinner('Processing and importing transactions...'):
+                    result = InputService.save_mappings_and_import(account, mappings, uploaded, username)
+                
+                show_import_result(result)
+                
+                # Offer to navigate to home page
+                if st.button('View Transactions'):
+                    st.session_state['page'] = 'home'
+                    st.rerun()
+                    
+            except _IMPORT_ERRORS as e:
+                st.error(f'Error importing transactions: {e}')
+                logger.error(f"Import error for user {username}: {e}")
+
+
+def show_import_result(result: dict):
+    """Report the outcome of a single-file import"""
+    if result['skipped']:
+        st.info('This file was already imported for this account; nothing was added.')
+        return
+    if result['resumed_from']:
+        st.info(f"Resumed an interrupted import after row {result['resumed_from']}.")
+    st.success(f"Successfully imported {result['imported']} transactions!")
+    if result['rejected']:
+        st.warning(f"Skipped {len(result['rejected'])} rows with an unreadable amount. Check the amount format for this account.")
+        st.dataframe(result['rejected'], use_container_width=True, hide_index=True)
+
+
+def render_batch_import(username: str):
+    """Upload many statements and import each one with its detected account's saved mapping"""
+    uploads = st.file_uploader('Upload statements', type=InputService.get_supported_types(), accept_multiple_files=True)
+    if not uploads:
+        st.info('Only accounts with a saved field mapping can be imported in batch mode.')
+        return
+
+    try:
+        detected = InputService.detect_accounts(uploads)
+    except _IMPORT_ERRORS as e:
+        st.error(f'Error reading files: {e}')
+        logger.error(f"Batch header detection error: {e}")
+        return
+
+    st.subheader('Accounts')
+    options = ['<Skip>'] + InputService.get_accounts()
+    selections = []
+    # A form, so changing the account of one file does not re-read every header
+    with st.form('batch_import_form'):
+        for i, (uploaded, account) in enumerate(zip(uploads, detected)):
+            choice = st.selectbox(
+                uploaded.name,
+                options,
+                index=options.index(account) if account in options else 0,
+                key=f"batch_account_{i}",
+                help='Detected from the column header; change it if the guess is wrong'
+            )
+            if choice != '<Skip>':
+                selections.append({'file': uploaded, 'account': choice})
+        submitted = st.form_submit_button('Import All', type='primary')
+
+    if submitted and not selections:
+        st.warning('Select an account for at least one file.')
+    elif submitted:
+        try:
+            with st.spinner(f'Importing {len(selections)} files...'):
+                result = InputService.batch_import(selections, username)
+            if result['success']:
+                imported_files = [f for f in result['files'] if not f['skipped']]
+                st.success(f"Successfully imported {result['imported']} transactions from {len(imported_files)} files!")
+                rejected = sum(f['rejected'] for f in imported_files)
+                if rejected:
+                    st.warning(f'Skipped {rejected} rows with an unreadable amount.')
+                if len(imported_files) < len(result['files']):
+                    st.info(f"Skipped {len(result['files']) - len(imported_files)} files that were already imported.")
+                st.dataframe(result['files'], use_container_width=True, hide_index=True)
+            else:
+                st.error(result['message'])
+        except _IMPORT_ERRORS as e:
+            st.error(f'Error importing transactions: {e}')
+            logger.error(f"Batch import error for user {username}: {e}")
 
 
 if __name__ == '__main__':
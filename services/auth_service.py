@@ -5,7 +5,8 @@ from utils.auth import (
     verify_password, create_jwt, hash_password, validate_stored_auth, 
     store_auth_credentials, clear_auth_credentials
 )
-from utils.sqlite_storage import get_user, update_user_token, create_user
+from utils.sqlite_storage import get_user, update_user_token, create_user, is_sharded, shard_engine
+from utils import async_storage, replication
 from config.configure import Config
 from utils.output_log import logger
 
@@ -24,11 +25,20 @@ class AuthService:
             return {'success': False, 'message': 'Invalid password.'}
         
         token = create_jwt(username)
-        update_user_token(username, token)
+        # Tokens are validated by signature alone, so read-only followers can log users in without storing it
+        if replication.writes_allowed():
+            update_user_token(username, token)
+        if is_sharded():
+            # Fetch the user's shard now rather than on their first page load
+            shard_engine(username)
         logger.debug(f"User {username} logged in successfully")
         
         return {'success': True, 'username': username, 'token': token}
     
+    @staticmethod
+    async def login_user_async(username: str, password: str) -> dict:
+        return await async_storage.run_sync(AuthService.login_user, username, password)
+
     @staticmethod
     def signup_user(admin_password: str, username: str, password: str, email: str) -> dict:
         """Create new user account"""
@@ -0,0 +1,74 @@
+"""
+Budget Service - Backend logic for monthly category budgets and over-budget alerts
+"""
+import datetime
+
+import pandas as pd
+
+from utils.amount_parsing import to_cents
+from utils.output_log import logger
+from utils.sqlite_storage import (
+    delete_budget,
+    get_budgets,
+    get_category_spend,
+    save_budget,
+)
+
+WARNING_THRESHOLD = 0.8  # share of the limit spent at which a budget is flagged before it is exceeded
+
+
+class BudgetService:
+    """Service class for budget operations"""
+
+    @staticmethod
+    def current_month(today: datetime.date | None = None) -> str:
+        return (today or datetime.date.today()).strftime('%Y-%m')
+
+    @staticmethod
+    def save_budget(username: str, category: str, monthly_limit: float):
+        """Create or update the monthly limit (in dollars) for a category"""
+        if monthly_limit <= 0:
+            raise ValueError('Monthly limit must be positive')
+        limit_cents = int(to_cents(pd.Series([monthly_limit])).iloc[0])
+        save_budget(username, category, limit_cents)
+
+    @staticmethod
+    def delete_budget(username: str, category: str):
+        delete_budget(username, category)
+
+    @staticmethod
+    def get_budget_status(username: str, month: str | None = None) -> pd.DataFrame:
+        """
+        Spend against each budget for a month (default: the current one). Reads the running
+        per-category counters, so the cost does not depend on the size of the transaction history.
+        """
+        month = month or BudgetService.current_month()
+        spend = get_category_spend(username, month)
+        records = []
+        for budget in get_budgets(username):
+            # Counters are net amounts with spending negative; refunds reduce the spend
+            spent_cents = -spend.get(budget.category, (0, 0))[0]
+            used = spent_cents / budget.monthly_limit_cents if budget.monthly_limit_cents else 0.0
+            records.append({
+                'category': budget.category,
+                'budget': budget.monthly_limit_cents / 100,
+                'spent': spent_cents / 100,
+                'remaining': (budget.monthly_limit_cents - spent_cents) / 100,
+                'used_pct': round(used * 100, 1),
+                'status': 'over' if used > 1 else 'warning' if used >= WARNING_THRESHOLD else 'ok',
+            })
+        logger.debug(f"Evaluated {len(records)} budgets for user {username} in {month}")
+        columns = ['category', 'budget', 'spent', 'remaining', 'used_pct', 'status']
+        return pd.DataFrame(records, columns=columns)
+
+    @staticmethod
+    def get_alerts(username: str, month: str | None = None) -> list:
+        """Messages for budgets that are over or close to their limit"""
+        status = BudgetService.get_budget_status(username, month)
+        alerts = []
+        for row in status[status['status'] != 'ok'].itertuples(index=False):
+            if row.status == 'over':
+                alerts.append(f"{row.category}: ${row.spent:,.2f} spent, ${-row.remaining:,.2f} over the ${row.budget:,.2f} budget")
+            else:
+                alerts.append(f"{row.category}: {row.used_pct:.0f}% of the ${row.budget:,.2f} budget used")
+        return alerts
@@ -1,9 +1,25 @@
 """
 Category Service - Backend logic for category operations
 """
+import numpy as np
 import pandas as pd
-from utils.sqlite_storage import get_session, save_category_mapping, get_category_mappings_list, Detail
+
+from utils import async_storage
+from utils.category_features import category_terms
 from utils.output_log import logger
+from utils.sqlite_storage import (
+    Detail,
+    get_category_mappings_list,
+    get_category_model,
+    get_session,
+    save_category_mapping,
+    save_category_mappings,
+)
+
+GROUP_COLUMNS = ['original_category', 'merchant_name', 'description']
+SMOOTHING = 1.0  # Laplace smoothing of the naive Bayes term probabilities
+SCORE_CHUNK = 4096  # groups scored per numpy batch; bounds the (terms x categories) working set
+AUTO_APPLY_THRESHOLD = 0.9
 
 
 class CategoryService:
@@ -12,7 +28,7 @@ class CategoryService:
     @staticmethod
     def get_unmapped_transactions(username: str) -> pd.DataFrame:
         """Get transactions that don't have categories assigned"""
-        session = get_session()
+        session = get_session(username)
         try:
             rows = session.query(
                 Detail.id, Detail.original_category, Detail.merchant_name, Detail.description
@@ -35,7 +51,105 @@ class CategoryService:
     
     @staticmethod
     def save_transaction_category(original_category: str, merchant_name: str, 
-                                description: str, target_category: str):
-        """Save category mapping for a transaction"""
+                                description: str, target_category: str, username: str | None = None):
+        """Save category mapping for a transaction; username's transactions are recategorized right away"""
         logger.debug(f"Saving category mapping: {original_category} -> {target_category}")
-        save_category_mapping(original_category, merchant_name, description, target_category)
+        save_category_mapping(original_category, merchant_name, description, target_category, username)
+
+    @staticmethod
+    def save_transaction_categories(transactions: pd.DataFrame, target_category: str, username: str | None = None) -> int:
+        """Map every distinct (original_category, merchant_name, description) in the frame to one category"""
+        triples = transactions[['original_category', 'merchant_name', 'description']].drop_duplicates()
+        logger.debug(f"Saving {len(triples)} category mappings -> {target_category}")
+        return save_category_mappings([(*triple, target_category) for triple in triples.itertuples(index=False)], username)
+
+    @staticmethod
+    def save_category_mappings(mappings: list, username: str | None = None) -> int:
+        """
+        Save many (original_category, merchant_name, description, target_category) mappings at once.
+        Returns the number of transactions recategorized: everyone's in shared storage, username's
+        when sharded (other users' shards catch up when next opened).
+        """
+        logger.debug(f"Saving {len(mappings)} category mappings")
+        return save_category_mappings([tuple(mapping) for mapping in mappings], username)
+
+    @staticmethod
+    def suggest_categories(transactions: pd.DataFrame, top_k: int = 3) -> pd.DataFrame:
+        """
+        Rank categories for each distinct (original_category, merchant_name, description) group with
+        the naive Bayes model trained from saved mappings. Returns one row per group with
+        suggested_category ('' when the model is empty), confidence (posterior probability) and
+        alternatives (the next best categories).
+        """
+        groups = transactions[GROUP_COLUMNS].drop_duplicates().reset_index(drop=True)
+        classes, terms = get_category_model()
+        if classes.empty or groups.empty:
+            return groups.assign(suggested_category='', confidence=0.0, alternatives=[[] for _ in range(len(groups))])
+
+        categories = classes['category'].tolist()
+        category_index = pd.Index(categories)
+        vocabulary = pd.Index(terms['term'].unique())
+        counts = np.zeros((len(vocabulary), len(categories)))
+        counts[vocabulary.get_indexer(terms['term']), category_index.get_indexer(terms['category'])] = terms['count']
+        log_likelihood = np.log(counts + SMOOTHING) - np.log(
+            classes['terms'].to_numpy() + SMOOTHING * len(vocabulary)
+        )
+        log_prior = np.log(classes['documents'].to_numpy() / classes['documents'].sum())
+        term_ids = {term: i for i, term in enumerate(vocabulary)}
+
+        scores = np.tile(log_prior, (len(groups), 1))
+        for start in range(0, len(groups), SCORE_CHUNK):
+            chunk = groups.iloc[start:start + SCORE_CHUNK]
+            rows, ids = [], []
+            for row, group in enumerate(chunk.itertuples(index=False)):
+                known = [term_ids[term] for term in category_terms(*group) if term in term_ids]
+                rows.extend([row] * len(known))
+                ids.extend(known)
+            if not ids:
+                continue
+            # Sum each group's term log-likelihoods: rows are sorted, so reduceat over run starts
+            rows = np.asarray(rows)
+            starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            scores[start + rows[starts]] += np.add.reduceat(log_likelihood[ids], starts, axis=0)
+
+        probabilities = np.exp(scores - scores.max(axis=1, keepdims=True))
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        ranked = np.argsort(-probabilities, axis=1)[:, :top_k]
+        names = np.asarray(categories, dtype=object)[ranked]
+        logger.debug(f"Scored {len(groups)} transaction groups against {len(categories)} categories")
+        return groups.assign(
+            suggested_category=names[:, 0],
+            confidence=probabilities[np.arange(len(groups)), ranked[:, 0]],
+            alternatives=[list(row[1:]) for row in names],
+        )
+
+    @staticmethod
+    def auto_apply_suggestions(username: str, threshold: float = AUTO_APPLY_THRESHOLD) -> int:
+        """Save the suggested category of every unmapped group at or above the confidence threshold"""
+        suggestions = CategoryService.suggest_categories(CategoryService.get_unmapped_transactions(username))
+        confident = suggestions[(suggestions['suggested_category'] != '') & (suggestions['confidence'] >= threshold)]
+        if confident.empty:
+            return 0
+        logger.debug(f"Auto-applying {len(confident)} category suggestions at threshold {threshold}")
+        return save_category_mappings(
+            list(confident[GROUP_COLUMNS + ['suggested_category']].itertuples(index=False, name=None)), username
+        )
+
+    # Async counterparts for API servers and background workers
+    @staticmethod
+    async def get_unmapped_transactions_async(username: str) -> pd.DataFrame:
+        """Async get_unmapped_transactions, read through aiosqlite"""
+        return await async_storage.read_frame(
+            "SELECT id, original_category, merchant_name, description FROM Detail WHERE username = ? AND category = ''",
+            (username,),
+            {'id': 'int64', 'original_category': 'object', 'merchant_name': 'object', 'description': 'object'},
+            username=username
+        )
+
+    @staticmethod
+    async def get_existing_categories_async() -> list:
+        return await async_storage.run_sync(CategoryService.get_existing_categories)
+
+    @staticmethod
+    async def save_category_mappings_async(mappings: list, username: str | None = None) -> int:
+        return await async_storage.run_sync(CategoryService.save_category_mappings, mappings, username)
@@ -2,13 +2,29 @@
 Input Service - Backend logic for file upload and data import operations
 """
 import pandas as pd
-import tempfile
+import hashlib
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor
+from config.configure import Config
 from utils.sqlite_storage import (
-    get_all_accounts, get_input_mappings, save_input_mappings, save_transactions
+    get_all_accounts, get_input_mappings, save_input_mappings, save_transaction_chunks,
+    get_all_input_mappings, save_transactions_batch, get_account_by_signature, save_mapping_signatures,
+    get_import_state, record_import_archived
 )
-from utils.minio_storage import upload_file
+from utils.minio_storage import submit_upload
+from utils.amount_parsing import parse_amounts, to_cents, AMOUNT_FORMATS, DEFAULT_AMOUNT_FORMAT
 from utils.output_log import logger
+from utils import async_storage, replication, statement_readers
+
+
+def _parse_and_map(payload: tuple) -> tuple:
+    """Parse one statement and apply its field mappings; runs in a worker process"""
+    data, name, mappings, account, username = payload
+    uploaded_file = io.BytesIO(data)
+    uploaded_file.name = name
+    df = statement_readers.read_frame(uploaded_file)
+    return InputService._process_mappings(df, mappings, account, username)
 
 
 class InputService:
@@ -20,12 +36,27 @@ class InputService:
         return get_all_accounts()
     
     @staticmethod
-    def process_csv_upload(uploaded_file, account: str) -> pd.DataFrame:
-        """Process uploaded CSV file and return dataframe"""
-        df = pd.read_csv(uploaded_file)
-        logger.debug(f"CSV uploaded with {len(df)} rows for account: {account}")
+    def get_supported_types() -> list:
+        """File extensions that can be imported"""
+        return statement_readers.supported_types()
+
+    @staticmethod
+    def process_upload(uploaded_file, account: str) -> pd.DataFrame:
+        """Parse an uploaded statement (CSV, OFX/QFX or XLSX) into a dataframe"""
+        df = statement_readers.read_frame(uploaded_file)
+        logger.debug(f"Statement uploaded with {len(df)} rows for account: {account}")
         return df
+
+    @staticmethod
+    def suggested_mappings(uploaded_file) -> dict:
+        """Field mapping to start from for a new account, for statement formats with fixed columns"""
+        return statement_readers.suggested_mappings(uploaded_file)
     
+    @staticmethod
+    def get_amount_formats() -> dict:
+        """Supported amount formats and an example of each"""
+        return {name: fmt['label'] for name, fmt in AMOUNT_FORMATS.items()}
+
     @staticmethod
     def get_saved_mappings(account: str) -> dict:
         """Get saved field mappings for an account"""
@@ -34,80 +65,281 @@ class InputService:
     @staticmethod
     def save_mappings_and_import(account: str, mappings: dict, uploaded_file, username: str):
         """Save field mappings and import transaction data"""
-        # Save mappings
-        save_input_mappings(account, mappings)
-        
-        # Save file to minio
-        temp_file = tempfile.NamedTemporaryFile(delete=False)
-        try:
-            # Reset file pointer to beginning
-            uploaded_file.seek(0)
-            temp_file.write(uploaded_file.getvalue())
-            temp_file.flush()
-            
-            minio_path = f"uploads/{username}/{uploaded_file.name}"
-            upload_file(temp_file.name, minio_path)
-            logger.debug(f"File uploaded to minio: {minio_path}")
-            
-            # Process and save transactions
-            uploaded_file.seek(0)  # Reset file pointer again
-            df = pd.read_csv(uploaded_file)
-            processed_data = InputService._process_mappings(df, mappings, account, username)
-            save_transactions(username, account, processed_data, mappings)
-            
-            return len(processed_data)
-        finally:
-            os.unlink(temp_file.name)
-    
-    def transaction_amount_conversion(amount, currency, account_type):
-        from currency_converter import CurrencyConverter
-        positive_negative = 1
-        if amount[0] == '-':
-            positive_negative = -1
-            amount = amount[1:]
-        if amount[0] in ['$', '€', '£', '¥']:
-            amount = amount[1:]
-        try:
-            amount = float(amount)
-        except ValueError:
-            logger.error(f"Invalid amount format: {amount}")
-            return 0.0
-        if currency != 'CAD':
-            amount = CurrencyConverter().convert(amount, currency, 'CAD')
-        credit_debit = 1
-        if account_type == 'credit':
-            credit_debit = -1
-        return amount * positive_negative * credit_debit
-
-    @staticmethod
-    def _process_mappings(df: pd.DataFrame, mappings: dict, account: str, username: str) -> list:
-        """Process field mappings and prepare data for saving"""
-        processed = []
-        for _, row in df.iterrows():
-            transaction = {'account': account, 'username': username}
-            for field, source in mappings.items():
-                if ';' in source:
-                    # Multiple columns selected - join their values
-                    columns = source.split(';')
-                    values = []
-                    for col in columns:
-                        if col in df.columns:
-                            value = str(row[col]) if pd.notna(row[col]) else ''
-                            logger.debug(f"Processing field '{field}' with value '{value}' from column '{col}'")
-                            if value:
-                                values.append(value)
-                    logger.debug(f"Field '{field}' combined values: {values}")
-                    transaction[field] = ';'.join(values)
-                elif field == 'amount':
-                    amount = str(row.get(source, '0'))
-                    currency = row.get('currency', 'CAD')
-                    account_type = mappings.get('account_type', 'debit')
-                    transaction[field] = InputService.transaction_amount_conversion(amount, currency, account_type)
-                elif source in df.columns:
-                    # Single column selected
-                    transaction[field] = row[source]
-                else:
-                    # Manual/fixed value
-                    transaction[field] = source
-            processed.append(transaction)
-        return pd.DataFrame(processed)
+        # Save mappings, remembering this file's header so the next upload is matched automatically
+        signature = InputService.file_signature(uploaded_file)
+        save_input_mappings(account, mappings, signature)
+
+        return InputService._import_file(account, mappings, uploaded_file, username)
+
+    @staticmethod
+    def quick_import(detected: dict, uploaded_file, username: str):
+        """Import a file with the saved mapping found by detect_mapping"""
+        return InputService._import_file(detected['account'], detected['mappings'], uploaded_file, username)
+
+    @staticmethod
+    def _import_file(account: str, mappings: dict, uploaded_file, username: str) -> dict:
+        """Import one file through the journal; a file already imported for this account is a no-op"""
+        replication.check_writable()
+        file_hash = InputService.file_hash(uploaded_file)
+        state = get_import_state(username, account, file_hash)
+
+        # Archive the raw file in the background, retrying on re-import if an earlier upload failed
+        if not state['archived']:
+            InputService._archive_upload(uploaded_file, username, account, file_hash)
+
+        if state['completed']:
+            logger.info(f"Skipping {uploaded_file.name}: already imported for user {username}, account {account}")
+            return {'success': True, 'imported': 0, 'skipped': True, 'resumed_from': 0, 'rejected': []}
+
+        # Parse, map and save the statement one chunk at a time
+        rejected = []
+
+        def mapped_chunks():
+            for df in statement_readers.iter_chunks(uploaded_file):
+                processed, bad = InputService._process_mappings(df, mappings, account, username)
+                rejected.extend(bad.to_dict(orient='records'))
+                yield processed
+
+        imported = save_transaction_chunks(username, account, mapped_chunks(), file_hash, uploaded_file.name)
+
+        return {
+            'success': True, 'imported': imported, 'skipped': False, 'resumed_from': state['committed_rows'],
+            'rejected': rejected,
+        }
+
+    @staticmethod
+    def file_hash(uploaded_file) -> str:
+        """Content hash identifying an uploaded file in the import journal"""
+        return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+    @staticmethod
+    def _archive_upload(uploaded_file, username: str, account: str, file_hash: str):
+        """
+        Queue the raw file for upload to minio under uploads/{username}/{sha256}{ext}. Identical
+        statements share one object; the journal records 'archived' once the upload succeeds.
+        """
+        extension = os.path.splitext(uploaded_file.name)[1].lower()
+        minio_path = f"uploads/{username}/{file_hash}{extension}"
+        logger.debug(f"Queued {uploaded_file.name} for archival to minio: {minio_path}")
+        return submit_upload(
+            uploaded_file.getvalue(), minio_path,
+            on_success=lambda: record_import_archived(username, account, file_hash, uploaded_file.name)
+        )
+
+    @staticmethod
+    def _read_header(uploaded_file) -> list:
+        return statement_readers.read_header(uploaded_file)
+
+    @staticmethod
+    def header_signature(columns) -> str:
+        """Hash of the normalized, sorted statement column names"""
+        normalized = sorted(' '.join(str(col).split()).lower() for col in columns)
+        return hashlib.sha256('\x1f'.join(normalized).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def file_signature(uploaded_file) -> str | None:
+        """
+        Signature matching an upload to a saved account: its header signature, plus the statement's
+        account id for formats like OFX whose columns are the same for every bank. None when the file
+        does not identify its account, so it is never matched automatically.
+        """
+        columns = InputService._read_header(uploaded_file)
+        if statement_readers.has_fixed_columns(uploaded_file.name):
+            account_id = statement_readers.read_account_id(uploaded_file)
+            if not account_id:
+                return None
+            columns = [*columns, f'ACCTID {account_id}']
+        return InputService.header_signature(columns)
+
+    @staticmethod
+    def detect_mapping(uploaded_file) -> dict:
+        """
+        Find the saved account mapping for an uploaded file by its signature.
+        Returns a dict with 'account' and 'mappings', or None if the file is unknown.
+        """
+        signature = InputService.file_signature(uploaded_file)
+        account = get_account_by_signature(signature) if signature else None
+        if not account:
+            return None
+        mappings = get_input_mappings(account)
+        if not mappings:
+            return None
+        logger.debug(f"Header signature {signature[:12]} matched account: {account}")
+        return {'account': account, 'mappings': mappings}
+
+    @staticmethod
+    def header_fingerprint(columns) -> frozenset:
+        """Normalized set of statement column names used to match a file to a saved mapping"""
+        return frozenset(str(col).strip().lower() for col in columns)
+
+    @staticmethod
+    def detect_account(columns, all_mappings: dict) -> str:
+        """
+        Pick the account whose saved mapping best fits the given statement columns.
+        Returns None when no mapping fits or the best fit is ambiguous.
+        """
+        fingerprint = InputService.header_fingerprint(columns)
+        best_account, best_score, tied = None, 0, False
+        for account, mappings in all_mappings.items():
+            # Manual/fixed values are not columns, so only the date and amount sources must be present
+            required = [col for field in ('date', 'amount') for col in mappings.get(field, '').split(';') if col]
+            if not required or not all(col.strip().lower() in fingerprint for col in required):
+                continue
+            sources = [col for source in mappings.values() for col in source.split(';') if col]
+            score = sum(1 for col in sources if col.strip().lower() in fingerprint)
+            if score > best_score:
+                best_account, best_score, tied = account, score, False
+            elif score == best_score:
+                tied = True
+        return None if tied else best_account
+
+    @staticmethod
+    def detect_accounts(uploaded_files: list) -> list:
+        """Detect the account for each uploaded file from its column header"""
+        all_mappings = None
+        detected = []
+        for uploaded_file in uploaded_files:
+            signature = InputService.file_signature(uploaded_file)
+            account = get_account_by_signature(signature) if signature else None
+            # Unknown header: fall back to scoring every saved mapping against it, except for fixed
+            # columns, which every account of that format would fit
+            if not account and not statement_readers.has_fixed_columns(uploaded_file.name):
+                if all_mappings is None:
+                    all_mappings = get_all_input_mappings()
+                account = InputService.detect_account(InputService._read_header(uploaded_file), all_mappings)
+            detected.append(account)
+        return detected
+
+    @staticmethod
+    def batch_import(selections: list, username: str) -> dict:
+        """
+        Import many files at once. Each selection is a dict with 'file' and 'account';
+        files are parsed in parallel and written in one transaction with one DB upload.
+        """
+        replication.check_writable()
+        all_mappings = get_all_input_mappings()
+        missing = sorted({s['account'] for s in selections if s['account'] not in all_mappings})
+        if missing:
+            return {'success': False, 'message': f"No saved mapping for account(s): {', '.join(missing)}"}
+
+        signatures = {}
+        pending = []
+        files = []
+        for selection in selections:
+            uploaded_file, account = selection['file'], selection['account']
+            signature = InputService.file_signature(uploaded_file)
+            if signature and get_account_by_signature(signature) != account:
+                signatures[signature] = account
+            file_hash = InputService.file_hash(uploaded_file)
+            state = get_import_state(username, account, file_hash)
+            if not state['archived']:
+                InputService._archive_upload(uploaded_file, username, account, file_hash)
+            if state['completed'] or any(p['file_hash'] == file_hash and p['selection']['account'] == account for p in pending):
+                files.append({'name': uploaded_file.name, 'account': account, 'rows': 0, 'rejected': 0, 'skipped': True})
+                continue
+            pending.append({'selection': selection, 'file_hash': file_hash, 'row_start': state['committed_rows']})
+
+        payloads = [(p['selection']['file'].getvalue(), p['selection']['file'].name, all_mappings[p['selection']['account']], p['selection']['account'], username) for p in pending]
+        workers = min(len(payloads), Config.IMPORT_WORKERS)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parsed = list(executor.map(_parse_and_map, payloads))
+        else:
+            parsed = [_parse_and_map(payload) for payload in payloads]
+        logger.debug(f"Parsed {len(parsed)} files with {workers} worker(s) for user {username}")
+
+        batches = [{
+            'account': p['selection']['account'],
+            'df': df,
+            'file_hash': p['file_hash'],
+            'file_name': p['selection']['file'].name,
+            'row_start': p['row_start'],
+            'rejected': len(rejected),
+        } for p, (df, rejected) in zip(pending, parsed)]
+        total = save_transactions_batch(username, batches) if batches else 0
+        if signatures:
+            save_mapping_signatures(signatures)
+        files += [{
+            'name': b['file_name'], 'account': b['account'], 'rows': len(b['df']) - b['row_start'],
+            'rejected': b['rejected'], 'skipped': False,
+        } for b in batches]
+        return {'success': True, 'imported': total, 'files': files}
+
+    @staticmethod
+    def transaction_amount_conversion(amounts: pd.Series, currencies: pd.Series, account_type: str) -> pd.Series:
+        """Convert parsed amounts to CAD and flip the sign for credit accounts"""
+        converted = amounts.copy()
+        foreign = currencies.fillna('CAD').astype(str)
+        for currency in foreign[foreign != 'CAD'].unique():
+            from currency_converter import CurrencyConverter
+            rate = CurrencyConverter().convert(1, currency, 'CAD')
+            converted[foreign == currency] *= rate
+        credit_debit = -1 if account_type == 'credit' else 1
+        return converted * credit_debit
+
+    @staticmethod
+    def _process_mappings(df: pd.DataFrame, mappings: dict, account: str, username: str) -> tuple:
+        """
+        Apply field mappings column-wise. Returns (processed, rejected): the rows ready for saving, and
+        the source rows whose amount could not be parsed (1-based row number and raw value).
+        """
+        processed = pd.DataFrame({'account': account, 'username': username}, index=df.index)
+        rejected = pd.DataFrame(columns=['row', 'amount'])
+        for field, source in mappings.items():
+            if field == 'amount_format':
+                continue
+            if ';' in source:
+                # Multiple columns selected - join their non-empty values
+                joined = pd.Series('', index=df.index)
+                for col in [c for c in source.split(';') if c in df.columns]:
+                    values = df[col].where(df[col].notna(), '').astype(str)
+                    joined = joined.where(values == '', joined.where(joined == '', joined + ';') + values)
+                processed[field] = joined
+            elif field == 'amount':
+                raw = df[source] if source in df.columns else pd.Series('0', index=df.index)
+                amounts, bad = parse_amounts(raw, mappings.get('amount_format', DEFAULT_AMOUNT_FORMAT))
+                if bad.any():
+                    rejected = pd.DataFrame({'row': df.index[bad] + 1, 'amount': raw[bad].astype(str)})
+                    logger.warning(f"Rejected {len(rejected)} rows with unparseable amounts for account {account}")
+                currencies = df['currency'] if 'currency' in df.columns else pd.Series('CAD', index=df.index)
+                account_type = mappings.get('account_type', 'debit')
+                processed[field] = InputService.transaction_amount_conversion(amounts, currencies, account_type)
+                processed['original_amount_cents'] = to_cents(amounts * (-1 if account_type == 'credit' else 1))
+                if 'currency' in df.columns:
+                    processed['original_currency'] = df['currency']
+            elif source in df.columns:
+                # Single column selected
+                processed[field] = df[source]
+            else:
+                # Manual/fixed value
+                processed[field] = source
+        if 'amount' in processed:
+            processed = processed[processed['amount'].notna()].copy()
+            # Convert to integer cents once here; stored amounts are exactly amount_cents / 100
+            processed['amount_cents'] = to_cents(processed['amount']).astype('int64')
+            processed['amount'] = processed['amount_cents'] / 100
+            processed['original_amount_cents'] = processed['original_amount_cents'].astype('int64')
+            if 'original_currency' not in processed:
+                processed['original_currency'] = processed.get('currency', 'CAD')
+        return processed.reset_index(drop=True), rejected.reset_index(drop=True)
+
+    # Async counterparts for API servers and background workers
+    @staticmethod
+    async def get_accounts_async() -> list:
+        return await async_storage.run_sync(InputService.get_accounts)
+
+    @staticmethod
+    async def get_saved_mappings_async(account: str) -> dict:
+        return await async_storage.run_sync(InputService.get_saved_mappings, account)
+
+    @staticmethod
+    async def detect_mapping_async(uploaded_file) -> dict:
+        return await async_storage.run_sync(InputService.detect_mapping, uploaded_file)
+
+    @staticmethod
+    async def quick_import_async(detected: dict, uploaded_file, username: str) -> dict:
+        return await async_storage.run_sync(InputService.quick_import, detected, uploaded_file, username)
+
+    @staticmethod
+    async def batch_import_async(selections: list, username: str) -> dict:
+        return await async_storage.run_sync(InputService.batch_import, selections, username)
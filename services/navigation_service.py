@@ -8,7 +8,7 @@ from services.auth_service import AuthService
 class NavigationService:
     """Service class for handling page navigation"""
     
-    PAGES = ['Home', 'Input', 'Category', 'Login', 'Signup']
+    PAGES = ('Home', 'Input', 'Category', 'Budget', 'Login', 'Signup')
     
     @staticmethod
     def redirect_to_login_if_not_authenticated():
@@ -0,0 +1,69 @@
+"""
+Recurring Service - Backend logic for detecting subscriptions and other recurring charges
+"""
+import datetime
+import math
+
+import pandas as pd
+
+from utils.output_log import logger
+from utils.sqlite_storage import get_recurring_merchants
+
+# Typical billing periods in days and how far an observed average may drift from them
+CADENCES = [
+    ('Weekly', 7, 2),
+    ('Biweekly', 14, 3),
+    ('Monthly', 30.4, 4),
+    ('Quarterly', 91, 10),
+    ('Yearly', 365, 20),
+]
+MAX_INTERVAL_CV = 0.35  # interval std / mean; above this the charges are too irregular to be a schedule
+FIXED_AMOUNT_CV = 0.10  # amount std / |mean| below which the charge counts as a fixed amount
+
+
+class RecurringService:
+    """Service class for recurring transaction detection"""
+
+    @staticmethod
+    def classify_cadence(period_days: float) -> str:
+        """Name of the billing period closest to the observed average interval, or '' if none fits"""
+        for name, days, tolerance in CADENCES:
+            if abs(period_days - days) <= tolerance:
+                return name
+        return ''
+
+    @staticmethod
+    def get_recurring(username: str, min_occurrences: int = 3, today: datetime.date | None = None) -> pd.DataFrame:
+        """
+        Recurring charges for a user, read from the precomputed per-merchant statistics.
+        One row per merchant whose charges follow a regular weekly to yearly schedule.
+        """
+        today = today or datetime.date.today()
+        records = []
+        for row in get_recurring_merchants(username, min_occurrences):
+            if row.interval_count < 2 or row.interval_mean <= 0:
+                continue
+            interval_std = math.sqrt(row.interval_m2 / (row.interval_count - 1))
+            cadence = RecurringService.classify_cadence(row.interval_mean)
+            if not cadence or interval_std / row.interval_mean > MAX_INTERVAL_CV:
+                continue
+            amount_std = math.sqrt(row.amount_m2 / (row.occurrences - 1)) if row.occurrences > 1 else 0.0
+            last_date = datetime.date.fromisoformat(row.last_date)
+            next_date = last_date + datetime.timedelta(days=round(row.interval_mean))
+            records.append({
+                'merchant': row.merchant_name,
+                'cadence': cadence,
+                'period_days': round(row.interval_mean, 1),
+                'average_amount': round(row.amount_mean / 100, 2),
+                'fixed_amount': amount_std <= FIXED_AMOUNT_CV * abs(row.amount_mean),
+                'occurrences': row.occurrences,
+                'last_date': last_date,
+                'next_date': next_date,
+                # Missed more than half a period past the expected date: probably cancelled
+                'active': today <= next_date + datetime.timedelta(days=row.interval_mean / 2),
+            })
+        logger.debug(f"Found {len(records)} recurring merchants for user {username}")
+        columns = ['merchant', 'cadence', 'period_days', 'average_amount', 'fixed_amount',
+                   'occurrences', 'last_date', 'next_date', 'active']
+        df = pd.DataFrame(records, columns=columns)
+        return df.sort_values(['active', 'average_amount'], ascending=[False, True]).reset_index(drop=True)
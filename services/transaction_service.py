@@ -1,40 +1,155 @@
 """
 Transaction Service - Backend logic for transaction operations
 """
+import re
+from typing import ClassVar
+
 import pandas as pd
-from utils.sqlite_storage import get_session, Detail
+
+from utils import analytics_storage, async_storage
 from utils.output_log import logger
+from utils.sqlite_storage import (
+    concat_frames,
+    detail_partitions,
+    partition_batches,
+    read_detail_frames,
+    search_details,
+)
 
 
 class TransactionService:
     """Service class for handling transaction-related operations"""
+
+    # Low-cardinality text as category, dates as datetime64; only descriptions stay per-row strings
+    FRAME_DTYPES: ClassVar[dict] = {
+        'id': 'int64',
+        'account': 'category',
+        'post_date': 'datetime64',
+        'category': 'category',
+        'merchant_name': 'category',
+        'canonical_merchant': 'category',
+        'description': 'string',
+        'amount': 'float64',
+        'amount_cents': 'int64',
+        'match_type': 'category',
+    }
     
     @staticmethod
-    def get_user_transactions(username: str) -> pd.DataFrame:
-        """Get all transactions for a specific user"""
+    def get_user_transactions(username: str, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Get the transactions of a specific user, optionally only the months from start_date to end_date.
+        Archived years outside that range are never opened.
+        """
         logger.debug(f"Fetching transactions for user: {username}")
-        
-        session = get_session()
-        try:
-            rows = session.query(
-                Detail.id, Detail.account, Detail.post_date, Detail.category,
-                Detail.merchant_name, Detail.description, Detail.amount
-            ).filter(Detail.username == username).all()
-            
-            df = pd.DataFrame(rows, columns=['id', 'account', 'post_date', 'category', 'merchant_name', 'description', 'amount'])
-            logger.debug(f"Fetched Result {df.to_dict(orient='records')}")
-            return df
-        finally:
-            session.close()
+        filters = {'start_date': start_date, 'end_date': end_date}
+        partitions = detail_partitions(username, start_date, end_date)
+        frames = read_detail_frames(*TransactionService._user_query(username, filters), TransactionService.FRAME_DTYPES,
+                                    username=username, partitions=partitions)
+        df = concat_frames(frames, TransactionService.FRAME_DTYPES)
+        logger.debug(f"Fetched {len(df)} transactions ({df.memory_usage(deep=True).sum()} bytes) for user: {username}")
+        return df
     
+    @staticmethod
+    def has_archived_years(username: str) -> bool:
+        """Whether closed years of the user's transactions were moved to archive files"""
+        return bool(detail_partitions(username))
+
+    @staticmethod
+    def _user_query(username: str, filters: dict | None = None) -> tuple:
+        """Query over the {source} placeholder of read_detail_frames, and its parameters"""
+        where, params = TransactionService._where(username, filters)
+        return f"SELECT {', '.join(TransactionService.FRAME_DTYPES)} FROM {{source}} WHERE {where}", params
+
+    @staticmethod
+    def _where(username: str, filters: dict) -> tuple:
+        """
+        SQL conditions for filters: 'accounts', 'categories' and 'merchants' lists, and 'start_date' /
+        'end_date', which select whole months
+        """
+        filters = filters or {}
+        where = ['username = ?']
+        params = [username]
+        for key, column in (('accounts', 'account'), ('categories', 'category'), ('merchants', 'canonical_merchant')):
+            values = filters.get(key)
+            if values:
+                where.append(f"{column} IN ({', '.join('?' for _ in values)})")
+                params.extend(values)
+        for key, operator in (('start_date', '>='), ('end_date', '<=')):
+            if filters.get(key) is not None:
+                where.append(f"month != '' AND month {operator} ?")
+                params.append(pd.Timestamp(filters[key]).strftime('%Y-%m'))
+        return ' AND '.join(where), params
+
+    @staticmethod
+    def _partitions(username: str, filters: dict) -> list:
+        filters = filters or {}
+        return detail_partitions(username, filters.get('start_date'), filters.get('end_date'))
+
+    @staticmethod
+    def get_transactions_page(username: str, filters: dict | None = None, page: int = 1, page_size: int = 100) -> dict:
+        """One page of transactions in id order, paginated in SQL, with the total row count"""
+        page = max(1, page)
+        partitions = TransactionService._partitions(username, filters)
+        page_query, count_query, skip = TransactionService._page_queries(username, filters, page, page_size, partitions)
+        frames = read_detail_frames(*page_query, TransactionService.FRAME_DTYPES, username=username, partitions=partitions)
+        totals = read_detail_frames(*count_query, {'total': 'int64'}, username=username, partitions=partitions)
+        return TransactionService._page_result(frames, totals, skip, page, page_size)
+
+    @staticmethod
+    def _page_queries(username: str, filters: dict, page: int, page_size: int, partitions=()) -> tuple:
+        """
+        Page and count queries over read_detail_frames' {source}, and the rows to skip after merging:
+        over several partition batches each batch returns its first offset + page_size rows instead
+        """
+        where, params = TransactionService._where(username, filters)
+        columns = ', '.join(TransactionService.FRAME_DTYPES)
+        offset = (page - 1) * page_size
+        skip = offset if len(partition_batches(partitions)) > 1 else 0
+        return (
+            (f"SELECT {columns} FROM {{source}} WHERE {where} ORDER BY id LIMIT ? OFFSET ?",
+             (*params, page_size + skip, offset - skip)),
+            (f"SELECT count(*) FROM {{source}} WHERE {where}", params),
+            skip,
+        )
+
+    @staticmethod
+    def _page_result(frames: list, totals: list, skip: int, page: int, page_size: int) -> dict:
+        df = concat_frames(frames, TransactionService.FRAME_DTYPES)
+        if len(frames) > 1:
+            df = df.sort_values('id').iloc[skip:skip + page_size].reset_index(drop=True)
+        total = sum(int(frame['total'].iloc[0]) for frame in totals)
+        return {'results': df, 'total': total, 'page': page, 'page_size': page_size}
+
+    @staticmethod
+    def iter_transactions(username: str, filters: dict | None = None, batch_size: int = 5000):
+        """Yield DataFrames of transactions in id order, keyset-paginated so exports never hold every row"""
+        where, params = TransactionService._where(username, filters)
+        columns = ', '.join(TransactionService.FRAME_DTYPES)
+        partitions = TransactionService._partitions(username, filters)
+        last_id = 0
+        while True:
+            frames = read_detail_frames(
+                f"SELECT {columns} FROM {{source}} WHERE {where} AND id > ? ORDER BY id LIMIT ?",
+                (*params, last_id, batch_size),
+                TransactionService.FRAME_DTYPES, username=username, partitions=partitions
+            )
+            df = concat_frames(frames, TransactionService.FRAME_DTYPES)
+            if len(frames) > 1:
+                df = df.sort_values('id').head(batch_size).reset_index(drop=True)
+            if df.empty:
+                return
+            yield df
+            last_id = int(df['id'].iloc[-1])
+
     @staticmethod
     def get_filter_options(df: pd.DataFrame) -> dict:
         """Get unique values for filtering options"""
         return {
             'accounts': df['account'].unique().tolist(),
-            'post_dates': df['post_date'].unique().tolist(),
+            'post_dates': df['post_date'].drop_duplicates().sort_values().tolist(),
             'categories': df['category'].dropna().unique().tolist(),
-            'merchants': df['merchant_name'].unique().tolist()
+            # Canonical merchants, so spelling variants of one merchant share a single option
+            'merchants': df['canonical_merchant'].unique().tolist()
         }
     
     @staticmethod
@@ -46,6 +161,106 @@ class TransactionService:
             df['account'].isin(selected_accounts) &
             df['post_date'].isin(selected_dates) &
             df['category'].isin(selected_categories) &
-            df['merchant_name'].isin(selected_merchants)
+            df['canonical_merchant'].isin(selected_merchants)
         )
         return df[mask]
+
+    # Group-by expressions over Detail; month and year come from the stored YYYY-MM transaction month
+    SQL_GROUP_BY: ClassVar[dict] = {
+        'account': 'account',
+        'category': 'category',
+        'merchant_name': 'merchant_name',
+        'canonical_merchant': 'canonical_merchant',
+        'currency': 'currency',
+        'month': "nullif(month, '')",
+        'year': "nullif(substr(month, 1, 4), '')",
+    }
+
+    @staticmethod
+    def aggregate_transactions(username: str, group_by: list, start_date=None, end_date=None, accounts: list | None = None) -> pd.DataFrame:
+        """
+        Transaction count and total amount grouped by any of account, category, merchant_name,
+        canonical_merchant, currency, month or year, leaving out matched transfers and near-duplicates.
+        start_date and end_date select whole months. Served from the columnar mirror when
+        ANALYTICS_ENGINE is set, else grouped and summed in SQLite.
+        """
+        unknown = [col for col in group_by if col not in analytics_storage.GROUP_BY_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unsupported group_by columns: {unknown}")
+        logger.debug(f"Aggregating transactions for {username} by {group_by}")
+        if analytics_storage.is_enabled():
+            return analytics_storage.aggregate(username, group_by, start_date, end_date, accounts)
+
+        where, params = TransactionService._where(
+            username, {'start_date': start_date, 'end_date': end_date, 'accounts': accounts}
+        )
+        select = ''.join(f"{TransactionService.SQL_GROUP_BY[col]} AS {col}, " for col in group_by)
+        # Positions, since month is both a column and an output name
+        positions = ', '.join(str(i) for i in range(1, len(group_by) + 1))
+        dtypes = {**dict.fromkeys(group_by, 'object'), 'transactions': 'int64', 'total_cents': 'int64'}
+        frames = read_detail_frames(
+            f"SELECT {select}count(*) AS transactions, coalesce(sum(amount_cents), 0) AS total_cents "
+            f"FROM {{source}} WHERE {where} AND match_type = ''"
+            + (f" GROUP BY {positions} ORDER BY {positions}" if group_by else ''),
+            params, dtypes, username=username, partitions=detail_partitions(username, start_date, end_date)
+        )
+        result = concat_frames(frames, dtypes)
+        if len(frames) > 1:
+            # Each batch of archived years was summed on its own
+            if group_by:
+                result = result.groupby(group_by, dropna=False)[['transactions', 'total_cents']].sum().reset_index()
+            else:
+                result = result[['transactions', 'total_cents']].sum().to_frame().T
+        # Sum integer cents exactly and convert once
+        result['total_amount'] = result.pop('total_cents') / 100
+        return result
+
+    @staticmethod
+    def search(username: str, query: str, filters: dict | None = None, page: int = 1, page_size: int = 50) -> dict:
+        """
+        Full-text search over merchant_name and description, ranked by relevance.
+        Every word must match, as a prefix. Returns the page of results and the total hit count.
+        """
+        terms = re.findall(r'\w+', query or '')
+        columns = ['id', 'account', 'post_date', 'category', 'merchant_name', 'description', 'amount']
+        if not terms:
+            return {'results': pd.DataFrame(columns=columns), 'total': 0, 'page': 1, 'page_size': page_size}
+        match = ' '.join(f'"{term}"*' for term in terms)
+        page = max(1, page)
+        rows, total = search_details(username, match, filters, page_size, (page - 1) * page_size)
+        return {'results': pd.DataFrame(rows, columns=columns), 'total': total, 'page': page, 'page_size': page_size}
+
+    # Async counterparts for API servers and background workers
+    @staticmethod
+    async def get_user_transactions_async(username: str, start_date=None, end_date=None) -> pd.DataFrame:
+        """Async get_user_transactions, read through aiosqlite"""
+        logger.debug(f"Fetching transactions for user: {username}")
+        filters = {'start_date': start_date, 'end_date': end_date}
+        partitions = await async_storage.run_sync(detail_partitions, username, start_date, end_date)
+        frames = await async_storage.read_detail_frames(
+            *TransactionService._user_query(username, filters), TransactionService.FRAME_DTYPES,
+            username=username, partitions=partitions
+        )
+        return concat_frames(frames, TransactionService.FRAME_DTYPES)
+
+    @staticmethod
+    async def get_transactions_page_async(username: str, filters: dict | None = None, page: int = 1, page_size: int = 100) -> dict:
+        """Async get_transactions_page, read through aiosqlite"""
+        page = max(1, page)
+        partitions = await async_storage.run_sync(TransactionService._partitions, username, filters)
+        page_query, count_query, skip = TransactionService._page_queries(username, filters, page, page_size, partitions)
+        frames = await async_storage.read_detail_frames(*page_query, TransactionService.FRAME_DTYPES, username=username,
+                                                        partitions=partitions)
+        totals = await async_storage.read_detail_frames(*count_query, {'total': 'int64'}, username=username,
+                                                        partitions=partitions)
+        return TransactionService._page_result(frames, totals, skip, page, page_size)
+
+    @staticmethod
+    async def search_async(username: str, query: str, filters: dict | None = None, page: int = 1, page_size: int = 50) -> dict:
+        return await async_storage.run_sync(TransactionService.search, username, query, filters, page, page_size)
+
+    @staticmethod
+    async def aggregate_transactions_async(username: str, group_by: list, start_date=None, end_date=None, accounts: list | None = None) -> pd.DataFrame:
+        return await async_storage.run_sync(
+            TransactionService.aggregate_transactions, username, group_by, start_date, end_date, accounts
+        )
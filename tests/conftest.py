@@ -0,0 +1,54 @@
+"""
+Test Fixtures - Every test runs against a fresh temp SQLite database and an in-memory fake MinIO
+"""
+import tempfile
+
+import pytest
+
+from benchmarks.environment import bootstrap, reset_db
+
+# The configuration is read on import, so the app is pointed at the temp directory before any test imports it
+fake_minio = bootstrap(tempfile.mkdtemp(prefix='peng-finance-test-'))
+
+
+def _reset_storage():
+    """Drop the database, the cached shard engines and every object in the fake store"""
+    from utils import snapshots, sqlite_storage
+    from utils.minio_storage import wait_for_uploads
+
+    wait_for_uploads()
+    with sqlite_storage._shards_lock:
+        for shard in sqlite_storage._shards.values():
+            shard.dispose()
+        sqlite_storage._shards.clear()
+    sqlite_storage._synced_revisions.clear()
+    sqlite_storage._mapping_revision['latest'] = None
+    sqlite_storage._checked_partitions.clear()
+    snapshots._latest.clear()
+    with fake_minio._lock:
+        fake_minio.objects.clear()
+        fake_minio.modified.clear()
+    reset_db()
+
+
+@pytest.fixture(autouse=True)
+def storage(tmp_path, monkeypatch):
+    """Shared storage mode with per-test shard and partition folders; yields the fake MinIO client"""
+    from config.configure import Config
+    from utils.minio_storage import wait_for_uploads
+
+    monkeypatch.setattr(Config, 'SHARD_DIR', str(tmp_path / 'shards'))
+    monkeypatch.setattr(Config, 'PARTITION_DIR', str(tmp_path / 'partitions'))
+    _reset_storage()
+    yield fake_minio
+    wait_for_uploads()
+
+
+@pytest.fixture
+def sharded(storage, monkeypatch):
+    """Switch to one SQLite shard per user, starting from an empty catalog"""
+    from config.configure import Config
+
+    monkeypatch.setattr(Config, 'STORAGE_MODE', 'sharded')
+    _reset_storage()
+    return storage
@@ -0,0 +1,82 @@
+"""
+Aggregates - Grouped totals summed in SQLite over hot and archived years, and by the DuckDB mirror
+"""
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import DEFAULT_MAPPINGS, generate_upload
+from config.configure import Config
+from services.input_service import InputService
+from services.transaction_service import TransactionService
+from utils import analytics_storage, sqlite_storage
+
+
+def _import():
+    InputService.save_mappings_and_import('Visa', dict(DEFAULT_MAPPINGS), generate_upload(500, seed=9), 'jade')
+    InputService.save_mappings_and_import('Amex', dict(DEFAULT_MAPPINGS), generate_upload(300, seed=10), 'jade')
+    sqlite_storage.remove_duplicates('jade')
+
+
+def _expected(group_by, start_date=None, end_date=None, accounts=None):
+    """Totals computed in pandas from the user's transactions"""
+    df = TransactionService.get_user_transactions('jade')
+    df = df[df['match_type'] == ''].assign(month=df['post_date'].dt.strftime('%Y-%m'),
+                                           year=df['post_date'].dt.strftime('%Y'))
+    if start_date:
+        df = df[df['month'] >= pd.Timestamp(start_date).strftime('%Y-%m')]
+    if end_date:
+        df = df[df['month'] <= pd.Timestamp(end_date).strftime('%Y-%m')]
+    if accounts:
+        df = df[df['account'].isin(accounts)]
+    totals = df.astype({col: 'object' for col in group_by}).groupby(group_by)['amount_cents'].agg(['size', 'sum'])
+    return {key: (count, cents / 100) for key, count, cents in totals.itertuples(name=None)}
+
+
+def _totals(result, group_by):
+    return {row[0] if len(group_by) == 1 else tuple(row[:-2]): (row[-2], row[-1])
+            for row in result[[*group_by, 'transactions', 'total_amount']].itertuples(index=False, name=None)}
+
+
+@pytest.mark.parametrize('group_by, filters', [
+    (['category'], {}),
+    (['month'], {'start_date': '2023-03-15', 'end_date': '2024-02-10'}),
+    (['year', 'account'], {'accounts': ['Amex']}),
+])
+def test_sql_totals_match_the_transactions(group_by, filters, monkeypatch):
+    _import()
+    expected = _expected(group_by, **filters)
+    assert _totals(TransactionService.aggregate_transactions('jade', group_by, **filters), group_by) == expected
+
+    monkeypatch.setattr(Config, 'PARTITION_HOT_YEARS', 1)
+    monkeypatch.setattr(sqlite_storage, 'ATTACH_BATCH', 1)
+    assert sqlite_storage.archive_closed_years()
+    assert _totals(TransactionService.aggregate_transactions('jade', group_by, **filters), group_by) == expected
+
+
+def test_total_without_grouping(monkeypatch):
+    _import()
+    monkeypatch.setattr(Config, 'PARTITION_HOT_YEARS', 1)
+    monkeypatch.setattr(sqlite_storage, 'ATTACH_BATCH', 1)
+    assert sqlite_storage.archive_closed_years()
+    df = TransactionService.get_user_transactions('jade')
+    kept = df[df['match_type'] == '']
+
+    result = TransactionService.aggregate_transactions('jade', [])
+    assert result.to_dict('records') == [{'transactions': len(kept), 'total_amount': kept['amount_cents'].sum() / 100}]
+
+
+def test_mirror_and_sqlite_totals_agree(tmp_path, monkeypatch):
+    pytest.importorskip('duckdb')
+    _import()
+    filters = {'start_date': '2023-03-15', 'end_date': '2024-02-10', 'accounts': ['Visa']}
+    sqlite_totals = _totals(TransactionService.aggregate_transactions('jade', ['category'], **filters), ['category'])
+
+    monkeypatch.setattr(Config, 'ANALYTICS_ENGINE', 'duckdb')
+    monkeypatch.setattr(Config, 'ANALYTICS_DB_PATH', str(tmp_path / 'analytics.duckdb'))
+    monkeypatch.setattr(analytics_storage, '_connection', None)
+    sqlite_storage.sync_analytics_mirror(force=True)
+    try:
+        mirror = _totals(TransactionService.aggregate_transactions('jade', ['category'], **filters), ['category'])
+    finally:
+        analytics_storage._get_connection().close()
+    assert mirror == sqlite_totals
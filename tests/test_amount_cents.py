@@ -0,0 +1,67 @@
+"""
+Amount Cents - Legacy float amounts are migrated to integer cents once, on startup
+"""
+import os
+import sqlite3
+
+from config.configure import Config
+from services.transaction_service import TransactionService
+from utils import sqlite_storage
+
+LEGACY_DETAIL = """
+    CREATE TABLE Detail (
+        id INTEGER PRIMARY KEY, username VARCHAR, account VARCHAR, date VARCHAR, post_date VARCHAR,
+        category VARCHAR, original_category VARCHAR, merchant_name VARCHAR, description VARCHAR,
+        currency VARCHAR, amount FLOAT
+    )
+"""
+
+
+def _legacy_database(rows):
+    """Replace the test database with one from before amounts were stored as cents"""
+    sqlite_storage.engine.dispose()
+    os.remove(Config.LOCAL_DB_PATH)
+    conn = sqlite3.connect(Config.LOCAL_DB_PATH)
+    conn.execute(LEGACY_DETAIL)
+    conn.executemany("INSERT INTO Detail VALUES (?, 'carol', 'Visa', ?, ?, 'Food', 'Food', ?, 'd', 'CAD', ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def test_float_amounts_become_exact_cents():
+    _legacy_database([
+        (1, '2024-01-05', '2024-01-06', 'Cafe', 0.1 + 0.2),
+        (2, '2024-01-07', '2024-01-08', 'Cafe', -45.005),
+        (3, '2024-02-01', '2024-02-02', 'Store', None),
+    ])
+    sqlite_storage.initialize_db()
+
+    conn = sqlite3.connect(Config.LOCAL_DB_PATH)
+    stored = conn.execute("SELECT id, amount, amount_cents, original_amount_cents, original_currency FROM Detail ORDER BY id").fetchall()
+    spend = dict(conn.execute("SELECT month, amount_cents FROM CategorySpend WHERE username = 'carol'").fetchall())
+    conn.close()
+    assert stored == [
+        (1, 0.3, 30, 30, 'CAD'),
+        (2, -45.01, -4501, -4501, 'CAD'),
+        # Rows without an amount count as zero
+        (3, 0.0, 0, 0, 'CAD'),
+    ]
+    assert spend == {'2024-01': 30 - 4501, '2024-02': 0}
+
+    df = TransactionService.get_user_transactions('carol')
+    assert str(df['amount_cents'].dtype) == 'int64'
+    assert sorted(df['amount_cents']) == [-4501, 0, 30]
+
+
+def test_migration_runs_once():
+    _legacy_database([(1, '2024-01-05', '2024-01-06', 'Cafe', 12.34)])
+    sqlite_storage.initialize_db()
+    conn = sqlite3.connect(Config.LOCAL_DB_PATH)
+    conn.execute("UPDATE Detail SET amount_cents = 999 WHERE id = 1")
+    conn.commit()
+    conn.close()
+
+    sqlite_storage.initialize_db()
+    conn = sqlite3.connect(Config.LOCAL_DB_PATH)
+    assert conn.execute("SELECT amount_cents FROM Detail").fetchall() == [(999,)]
+    conn.close()
@@ -0,0 +1,64 @@
+"""
+Amount Parsing - Statement amount strings under each per-account format
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.amount_parsing import parse_amounts, to_cents
+
+
+@pytest.mark.parametrize('amount_format, text, expected', [
+    ('standard', '1,234.56', 1234.56),
+    ('standard', '(45.00)', -45.0),
+    ('standard', '45.00 CR', -45.0),
+    ('standard', '-$12', -12.0),
+    ('standard', '$-12.00', -12.0),
+    ('standard', 'USD -45.00', -45.0),
+    ('standard', 'CAD-5', -5.0),
+    ('standard', '+7.25', 7.25),
+    ('standard', 'USD 1,000', 1000.0),
+    ('standard', "1'234.50", 1234.5),
+    ('standard', '.99', 0.99),
+    ('european', '1.234,56', 1234.56),
+    ('european', '-12,5', -12.5),
+    ('european', '€ 1.000.000', 1000000.0),
+    ('european', '€-5,00', -5.0),
+    ('space', '1 234,56', 1234.56),
+    ('space', '1 234,56-', -1234.56),
+])
+def test_parses_each_format(amount_format, text, expected):
+    amounts, rejected = parse_amounts(pd.Series([text]), amount_format)
+    assert amounts[0] == pytest.approx(expected)
+    assert not rejected[0]
+
+
+@pytest.mark.parametrize('amount_format, text', [
+    ('standard', '1.234,56'),  # European grouping is not read as 1.23456
+    ('standard', '12,34.56'),
+    ('standard', '12-34'),  # A minus inside the number is not a sign
+    ('standard', '--12'),
+    ('european', '1,234.56'),
+    ('standard', 'oops'),
+    ('standard', 'TOTAL DUE 12'),
+    ('standard', ''),
+])
+def test_rejects_amounts_that_do_not_fit_the_format(amount_format, text):
+    amounts, rejected = parse_amounts(pd.Series([text]), amount_format)
+    assert np.isnan(amounts[0])
+    assert rejected[0]
+
+
+def test_missing_and_numeric_values():
+    amounts, rejected = parse_amounts(pd.Series(['12.00', None]))
+    assert amounts.tolist()[0] == 12.0 and rejected.tolist() == [False, True]
+
+    amounts, rejected = parse_amounts(pd.Series([1.5, np.nan]))
+    assert amounts.tolist()[0] == 1.5 and rejected.tolist() == [False, True]
+
+
+def test_to_cents_rounds_to_integer_minor_units():
+    cents = to_cents(pd.Series([0.1 + 0.2, -45.005, np.nan]))
+    assert str(cents.dtype) == 'Int64'
+    assert cents.tolist()[:2] == [30, -4500]
+    assert cents.isna().tolist() == [False, False, True]
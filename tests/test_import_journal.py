@@ -0,0 +1,47 @@
+"""
+Import Journal - Journaled imports are idempotent and resume after the last committed chunk
+"""
+import pytest
+
+from benchmarks.synthetic import DEFAULT_MAPPINGS, generate_upload
+from config.configure import Config
+from services.input_service import InputService
+from services.transaction_service import TransactionService
+from utils import statement_readers
+from utils.sqlite_storage import get_import_state
+
+
+def test_interrupted_import_resumes_after_last_committed_chunk(monkeypatch):
+    monkeypatch.setattr(Config, 'IMPORT_CHUNK_SIZE', 100)
+    upload = generate_upload(450, seed=7)
+    read_chunks = statement_readers.iter_chunks
+
+    def failing_chunks(uploaded_file, chunk_size=None):
+        for number, chunk in enumerate(read_chunks(uploaded_file, chunk_size)):
+            if number == 2:
+                raise OSError('connection lost')
+            yield chunk
+
+    monkeypatch.setattr(statement_readers, 'iter_chunks', failing_chunks)
+    with pytest.raises(OSError):
+        InputService.save_mappings_and_import('Visa', dict(DEFAULT_MAPPINGS), upload, 'alice')
+    state = get_import_state('alice', 'Visa', InputService.file_hash(upload))
+    assert state['started'] and not state['completed']
+    assert state['committed_rows'] == 200
+    assert len(TransactionService.get_user_transactions('alice')) == 200
+
+    monkeypatch.setattr(statement_readers, 'iter_chunks', read_chunks)
+    result = InputService.save_mappings_and_import('Visa', dict(DEFAULT_MAPPINGS), upload, 'alice')
+    assert result['resumed_from'] == 200
+    assert result['imported'] == 250
+    assert get_import_state('alice', 'Visa', InputService.file_hash(upload))['completed']
+    assert len(TransactionService.get_user_transactions('alice')) == 450
+
+
+def test_reimporting_a_completed_file_is_a_no_op():
+    upload = generate_upload(120, seed=8)
+    assert InputService.save_mappings_and_import('Visa', dict(DEFAULT_MAPPINGS), upload, 'bob')['imported'] == 120
+
+    result = InputService.save_mappings_and_import('Visa', dict(DEFAULT_MAPPINGS), upload, 'bob')
+    assert result['skipped'] and result['imported'] == 0
+    assert len(TransactionService.get_user_transactions('bob')) == 120
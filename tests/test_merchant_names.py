@@ -0,0 +1,56 @@
+"""
+Merchant Names - Cleaning rules and MinHash/LSH clustering of merchant spelling variants
+"""
+import pytest
+
+from benchmarks.synthetic import UploadedCSV
+from services.input_service import InputService
+from services.transaction_service import TransactionService
+from utils.merchant_names import clean_merchant, cluster_merchants, normalize_merchant
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('AMZN Mktp CA*1A2B3', 'amazon'),
+    ('SQ *BLUE BOTTLE COFFEE #12', 'blue bottle coffee'),
+    ('POS PURCHASE TIM HORTONS #2231 OTTAWA ON', 'tim hortons ottawa'),
+    ('www.netflix.com', 'netflix'),
+    (None, ''),
+])
+def test_cleaning_rules(raw, expected):
+    assert clean_merchant(raw) == expected
+
+
+def test_normalize_falls_back_to_the_description():
+    assert normalize_merchant('', 'Uber *5K2J') == 'uber'
+    assert normalize_merchant(None, None) == ''
+
+
+def test_spelling_variants_share_a_cluster_and_distinct_merchants_do_not():
+    keys = ['starbucks', 'starbucks coffee', 'starbuks', 'tim hortons', 'tim horton', 'tim hortons cafe',
+            'shell', 'netflix', 'spotify', 'best buy', 'subway']
+    labels = dict(zip(keys, cluster_merchants(keys).tolist()))
+
+    assert labels['starbucks'] == labels['starbucks coffee'] == labels['starbuks']
+    assert labels['tim hortons'] == labels['tim horton'] == labels['tim hortons cafe']
+    assert labels['starbucks'] != labels['tim hortons']
+    others = [labels[key] for key in ('shell', 'netflix', 'spotify', 'best buy', 'subway')]
+    assert len(set(others)) == len(others) and not set(others) & {labels['starbucks'], labels['tim hortons']}
+
+
+def test_single_key_is_its_own_cluster():
+    assert cluster_merchants(['walmart']).tolist() == [0]
+
+
+def test_imported_variants_get_one_canonical_merchant():
+    rows = ['Transaction Date,Posting Date,Category,Merchant,Description,Amount']
+    rows += [f'2024-01-{day:02d},2024-01-{day:02d},Food,{merchant},x,{day}.50' for day, merchant in enumerate(
+        ['STARBUCKS #1203', 'Starbucks Coffee #88', 'SQ *STARBUKS', 'SHELL #4410', 'NETFLIX.COM'], start=1
+    )]
+    mappings = {'account_type': 'credit', 'date': 'Transaction Date', 'post_date': 'Posting Date',
+                'original_category': 'Category', 'merchant_name': 'Merchant', 'description': 'Description',
+                'currency': 'CAD', 'amount': 'Amount'}
+    InputService.save_mappings_and_import('Visa', mappings, UploadedCSV('\n'.join(rows).encode(), 'v.csv'), 'kim')
+
+    canonical = TransactionService.get_user_transactions('kim').sort_values('id')['canonical_merchant'].astype(str).tolist()
+    assert canonical[0] == canonical[1] == canonical[2]
+    assert len(set(canonical)) == 3
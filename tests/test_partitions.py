@@ -0,0 +1,134 @@
+"""
+Partitions - Closed years moved into per-year files stay visible to reads, dedupe, matching and recurring stats
+"""
+import csv
+import io
+
+from sqlalchemy import text
+
+from benchmarks.synthetic import (
+    DEFAULT_MAPPINGS,
+    UploadedCSV,
+    generate_csv,
+    generate_rows,
+)
+from config.configure import Config
+from services.input_service import InputService
+from services.transaction_service import TransactionService
+from utils import sqlite_storage
+
+
+def _import_with_transfers(username):
+    """A card statement with re-exported duplicates, and the chequing side of some payments to it"""
+    upload = UploadedCSV(generate_csv(600, seed=3, duplicate_rate=0.1), 'visa.csv')
+    InputService.save_mappings_and_import('Visa', dict(DEFAULT_MAPPINGS), upload, username)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['Transaction Date', 'Posting Date', 'Category', 'Merchant', 'Description', 'Amount'])
+    writer.writerows([
+        [row[0], row[1], 'Transfer', 'BANK', 'PAYMENT THANK YOU', f"{-float(row[5]):.2f}"]
+        for row in generate_rows(600, seed=3, duplicate_rate=0.1)[:200:10]
+    ])
+    transfers = UploadedCSV(out.getvalue().encode(), 'chq.csv')
+    InputService.save_mappings_and_import('Chequing', dict(DEFAULT_MAPPINGS), transfers, username)
+
+
+def _transactions(username):
+    df = TransactionService.get_user_transactions(username)
+    return df.sort_values('id').reset_index(drop=True)[['id', 'post_date', 'category', 'amount_cents', 'match_type']]
+
+
+def _recurring(username):
+    session = sqlite_storage.get_session(username)
+    rows = sorted((row.merchant_key, row.occurrences, row.interval_count)
+                  for row in session.query(sqlite_storage.RecurringMerchant))
+    session.close()
+    return rows
+
+
+def test_closed_years_move_to_partition_files(storage, monkeypatch):
+    _import_with_transfers('dana')
+    before = _transactions('dana')
+    monkeypatch.setattr(Config, 'PARTITION_HOT_YEARS', 2)
+
+    archived = sqlite_storage.archive_closed_years()
+
+    partitions = sqlite_storage.detail_partitions()
+    assert archived and [partition.year for partition in partitions] == ['2022', '2023', '2024']
+    assert sum(partition.transactions for partition in partitions) == archived
+    with sqlite_storage.engine.connect() as conn:
+        # Only the newest row stays behind, so archived ids are never handed out again
+        assert conn.execute(text("SELECT count(*), min(id) = max(id) FROM Detail")).one() == (1, 1)
+    assert _transactions('dana').equals(before)
+    stored = {name.rsplit('/', 1)[-1] for _, name in storage.objects if '/partitions/' in name}
+    assert stored == {f'{partition.year}.v{partition.version}.db' for partition in partitions}
+
+    # Reads that stay within the hot years do not need the partitions
+    assert sqlite_storage.detail_partitions(start_date='2025-03-01') == []
+
+
+def test_dedupe_and_matching_cover_archived_years(sharded, monkeypatch):
+    _import_with_transfers('hot')
+    _import_with_transfers('cold')
+    monkeypatch.setattr(Config, 'PARTITION_HOT_YEARS', 2)
+    assert sqlite_storage.archive_closed_years('cold')
+    assert sqlite_storage.detail_partitions('cold') and not sqlite_storage.detail_partitions('hot')
+    recurring = _recurring('hot')
+    assert recurring and _recurring('cold') == recurring
+    sqlite_storage.rebuild_recurring('cold')
+    assert _recurring('cold') == recurring
+
+    removed = {username: sqlite_storage.remove_duplicates(username) for username in ('hot', 'cold')}
+    matched = {username: sqlite_storage.match_transactions(username) for username in ('hot', 'cold')}
+
+    assert removed['hot'] > 0 and removed['cold'] == removed['hot']
+    assert matched['hot'] > 0 and matched['cold'] == matched['hot']
+    assert _transactions('cold').equals(_transactions('hot'))
+    assert _recurring('cold') == _recurring('hot')
+    assert sqlite_storage.remove_duplicates('cold') == 0
+
+    # Rewritten partitions replace the earlier versions locally and in the object store
+    for partition in sqlite_storage.detail_partitions('cold'):
+        assert partition.version > 1
+        versions = [name for _, name in sharded.objects if f'/{partition.year}.v' in name and '/cold/' in name]
+        assert versions == [sqlite_storage.partition_object('cold', partition.year, partition.version)]
+
+
+def _statement_over_years(first, last):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['Transaction Date', 'Posting Date', 'Category', 'Merchant', 'Description', 'Amount'])
+    for year in range(first, last + 1):
+        for month, merchant in ((2, 'Starbucks'), (5, 'Netflix'), (8, 'Starbucks'), (11, 'Shell')):
+            day = f'{year}-{month:02d}-{year % 28 + 1:02d}'
+            writer.writerow([day, day, 'Food', merchant, f'{merchant.upper()} {year}', f'{year % 97 + month}.25'])
+    return UploadedCSV(out.getvalue().encode(), 'years.csv')
+
+
+def test_reads_span_more_archived_years_than_sqlite_attaches_at_once(monkeypatch):
+    InputService.save_mappings_and_import('Visa', dict(DEFAULT_MAPPINGS), _statement_over_years(2008, 2024), 'ivan')
+
+    def reads():
+        page = TransactionService.get_transactions_page('ivan', page=3, page_size=7)
+        search = TransactionService.search('ivan', 'starbucks', page=2, page_size=5)
+        return {
+            'all': _transactions('ivan'),
+            'page': (page['results']['id'].tolist(), page['total']),
+            'batches': [df['id'].tolist() for df in TransactionService.iter_transactions('ivan', batch_size=9)],
+            'years': TransactionService.aggregate_transactions('ivan', ['year']).to_dict('records'),
+            'search': (search['results']['id'].tolist(), search['total']),
+        }
+
+    before = reads()
+    monkeypatch.setattr(Config, 'PARTITION_HOT_YEARS', 1)
+    assert sqlite_storage.archive_closed_years()
+    # More years than the 10 databases SQLite attaches to one connection
+    assert len(sqlite_storage.detail_partitions('ivan')) == 17
+
+    after = reads()
+    assert after.pop('all').equals(before.pop('all'))
+    assert after == before
+
+    monkeypatch.setattr(Config, 'STORAGE_MODE', 'sharded')
+    sqlite_storage.initialize_db()
+    assert _transactions('ivan')['id'].tolist() == [row_id for batch in before['batches'] for row_id in batch]
@@ -0,0 +1,69 @@
+"""
+Replica Mirror - Followers rebuild the analytics mirror from each snapshot they load
+"""
+import shutil
+import sqlite3
+
+import pytest
+
+from benchmarks.synthetic import DEFAULT_MAPPINGS, generate_upload
+from config.configure import Config
+from services.input_service import InputService
+from utils import analytics_storage, sqlite_storage
+from utils.storage_setup import load_snapshot
+
+pytest.importorskip('duckdb')
+
+
+@pytest.fixture
+def analytics(tmp_path, monkeypatch):
+    """DuckDB mirror in the test folder; the app is pointed back at its own database afterwards"""
+    monkeypatch.setattr(Config, 'ANALYTICS_ENGINE', 'duckdb')
+    monkeypatch.setattr(Config, 'ANALYTICS_DB_PATH', str(tmp_path / 'analytics.duckdb'))
+    monkeypatch.setattr(analytics_storage, '_connection', None)
+    yield
+    analytics_storage._get_connection().close()
+    sqlite_storage.swap_database(Config.LOCAL_DB_PATH)
+
+
+def _writer_snapshot(path, statement=None):
+    """Copy of the writer's main.db as a follower downloads it, optionally changed in place first"""
+    shutil.copyfile(Config.LOCAL_DB_PATH, path)
+    if statement:
+        conn = sqlite3.connect(path)
+        conn.execute(statement)
+        conn.commit()
+        conn.close()
+    return str(path)
+
+
+def _category_totals():
+    df = analytics_storage.aggregate('hana', ['category'])
+    return dict(zip(df['category'], df['transactions']))
+
+
+def test_snapshot_with_rows_changed_in_place_rebuilds_the_mirror(analytics, tmp_path):
+    InputService.save_mappings_and_import('Visa', dict(DEFAULT_MAPPINGS), generate_upload(200, seed=6), 'hana')
+    load_snapshot(_writer_snapshot(tmp_path / 'main.db.1'))
+    before = _category_totals()
+    assert 'Renamed' not in before
+
+    # Recategorization on the writer keeps the row count and max id
+    category = max(before, key=before.get)
+    load_snapshot(_writer_snapshot(tmp_path / 'main.db.2', f"UPDATE Detail SET category = 'Renamed' WHERE category = '{category}'"))
+
+    after = _category_totals()
+    assert after['Renamed'] == before[category] and category not in after
+
+
+def test_mirror_rebuild_reads_every_archived_year(analytics, monkeypatch):
+    InputService.save_mappings_and_import('Visa', dict(DEFAULT_MAPPINGS), generate_upload(300, seed=6), 'hana')
+    sqlite_storage.sync_analytics_mirror(force=True)
+    before = analytics_storage.mirror_state()
+    monkeypatch.setattr(Config, 'PARTITION_HOT_YEARS', 1)
+    monkeypatch.setattr(sqlite_storage, 'ATTACH_BATCH', 1)
+    assert sqlite_storage.archive_closed_years()
+    assert len(sqlite_storage.detail_partitions()) > 1
+
+    sqlite_storage.sync_analytics_mirror(force=True)
+    assert analytics_storage.mirror_state() == before
@@ -0,0 +1,62 @@
+"""
+Shards - Moving a shared main.db into per-user shards, and category mappings reaching shards lazily
+"""
+from sqlalchemy import inspect
+
+from benchmarks.synthetic import DEFAULT_MAPPINGS, generate_upload
+from config.configure import Config
+from services.input_service import InputService
+from services.transaction_service import TransactionService
+from utils import sqlite_storage
+
+
+def _transactions(username):
+    df = TransactionService.get_user_transactions(username)
+    return df.sort_values('id').reset_index(drop=True)[['id', 'post_date', 'merchant_name', 'category', 'amount_cents']]
+
+
+def _import(username, size, seed):
+    sqlite_storage.create_user(username, 'hash', f'{username}@example.com', None)
+    InputService.save_mappings_and_import('Visa', dict(DEFAULT_MAPPINGS), generate_upload(size, seed=seed), username)
+
+
+def test_shared_database_is_split_into_user_shards(monkeypatch):
+    monkeypatch.setattr(Config, 'PARTITION_HOT_YEARS', 2)
+    _import('alice', 400, seed=1)
+    _import('bob', 300, seed=2)
+    assert sqlite_storage.archive_closed_years()
+    before = {username: _transactions(username) for username in ('alice', 'bob')}
+    spend = {username: sqlite_storage.get_category_spend(username, '2024-06') for username in ('alice', 'bob')}
+    assert spend['alice'] and spend['bob']
+
+    monkeypatch.setattr(Config, 'STORAGE_MODE', 'sharded')
+    sqlite_storage.initialize_db()
+
+    assert 'Detail' not in inspect(sqlite_storage.engine).get_table_names()
+    assert sorted(sqlite_storage.shard_usernames()) == ['alice', 'bob']
+    for username in ('alice', 'bob'):
+        assert _transactions(username).equals(before[username])
+        assert sqlite_storage.get_category_spend(username, '2024-06') == spend[username]
+        # Each shard archives its own closed years
+        assert sqlite_storage.detail_partitions(username)
+
+
+def test_category_mappings_reach_other_shards_when_they_are_opened(sharded):
+    _import('alice', 200, seed=3)
+    _import('bob', 200, seed=3)
+    session = sqlite_storage.get_session('bob')
+    row = session.query(sqlite_storage.Detail).order_by(sqlite_storage.Detail.id).first()
+    session.close()
+    with sqlite_storage._shards_lock:
+        sqlite_storage._shards.pop('bob').dispose()
+    sqlite_storage._synced_revisions.pop('bob')
+
+    sqlite_storage.save_category_mappings(
+        [(row.original_category, row.merchant_name, row.description, 'Renamed')], 'alice'
+    )
+    assert 'bob' not in sqlite_storage._shards
+    assert (_transactions('alice')['category'] == 'Renamed').any()
+
+    # Opening bob's shard applies the mapping saved since it was last used
+    assert (_transactions('bob')['category'] == 'Renamed').any()
+    assert sqlite_storage._synced_revisions['bob'] == sqlite_storage.latest_mapping_revision()
@@ -0,0 +1,122 @@
+"""
+Snapshots - Restoring a database and its partitions, undoing a restore, and chunk garbage collection
+"""
+import datetime
+import os
+
+import pytest
+
+from benchmarks.synthetic import DEFAULT_MAPPINGS, generate_upload
+from config.configure import Config
+from services.input_service import InputService
+from services.transaction_service import TransactionService
+from utils import minio_storage, snapshots, sqlite_storage
+from utils.local_object_store import LocalObjectStore
+from utils.minio_storage import submit_upload
+
+
+def _transactions(username):
+    df = TransactionService.get_user_transactions(username)
+    return df.sort_values('id').reset_index(drop=True)[['id', 'post_date', 'merchant_name', 'category', 'amount_cents']]
+
+
+def _import(username, seed):
+    upload = generate_upload(600, seed=seed, duplicate_rate=0.1)
+    InputService.save_mappings_and_import('Visa', dict(DEFAULT_MAPPINGS), upload, username)
+
+
+def test_restore_returns_to_snapshot_and_can_be_undone(monkeypatch):
+    monkeypatch.setattr(Config, 'PARTITION_HOT_YEARS', 2)
+    _import('erin', seed=4)
+    assert sqlite_storage.archive_closed_years()
+    before = _transactions('erin')
+    spend = sqlite_storage.get_category_spend('erin', '2023-03')
+    snapshot = sqlite_storage.snapshot_database(reason='test')
+    assert [entry['kind'] for entry in snapshot['files']] == ['database', 'partition', 'partition', 'partition']
+
+    assert sqlite_storage.remove_duplicates('erin')
+    after = _transactions('erin')
+    assert len(after) < len(before)
+
+    sqlite_storage.restore_database(snapshot['id'])
+    assert _transactions('erin').equals(before)
+    assert sqlite_storage.get_category_spend('erin', '2023-03') == spend
+
+    # The state replaced by the restore was snapshotted first
+    undo = next(manifest for manifest in snapshots.list_snapshots()
+                if manifest['reason'] == f"before restoring {snapshot['id']}")
+    sqlite_storage.restore_database(undo['id'])
+    assert _transactions('erin').equals(after)
+
+
+def test_restoring_a_shard_leaves_other_users_alone(sharded):
+    _import('erin', seed=4)
+    _import('finn', seed=5)
+    snapshot = sqlite_storage.snapshot_database('erin', reason='test')
+    assert snapshot['owner'] == 'erin'
+    assert sqlite_storage.remove_duplicates('erin') and sqlite_storage.remove_duplicates('finn')
+    finn = _transactions('finn')
+
+    sqlite_storage.restore_database(snapshot['id'], 'erin')
+    assert len(_transactions('erin')) == 600
+    assert _transactions('finn').equals(finn)
+    # Duplicate removal snapshotted each shard on its own
+    assert [manifest['reason'] for manifest in snapshots.list_snapshots('finn')] == ['duplicate removal']
+
+
+def _local_store(root, monkeypatch):
+    """Point the app at a LocalObjectStore under root; returns the names it holds and a way to age them"""
+    monkeypatch.setattr(minio_storage, 'client', LocalObjectStore(str(root)))
+
+    def names():
+        return set(minio_storage.list_object_times(''))
+
+    def age(delta):
+        for directory, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(directory, name)
+                modified = os.path.getmtime(path) - delta.total_seconds()
+                os.utime(path, (modified, modified))
+    return names, age
+
+
+def _fake_store(fake):
+    def names():
+        return {name for _, name in fake.objects}
+
+    def age(delta):
+        for key in fake.modified:
+            fake.modified[key] -= delta
+    return names, age
+
+
+@pytest.mark.parametrize('store', ['fake', 'local'])
+def test_garbage_collection_keeps_recent_unreferenced_chunks(store, storage, tmp_path, monkeypatch):
+    names, age = _local_store(tmp_path / 'objects', monkeypatch) if store == 'local' else _fake_store(storage)
+    monkeypatch.setattr(Config, 'SNAPSHOT_CHUNK_SIZE', 4096)
+    for setting in ('SNAPSHOT_KEEP_HOURLY', 'SNAPSHOT_KEEP_DAILY', 'SNAPSHOT_KEEP_WEEKLY'):
+        monkeypatch.setattr(Config, setting, 0)
+    monkeypatch.setattr(Config, 'SNAPSHOT_KEEP_LAST', 1)
+
+    def chunks():
+        return {name for name in names() if '/snapshots/chunks/' in name}
+
+    # A chunk of a snapshot another process is still writing: uploaded, but no manifest yet
+    pending = snapshots.chunk_object('ab' * 32)
+    assert submit_upload(b'chunk', pending).result()
+    path = tmp_path / 'file.bin'
+    path.write_bytes(os.urandom(20000))
+    first = snapshots.write_snapshot([(str(path), {})], reason='first')
+    path.write_bytes(os.urandom(20000))
+    snapshots.write_snapshot([(str(path), {})], reason='second')
+    assert [manifest['reason'] for manifest in snapshots.list_snapshots()] == ['second']
+    expired = {snapshots.chunk_object(digest) for digest in first['files'][0]['chunks']}
+    assert pending in chunks() and expired <= chunks()
+
+    age(datetime.timedelta(seconds=Config.SNAPSHOT_GC_GRACE + 1))
+    path.write_bytes(os.urandom(20000))
+    latest = snapshots.write_snapshot([(str(path), {})], reason='third')
+    assert chunks() == {snapshots.chunk_object(digest) for digest in latest['files'][0]['chunks']}
+
+    snapshots.restore_file(latest['files'][0], str(tmp_path / 'restored.bin'))
+    assert (tmp_path / 'restored.bin').read_bytes() == path.read_bytes()
@@ -0,0 +1,48 @@
+"""
+Statement Signatures - Uploads are matched to a saved account by header, and OFX files by their account id
+"""
+from benchmarks.synthetic import DEFAULT_MAPPINGS, UploadedCSV, generate_upload
+from services.input_service import InputService
+from utils import statement_readers
+
+
+def _ofx(account_id, name, first=1):
+    account = f'<BANKACCTFROM><BANKID>1<ACCTID>{account_id}<ACCTTYPE>CHECKING</BANKACCTFROM>' if account_id else ''
+    transactions = ''.join(
+        f'<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>202401{i:02d}<TRNAMT>-{i}.25<FITID>{i}<NAME>CAFE {i}</STMTTRN>\n'
+        for i in range(first, first + 5)
+    )
+    body = (f'OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><CURDEF>CAD{account}'
+            f'<BANKTRANLIST>{transactions}</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>')
+    return UploadedCSV(body.encode(), name)
+
+
+def _save_ofx_account(account, upload):
+    InputService.save_mappings_and_import(account, InputService.suggested_mappings(upload), upload, 'gail')
+
+
+def test_ofx_statements_are_matched_by_account_id():
+    _save_ofx_account('Chequing', _ofx('12345', 'chequing.ofx'))
+    _save_ofx_account('Savings', _ofx('67890', 'savings.qfx'))
+
+    assert statement_readers.read_account_id(_ofx('12345', 'next.ofx')) == '12345'
+    assert InputService.detect_mapping(_ofx('12345', 'next.ofx', first=10))['account'] == 'Chequing'
+    assert InputService.detect_mapping(_ofx('67890', 'next.qfx', first=10))['account'] == 'Savings'
+    # Another bank's OFX file has the same columns but is not offered for either account
+    assert InputService.detect_mapping(_ofx('55555', 'other.ofx')) is None
+    assert InputService.detect_accounts([_ofx('67890', 'a.qfx'), _ofx('55555', 'b.ofx')]) == ['Savings', None]
+
+
+def test_ofx_statements_without_an_account_id_need_an_account():
+    upload = _ofx(None, 'anonymous.ofx')
+    assert InputService.file_signature(upload) is None
+    _save_ofx_account('Chequing', upload)
+
+    assert InputService.detect_mapping(_ofx(None, 'again.ofx', first=10)) is None
+    assert InputService.detect_accounts([_ofx(None, 'again.ofx', first=10)]) == [None]
+
+
+def test_csv_statements_are_still_matched_by_header():
+    InputService.save_mappings_and_import('Visa', dict(DEFAULT_MAPPINGS), generate_upload(20, seed=1), 'gail')
+    assert InputService.detect_mapping(generate_upload(30, seed=2))['account'] == 'Visa'
+    assert InputService.detect_accounts([generate_upload(30, seed=2)]) == ['Visa']
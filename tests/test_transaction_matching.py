@@ -0,0 +1,86 @@
+"""
+Transaction Matching - Transfers between accounts and re-exported near-duplicates found by sort-merge
+"""
+import pandas as pd
+
+from utils.transaction_matching import (
+    DUPLICATE,
+    TRANSFER,
+    find_near_duplicates,
+    find_transfers,
+    match_transactions,
+)
+
+
+def _frame(rows):
+    """Rows of (id, account, post_date, amount_cents[, merchant_name, date])"""
+    records = []
+    for row in rows:
+        row_id, account, post_date, amount_cents, *rest = row
+        records.append({
+            'id': row_id, 'account': account, 'date': rest[1] if len(rest) > 1 else post_date, 'post_date': post_date,
+            'merchant_name': rest[0] if rest else 'PAYMENT', 'description': '', 'amount_cents': amount_cents,
+        })
+    return pd.DataFrame(records)
+
+
+def test_transfer_pairs_an_outflow_with_the_inflow_in_another_account():
+    df = _frame([
+        (1, 'Chequing', '2024-01-10', -50000),
+        (2, 'Visa', '2024-01-12', 50000),
+        (3, 'Chequing', '2024-01-11', 50000),  # same account as the outflow
+        (4, 'Savings', '2024-01-11', -1999),
+    ])
+    assert find_transfers(df, window_days=3) == {1: 2, 2: 1}
+
+
+def test_transfer_window_and_amount_edges():
+    df = _frame([
+        (1, 'Chequing', '2024-03-01', -10000),
+        (2, 'Visa', '2024-03-04', 10000),  # 3 days later: inside the window
+        (3, 'Chequing', '2024-03-01', -20000),
+        (4, 'Visa', '2024-03-05', 20000),  # 4 days later: outside
+        (5, 'Chequing', '2024-03-01', -30000),
+        (6, 'Visa', '2024-03-01', 30001),  # a cent apart: amounts must be equal
+    ])
+    assert find_transfers(df, window_days=3) == {1: 2, 2: 1}
+    assert find_transfers(df, window_days=4) == {1: 2, 2: 1, 3: 4, 4: 3}
+
+
+def test_each_transaction_is_matched_at_most_once():
+    df = _frame([
+        (1, 'Chequing', '2024-05-01', -7500),
+        (2, 'Visa', '2024-05-02', 7500),
+        (3, 'Amex', '2024-05-02', 7500),
+        (4, 'Savings', '2024-05-03', -7500),
+        (5, 'Savings', '2024-05-03', -7500),
+    ])
+    matches = find_transfers(df, window_days=3)
+    assert len(matches) == 4 and len(set(matches.values())) == 4
+    assert all(matches[matches[row_id]] == row_id for row_id in matches)
+    # The earliest inflow pairs with the earliest outflow
+    assert matches[1] == 2
+    assert sorted(set(df['id']) - set(matches)) == [5]
+
+
+def test_near_duplicates_repeat_a_row_with_a_shifted_post_date():
+    df = _frame([
+        (1, 'Visa', '2024-02-03', -1250, 'STARBUCKS #12', '2024-02-01'),
+        (2, 'Visa', '2024-02-05', -1250, 'Starbucks #40', '2024-02-01'),  # re-exported two days later
+        (3, 'Visa', '2024-02-09', -1250, 'STARBUCKS #12', '2024-02-01'),  # six days later
+        (4, 'Amex', '2024-02-03', -1250, 'STARBUCKS #12', '2024-02-01'),  # another account
+        (5, 'Visa', '2024-02-03', -1250, 'STARBUCKS #12', '2024-02-02'),  # another purchase day
+    ])
+    assert find_near_duplicates(df, window_days=3) == {2: 1}
+
+
+def test_duplicates_are_not_paired_as_transfers():
+    df = _frame([
+        (1, 'Chequing', '2024-04-01', -40000),
+        (2, 'Chequing', '2024-04-02', -40000, 'PAYMENT', '2024-04-01'),
+        (3, 'Visa', '2024-04-02', 40000),
+        (4, 'Visa', '2024-06-02', -100),
+    ])
+    result = match_transactions(df, window_days=3).set_index('id')
+    assert result['match_type'].to_dict() == {1: TRANSFER, 2: DUPLICATE, 3: TRANSFER, 4: ''}
+    assert result['match_id'].iloc[:3].tolist() == [3, 1, 1] and pd.isna(result.loc[4, 'match_id'])
@@ -0,0 +1,172 @@
+"""
+Analytics Storage - Optional columnar DuckDB mirror of Detail for fast aggregations.
+Enabled with ANALYTICS_ENGINE=duckdb; requires the `analytics` extra (duckdb).
+"""
+import os
+import threading
+
+import pandas as pd
+
+from config.configure import Config
+from utils.output_log import logger
+
+MIRROR_COLUMNS = ['id', 'username', 'account', 'date', 'post_date', 'category', 'original_category',
+                  'merchant_name', 'description', 'currency', 'amount', 'amount_cents', 'match_type',
+                  'canonical_merchant']
+GROUP_BY_COLUMNS = {
+    'account': 'account',
+    'category': 'category',
+    'merchant_name': 'merchant_name',
+    'canonical_merchant': 'canonical_merchant',
+    'currency': 'currency',
+    'month': "strftime(txn_date, '%Y-%m')",
+    'year': "strftime(txn_date, '%Y')",
+}
+
+_lock = threading.Lock()
+_connection = None
+
+
+def is_enabled() -> bool:
+    # The mirror is keyed by Detail.id, which is only unique within one database
+    return Config.ANALYTICS_ENGINE == 'duckdb' and Config.STORAGE_MODE != 'sharded'
+
+
+def _get_connection():
+    global _connection
+    if _connection is None:
+        import duckdb
+        os.makedirs(os.path.dirname(Config.ANALYTICS_DB_PATH) or '.', exist_ok=True)
+        _connection = duckdb.connect(Config.ANALYTICS_DB_PATH)
+        columns = {row[0] for row in _connection.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = 'detail'"
+        ).fetchall()}
+        if columns and not {'amount_cents', 'match_type', 'canonical_merchant'} <= columns:
+            # Mirrors from older schemas are dropped; sync_analytics_mirror() rebuilds them
+            _connection.execute("DROP TABLE detail")
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS detail (
+                id BIGINT, username VARCHAR, account VARCHAR, date VARCHAR, post_date VARCHAR,
+                txn_date DATE, category VARCHAR, original_category VARCHAR, merchant_name VARCHAR,
+                description VARCHAR, currency VARCHAR, amount DOUBLE, amount_cents BIGINT, match_type VARCHAR,
+                canonical_merchant VARCHAR
+            )
+        """)
+        logger.info(f"Analytics mirror opened at {Config.ANALYTICS_DB_PATH}")
+    return _connection
+
+
+def parse_dates(df: pd.DataFrame) -> pd.Series:
+    """Transaction date from post_date, falling back to date; unparseable values become NaT"""
+    post_date = pd.to_datetime(df['post_date'], format='mixed', errors='coerce')
+    date = pd.to_datetime(df['date'], format='mixed', errors='coerce')
+    return post_date.fillna(date)
+
+
+def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+    frame = df[MIRROR_COLUMNS].copy()
+    for col in ['username', 'account', 'date', 'post_date', 'category', 'original_category',
+                'merchant_name', 'description', 'currency', 'match_type', 'canonical_merchant']:
+        frame[col] = frame[col].astype('object').where(frame[col].notna(), None)
+    frame['txn_date'] = parse_dates(frame)
+    return frame
+
+
+def mirror_insert(df: pd.DataFrame):
+    """Append newly committed Detail rows"""
+    if df.empty:
+        return
+    frame = _prepare(df)
+    with _lock:
+        con = _get_connection()
+        con.register('incoming', frame)
+        try:
+            con.execute("""
+                INSERT INTO detail SELECT id, username, account, date, post_date, txn_date, category,
+                    original_category, merchant_name, description, currency, amount, amount_cents, match_type,
+                    canonical_merchant FROM incoming
+            """)
+        finally:
+            con.unregister('incoming')
+    logger.debug(f"Mirrored {len(frame)} new Detail rows")
+
+
+def mirror_recategorize(orig_cat, merchant, description, target_category):
+    """Apply a category mapping to the mirrored rows matching its triple"""
+    with _lock:
+        _get_connection().execute("""
+            UPDATE detail SET category = ?
+            WHERE original_category IS NOT DISTINCT FROM ?
+              AND merchant_name IS NOT DISTINCT FROM ?
+              AND description IS NOT DISTINCT FROM ?
+        """, [target_category, orig_cat, merchant, description])
+
+
+def mirror_delete(ids: list):
+    """Remove deleted Detail rows from the mirror"""
+    if not ids:
+        return
+    with _lock:
+        con = _get_connection()
+        con.register('deleted', pd.DataFrame({'id': ids}))
+        try:
+            con.execute("DELETE FROM detail WHERE id IN (SELECT id FROM deleted)")
+        finally:
+            con.unregister('deleted')
+
+
+def mirror_set_matches(df: pd.DataFrame):
+    """Copy changed transfer/duplicate flags (id, match_type) to the mirror"""
+    if df.empty:
+        return
+    with _lock:
+        con = _get_connection()
+        con.register('matches', df[['id', 'match_type']])
+        try:
+            con.execute("UPDATE detail SET match_type = matches.match_type FROM matches WHERE detail.id = matches.id")
+        finally:
+            con.unregister('matches')
+
+
+def mirror_state() -> tuple:
+    """(row count, max id) of the mirror, used to detect drift from SQLite"""
+    with _lock:
+        return tuple(_get_connection().execute("SELECT count(*), coalesce(max(id), 0) FROM detail").fetchone())
+
+
+def rebuild_mirror(frames):
+    """Replace the mirror contents with the given iterable of Detail DataFrames"""
+    with _lock:
+        con = _get_connection()
+        con.execute("DELETE FROM detail")
+    total = 0
+    for df in frames:
+        mirror_insert(df)
+        total += len(df)
+    logger.info(f"Rebuilt analytics mirror with {total} rows")
+
+
+def aggregate(username: str, group_by: list, start_date=None, end_date=None, accounts: list | None = None) -> pd.DataFrame:
+    """Group-by totals for one user answered from the columnar mirror"""
+    keys = [GROUP_BY_COLUMNS[col] for col in group_by]
+    select = ', '.join(f"{expr} AS {col}" for expr, col in zip(keys, group_by))
+    where = ["username = ?", "coalesce(match_type, '') = ''"]
+    params = [username]
+    # Whole months, like the SQLite path
+    if start_date:
+        where.append("strftime(txn_date, '%Y-%m') >= ?")
+        params.append(pd.Timestamp(start_date).strftime('%Y-%m'))
+    if end_date:
+        where.append("strftime(txn_date, '%Y-%m') <= ?")
+        params.append(pd.Timestamp(end_date).strftime('%Y-%m'))
+    if accounts:
+        where.append(f"account IN ({', '.join('?' for _ in accounts)})")
+        params.extend(accounts)
+    query = f"""
+        SELECT {select + ', ' if select else ''}count(*) AS transactions,
+            coalesce(sum(amount_cents), 0) / 100.0 AS total_amount
+        FROM detail WHERE {' AND '.join(where)}
+        {'GROUP BY ' + ', '.join(group_by) + ' ORDER BY ' + ', '.join(group_by) if group_by else ''}
+    """
+    with _lock:
+        return _get_connection().execute(query, params).df()
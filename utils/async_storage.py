@@ -0,0 +1,107 @@
+"""
+Async Storage - asyncio counterparts of the SQLite and object-store helpers for API servers and workers.
+Reads run on an aiosqlite engine; writes and object-store calls reuse the synchronous functions on a
+bounded thread pool, so journaling, mirroring and DB uploads behave exactly as in the app.
+Requires the `api` extra (aiosqlite, sqlalchemy[asyncio]).
+"""
+import asyncio
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+
+from config.configure import Config
+from utils import minio_storage, sqlite_storage
+from utils.output_log import logger
+
+_executor = ThreadPoolExecutor(max_workers=Config.ASYNC_IO_WORKERS, thread_name_prefix='async-io')
+_engines = OrderedDict()  # database URL -> aiosqlite engine; main.db plus recently used user shards
+_engine_lock = asyncio.Lock()
+
+
+async def run_sync(func, *args, **kwargs):
+    """Run a blocking storage or service call on the async I/O pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def get_engine(username=None):
+    """
+    aiosqlite engine on the file the sync engine uses (the user's shard when a username is given in
+    sharded mode); a follower's snapshot swap changes the URL, so a new engine is created
+    """
+    if username is not None and sqlite_storage.is_sharded():
+        # Opening a shard may download it
+        sync_engine = await run_sync(sqlite_storage.shard_engine, username)
+    else:
+        sync_engine = sqlite_storage.engine
+    url = sync_engine.url.set(drivername='sqlite+aiosqlite')
+    async with _engine_lock:
+        if url in _engines:
+            _engines.move_to_end(url)
+            return _engines[url]
+        from sqlalchemy.ext.asyncio import create_async_engine
+        _engines[url] = create_async_engine(url, echo=False)
+        logger.debug(f"Async engine bound to {url.database}")
+        while len(_engines) > Config.SHARD_CACHE_SIZE + 1:
+            _, evicted = _engines.popitem(last=False)
+            await evicted.dispose()
+        return _engines[url]
+
+
+async def read_frame(query, params, dtypes: dict, username=None, partitions=()):
+    """Async read_frame: the same typed DataFrame, without blocking the event loop on SQLite"""
+    engine = await get_engine(username)
+    # Fetching a partition may download it
+    paths = [await run_sync(sqlite_storage.partition_file, username, partition) for partition in partitions]
+    attached = []
+    async with engine.connect() as conn:
+        try:
+            for partition, path in zip(partitions, paths):
+                await conn.exec_driver_sql(f"ATTACH DATABASE ? AS p{partition.year}", (path,))
+                attached.append(partition.year)
+            result = await conn.exec_driver_sql(query, tuple(params))
+            rows = result.fetchall()
+        finally:
+            for year in attached:
+                await conn.exec_driver_sql(f"DETACH DATABASE p{year}")
+    return sqlite_storage.frame_from_rows(rows, dtypes)
+
+
+async def read_detail_frames(query, params, dtypes: dict, username=None, partitions=()) -> list:
+    """Async read_detail_frames: one typed DataFrame per batch of attached partitions"""
+    return [
+        await read_frame(query.format(source=sqlite_storage.detail_source(batch, hot=number == 0)), params, dtypes,
+                         username, batch)
+        for number, batch in enumerate(sqlite_storage.partition_batches(partitions))
+    ]
+
+
+async def get_user(username):
+    logger.debug(f"Fetching user: {username}")
+    from sqlalchemy.ext.asyncio import AsyncSession
+    async with AsyncSession(await get_engine(), expire_on_commit=False) as session:
+        result = await session.execute(select(sqlite_storage.User).where(sqlite_storage.User.username == username))
+        return result.scalars().first()
+
+
+# Object store
+async def upload_bytes(data: bytes, object_name: str) -> bool:
+    return await run_sync(minio_storage.upload_bytes, data, object_name)
+
+
+async def download_bytes(object_name: str):
+    return await run_sync(minio_storage.download_bytes, object_name)
+
+
+async def object_exists(object_name: str) -> bool:
+    return await run_sync(minio_storage.object_exists, object_name)
+
+
+async def upload_db() -> bool:
+    return await run_sync(minio_storage.upload_db)
+
+
+async def db_etag():
+    return await run_sync(minio_storage.db_etag)
@@ -0,0 +1,21 @@
+"""
+Category Features - Terms describing a transaction for the category suggestion model
+"""
+from utils.merchant_names import normalize_merchant
+
+
+def category_terms(original_category, merchant_name, description) -> list:
+    """
+    Bag of terms for one (original_category, merchant_name, description) group: the bank's own
+    category, merchant and description words, and character trigrams of the merchant key so that
+    spelling variants ("starbucks" / "starbuck") still share most of their features.
+    """
+    terms = []
+    if isinstance(original_category, str) and original_category.strip():
+        terms.append('oc:' + original_category.strip().lower())
+    merchant = normalize_merchant(merchant_name)
+    terms.extend('m:' + word for word in merchant.split())
+    terms.extend('d:' + word for word in normalize_merchant(None, description).split())
+    key = f" {merchant or normalize_merchant(None, description)} "
+    terms.extend('3:' + key[i:i + 3] for i in range(len(key) - 2))
+    return terms
@@ -0,0 +1,95 @@
+"""
+Local Object Store - Filesystem stand-in for MinIO, shared by every process on one machine.
+Enabled with OBJECT_STORE=local; objects live under LOCAL_OBJECT_STORE_PATH/{bucket}/{object_name}.
+"""
+import datetime
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+
+class LocalObject:
+    """Stat result with the attributes the app reads from minio objects"""
+
+    def __init__(self, object_name: str, path: str):
+        with open(path, 'rb') as f:
+            self.etag = hashlib.md5(f.read()).hexdigest()
+        self.object_name = object_name
+        self.size = os.path.getsize(path)
+        self.last_modified = datetime.datetime.fromtimestamp(os.path.getmtime(path), datetime.UTC)
+
+
+class LocalResponse(io.BytesIO):
+    """Response body returned by LocalObjectStore.get_object"""
+
+    def release_conn(self):
+        pass
+
+
+class LocalObjectStore:
+    """Implements the subset of minio.Minio used by the app on top of a directory"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, bucket_name, object_name) -> str:
+        return os.path.join(self.root, bucket_name, *object_name.split('/'))
+
+    def _existing_path(self, bucket_name, object_name) -> str:
+        path = self._path(bucket_name, object_name)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"{bucket_name}/{object_name}")
+        return path
+
+    def _write(self, bucket_name, object_name, data: bytes) -> LocalObject:
+        path = self._path(bucket_name, object_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers in other processes never see a partial object
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return LocalObject(object_name, path)
+
+    def fput_object(self, bucket_name, object_name, file_path, **kwargs):
+        with open(file_path, 'rb') as f:
+            return self._write(bucket_name, object_name, f.read())
+
+    def put_object(self, bucket_name, object_name, data, length, **kwargs):
+        return self._write(bucket_name, object_name, data.read(length))
+
+    def fget_object(self, bucket_name, object_name, file_path, **kwargs):
+        source = self._existing_path(bucket_name, object_name)
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        temp_path = file_path + '.part'
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, file_path)
+        return LocalObject(object_name, file_path)
+
+    def get_object(self, bucket_name, object_name, **kwargs):
+        with open(self._existing_path(bucket_name, object_name), 'rb') as f:
+            return LocalResponse(f.read())
+
+    def stat_object(self, bucket_name, object_name, **kwargs):
+        return LocalObject(object_name, self._existing_path(bucket_name, object_name))
+
+    def remove_object(self, bucket_name, object_name, **kwargs):
+        try:
+            os.remove(self._path(bucket_name, object_name))
+        except FileNotFoundError:
+            pass
+
+    def list_objects(self, bucket_name, prefix=None, recursive=False, **kwargs):
+        base = os.path.join(self.root, bucket_name)
+        objects = []
+        for directory, _, files in os.walk(base):
+            for name in files:
+                if name.endswith('.part'):
+                    continue
+                path = os.path.join(directory, name)
+                object_name = os.path.relpath(path, base).replace(os.sep, '/')
+                if not prefix or object_name.startswith(prefix):
+                    objects.append(LocalObject(object_name, path))
+        return sorted(objects, key=lambda o: o.object_name)
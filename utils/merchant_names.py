@@ -0,0 +1,105 @@
+"""
+Merchant Names - Normalization of merchant strings into stable grouping keys and canonical merchants
+"""
+import re
+import zlib
+
+import numpy as np
+
+_REFERENCE = re.compile(r'[#*]\S*')  # store numbers and reference codes such as "#1234" or "*5A3F1"
+_DIGITS = re.compile(r'\d+')
+_PUNCTUATION = re.compile(r'[^\w&]+')
+# Card processor prefixes put the merchant after the '*', e.g. "SQ *BLUE BOTTLE" or "TST* KINKAKU"
+_PROCESSOR_PREFIX = re.compile(r'^(sq|tst|sp|pp|paypal|py|dd|ic|sumup)\s*\*\s*')
+_DOMAIN = re.compile(r'\bwww\.|\.(com|ca|net|org|io)\b')
+
+MERCHANT_ALIASES = {'amzn': 'amazon', 'amz': 'amazon', 'mcdonald': 'mcdonalds', 'wal': 'walmart'}
+NOISE_WORDS = {'pos', 'purchase', 'contactless', 'online', 'recurring', 'mktp', 'marketplace',
+               'inc', 'ltd', 'llc', 'corp'}
+# Trailing province, state and country codes that banks append after the merchant
+REGION_CODES = {'on', 'qc', 'bc', 'ab', 'mb', 'sk', 'ns', 'nb', 'nl', 'pe', 'yt', 'nt', 'nu',
+                'ca', 'can', 'us', 'usa', 'ny', 'wa', 'tx', 'fl', 'il', 'ma', 'nj'}
+
+NUM_PERM = 64  # MinHash signature length
+BANDS = 16  # LSH bands of NUM_PERM // BANDS rows; candidate pairs share at least one band
+CLUSTER_THRESHOLD = 0.5  # estimated trigram Jaccard similarity at which two merchants are merged
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240101)
+_HASH_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_HASH_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+
+def normalize_merchant(merchant_name, description=None) -> str:
+    """
+    Grouping key for a merchant: lowercase words with store numbers, reference codes and punctuation
+    removed. Falls back to the description when the statement has no merchant name.
+    """
+    text = merchant_name if isinstance(merchant_name, str) and merchant_name.strip() else description
+    if not isinstance(text, str):
+        return ''
+    text = _REFERENCE.sub(' ', text.lower())
+    text = _PUNCTUATION.sub(' ', _DIGITS.sub(' ', text))
+    return ' '.join(text.replace('_', ' ').split())
+
+
+def clean_merchant(raw_name) -> str:
+    """
+    normalize_merchant() plus cleaning rules for statement noise: processor prefixes, web domains,
+    known abbreviations, filler words and trailing region codes ("AMZN Mktp CA*1A2B3" -> "amazon")
+    """
+    if not isinstance(raw_name, str):
+        return ''
+    text = _DOMAIN.sub(' ', _PROCESSOR_PREFIX.sub('', raw_name.strip().lower()))
+    words = [MERCHANT_ALIASES.get(word, word) for word in normalize_merchant(text).split()]
+    words = [word for word in words if word not in NOISE_WORDS]
+    while len(words) > 1 and words[-1] in REGION_CODES:
+        words.pop()
+    return ' '.join(words)
+
+
+def display_name(merchant_key: str) -> str:
+    """Canonical merchant name shown to users for a cleaned key"""
+    return ' '.join(word.upper() if len(word) <= 3 and '&' in word else word.capitalize()
+                    for word in merchant_key.split())
+
+
+def minhash_signatures(keys: list) -> np.ndarray:
+    """(len(keys), NUM_PERM) MinHash signatures over the character trigrams of each key"""
+    signatures = np.empty((len(keys), NUM_PERM), dtype=np.uint64)
+    for i, key in enumerate(keys):
+        padded = f' {key} '
+        shingles = np.fromiter(
+            {zlib.crc32(padded[j:j + 3].encode()) % _PRIME for j in range(max(1, len(padded) - 2))}, dtype=np.uint64
+        )
+        signatures[i] = ((np.outer(shingles, _HASH_A) + _HASH_B) % _PRIME).min(axis=0)
+    return signatures
+
+
+def cluster_merchants(keys: list) -> np.ndarray:
+    """
+    Cluster label per key. LSH banding proposes candidate pairs without comparing every pair;
+    candidates whose signatures agree on at least CLUSTER_THRESHOLD of positions are merged.
+    """
+    parent = np.arange(len(keys))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if len(keys) < 2:
+        return parent
+    signatures = minhash_signatures(keys)
+    rows = NUM_PERM // BANDS
+    for band in range(BANDS):
+        buckets = {}
+        for i, value in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+            buckets.setdefault(value.tobytes(), []).append(i)
+        for members in buckets.values():
+            first = members[0]
+            for other in members[1:]:
+                root_first, root_other = find(first), find(other)
+                if root_first != root_other and (signatures[first] == signatures[other]).mean() >= CLUSTER_THRESHOLD:
+                    parent[root_other] = root_first
+    return np.array([find(i) for i in range(len(keys))])
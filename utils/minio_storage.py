@@ -1,27 +1,176 @@
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from minio import Minio
+from minio.error import MinioException
+from sqlalchemy.exc import SQLAlchemyError
+from urllib3.exceptions import HTTPError
+
 from config.configure import Config
 from utils.output_log import logger
 
 
-client = Minio(
-    Config.MINIO_ENDPOINT,
-    access_key=Config.MINIO_ACCESS_KEY,
-    secret_key=Config.MINIO_SECRET_KEY,
-    secure=True
-)
+def _create_client():
+    if Config.OBJECT_STORE == 'local':
+        from utils.local_object_store import LocalObjectStore
+        return LocalObjectStore(Config.LOCAL_OBJECT_STORE_PATH)
+    return Minio(
+        Config.MINIO_ENDPOINT,
+        access_key=Config.MINIO_ACCESS_KEY,
+        secret_key=Config.MINIO_SECRET_KEY,
+        secure=True
+    )
+
+
+client = _create_client()
+
+# Errors a call to the object store can raise: S3 errors, connection failures, and local file errors
+STORE_ERRORS = (MinioException, HTTPError, OSError)
 
-def download_db():
+# Raw upload archival runs here so imports never wait on the object store
+_archive_executor = ThreadPoolExecutor(max_workers=Config.ARCHIVE_WORKERS, thread_name_prefix='archive')
+_pending_lock = threading.Lock()
+_pending = set()
+
+def download_db(local_path: str | None = None):
+    """Download main.db (to LOCAL_DB_PATH by default); returns its ETag, or None on failure"""
+    local_path = local_path or Config.LOCAL_DB_PATH
     try:
-        logger.info(f"Downloading DB from {Config.MINIO_BUCKET}:/{Config.DB_S3_PATH} to {Config.LOCAL_DB_PATH}")
-        client.fget_object(Config.MINIO_BUCKET, Config.DB_S3_PATH + "/main.db", Config.LOCAL_DB_PATH)
+        logger.info(f"Downloading DB from {Config.MINIO_BUCKET}:/{Config.DB_S3_PATH} to {local_path}")
+        obj = client.fget_object(Config.MINIO_BUCKET, Config.DB_S3_PATH + "/main.db", local_path)
         logger.info("Database downloaded successfully.")
-    except Exception as e:
+        return obj.etag
+    except STORE_ERRORS as e:
         logger.error(f"Failed to download DB: {e}")
+        return None
+
+
+def db_etag():
+    """ETag of the current main.db in the bucket, or None if it cannot be read"""
+    try:
+        return client.stat_object(Config.MINIO_BUCKET, Config.DB_S3_PATH + "/main.db").etag
+    except STORE_ERRORS as e:
+        logger.debug(f"Could not stat DB: {e}")
+        return None
 
 
 def upload_file(local_path: str, object_name: str):
     try:
         client.fput_object(Config.MINIO_BUCKET, object_name, local_path)
         logger.info(f"Uploaded {local_path} to {object_name} in MinIO bucket {Config.MINIO_BUCKET}")
-    except Exception as e:
+        return True
+    except STORE_ERRORS as e:
         logger.error(f"Failed to upload file: {e}")
+        return False
+
+
+def upload_db():
+    """Upload main.db, unless this instance may not write: a follower's or standby writer's copy is stale"""
+    from utils import replication  # replication builds on this module
+    if not replication.writes_allowed():
+        logger.warning("Not uploading the DB: this instance does not hold the writer lease")
+        return False
+    return upload_file(Config.LOCAL_DB_PATH, Config.DB_S3_PATH + "/main.db")
+
+
+def download_file(object_name: str, local_path: str):
+    """Download an object to local_path; returns its ETag, or None if it does not exist"""
+    try:
+        return client.fget_object(Config.MINIO_BUCKET, object_name, local_path).etag
+    except STORE_ERRORS as e:
+        if object_exists(object_name):
+            raise
+        logger.debug(f"No object {object_name} to download: {e}")
+        return None
+
+
+def download_bytes(object_name: str):
+    """Object contents, or None if it does not exist or cannot be read"""
+    try:
+        response = client.get_object(Config.MINIO_BUCKET, object_name)
+    except STORE_ERRORS:
+        return None
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def remove_object(object_name: str):
+    try:
+        client.remove_object(Config.MINIO_BUCKET, object_name)
+    except STORE_ERRORS as e:
+        logger.error(f"Failed to remove {object_name}: {e}")
+
+
+def list_objects(prefix: str) -> list:
+    """Names of the objects under prefix, recursively"""
+    return [obj.object_name for obj in client.list_objects(Config.MINIO_BUCKET, prefix=prefix, recursive=True)]
+
+
+def list_object_times(prefix: str) -> dict:
+    """Last-modified time of each object under prefix, recursively"""
+    return {obj.object_name: obj.last_modified
+            for obj in client.list_objects(Config.MINIO_BUCKET, prefix=prefix, recursive=True)}
+
+
+def object_exists(object_name: str) -> bool:
+    try:
+        client.stat_object(Config.MINIO_BUCKET, object_name)
+        return True
+    except STORE_ERRORS:
+        return False
+
+
+def upload_bytes(data: bytes, object_name: str) -> bool:
+    """Upload from memory, retrying with exponential backoff"""
+    for attempt in range(Config.ARCHIVE_RETRIES + 1):
+        try:
+            client.put_object(Config.MINIO_BUCKET, object_name, io.BytesIO(data), len(data))
+            logger.info(f"Uploaded {len(data)} bytes to {object_name} in MinIO bucket {Config.MINIO_BUCKET}")
+            return True
+        except STORE_ERRORS as e:
+            if attempt == Config.ARCHIVE_RETRIES:
+                logger.error(f"Failed to upload {object_name} after {attempt + 1} attempts: {e}")
+                return False
+            delay = Config.ARCHIVE_BACKOFF * 2 ** attempt
+            logger.warning(f"Upload of {object_name} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def submit_upload(data: bytes, object_name: str, on_success=None):
+    """
+    Upload bytes on the background archive executor and return the Future. Objects that already
+    exist are not uploaded again. on_success runs in the worker thread once the object is stored.
+    """
+    def task():
+        if not (object_exists(object_name) or upload_bytes(data, object_name)):
+            return False
+        if on_success:
+            try:
+                on_success()
+            except (SQLAlchemyError, RuntimeError) as e:
+                logger.error(f"Post-upload step for {object_name} failed: {e}")
+        return True
+
+    future = _archive_executor.submit(task)
+    with _pending_lock:
+        _pending.add(future)
+    future.add_done_callback(_discard_pending)
+    return future
+
+
+def _discard_pending(future):
+    with _pending_lock:
+        _pending.discard(future)
+
+
+def wait_for_uploads(timeout: float | None = None):
+    """Block until every background upload submitted so far has finished"""
+    with _pending_lock:
+        futures = list(_pending)
+    for future in futures:
+        future.exception(timeout=timeout)
@@ -0,0 +1,171 @@
+"""
+Replication - One writer and any number of read-only followers sharing main.db through the object store.
+
+DB_ROLE=writer instances compete for a lease object stored next to main.db; only the lease holder
+writes and uploads. DB_ROLE=follower instances open downloaded snapshots read-only and hot-swap them
+whenever the ETag of main.db changes. The default, standalone, keeps single-instance behaviour.
+"""
+import atexit
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from config.configure import Config
+from utils import minio_storage
+from utils.output_log import logger
+
+
+class ReadOnlyReplicaError(RuntimeError):
+    """Raised when this instance may not write to the database"""
+
+
+# Failures a lease renewal or snapshot refresh can hit; the background loops log them and retry
+_SYNC_ERRORS = (*minio_storage.STORE_ERRORS, ValueError, KeyError, sqlite3.Error, SQLAlchemyError)
+
+
+_state = {'lease_valid_until': 0.0, 'etag': None, 'path': None}
+_stop = threading.Event()
+
+
+def instance_id() -> str:
+    return Config.INSTANCE_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _lease_object() -> str:
+    return Config.DB_S3_PATH + "/writer.lease"
+
+
+def writes_allowed() -> bool:
+    if Config.DB_ROLE == 'follower':
+        return False
+    if Config.DB_ROLE == 'writer':
+        return time.time() < _state['lease_valid_until']
+    return True
+
+
+def check_writable():
+    if Config.DB_ROLE == 'follower':
+        raise ReadOnlyReplicaError("This instance is a read-only follower; make changes on the writer instance.")
+    if not writes_allowed():
+        raise ReadOnlyReplicaError("This instance does not hold the writer lease; changes are disabled.")
+
+
+def _read_lease() -> dict:
+    data = minio_storage.download_bytes(_lease_object())
+    return json.loads(data) if data else None
+
+
+def acquire_lease() -> bool:
+    """Take or renew the writer lease unless another instance holds an unexpired one"""
+    now = time.time()
+    lease = _read_lease()
+    if lease and lease['owner'] != instance_id() and lease['expires_at'] > now:
+        _state['lease_valid_until'] = 0.0
+        logger.debug(f"Writer lease held by {lease['owner']} until {lease['expires_at']:.0f}")
+        return False
+    expires_at = now + Config.WRITER_LEASE_TTL
+    payload = json.dumps({'owner': instance_id(), 'expires_at': expires_at}).encode()
+    if not minio_storage.upload_bytes(payload, _lease_object()):
+        _state['lease_valid_until'] = 0.0
+        return False
+    # S3 has no compare-and-swap here; read back so the loser of a simultaneous takeover steps aside
+    lease = _read_lease()
+    held = bool(lease) and lease['owner'] == instance_id()
+    # Stop writing a renewal interval before the lease could be taken over
+    _state['lease_valid_until'] = expires_at - Config.WRITER_LEASE_TTL / 3 if held else 0.0
+    return held
+
+
+def release_lease():
+    lease = _read_lease()
+    if lease and lease['owner'] == instance_id():
+        minio_storage.remove_object(_lease_object())
+        logger.info("Released writer lease")
+    _state['lease_valid_until'] = 0.0
+
+
+def start_writer(on_acquire, on_standby=None) -> bool:
+    """
+    Acquire the writer lease and keep renewing it in the background. on_acquire runs whenever this
+    instance gains the lease, so it can load the newest main.db before writing; on_standby runs at
+    every renewal attempt while another instance holds it, so reads can follow the shared main.db.
+    """
+    held = acquire_lease()
+    if held:
+        logger.info(f"Instance {instance_id()} holds the writer lease")
+        on_acquire()
+    else:
+        logger.warning(f"Instance {instance_id()} is waiting for the writer lease; running read-only")
+        if on_standby:
+            on_standby()
+
+    def renew():
+        was_held = held
+        while not _stop.wait(Config.WRITER_LEASE_TTL / 3):
+            try:
+                now_held = acquire_lease()
+                if now_held and not was_held:
+                    logger.info(f"Instance {instance_id()} took over the writer lease")
+                    on_acquire()
+                elif was_held and not now_held:
+                    logger.error(f"Instance {instance_id()} lost the writer lease")
+                if not now_held and on_standby:
+                    on_standby()
+                was_held = now_held
+            except _SYNC_ERRORS as e:
+                logger.error(f"Writer lease renewal failed: {e}")
+
+    threading.Thread(target=renew, name='writer-lease', daemon=True).start()
+    atexit.register(release_lease)
+    return held
+
+
+def snapshot_etag():
+    """ETag of the snapshot this instance last loaded, or None before the first one"""
+    return _state['etag']
+
+
+def refresh_snapshot(on_snapshot) -> bool:
+    """Download main.db when its ETag changed and hand the new file to on_snapshot(path)"""
+    etag = minio_storage.db_etag()
+    if etag is None or etag == _state['etag']:
+        return False
+    # Each snapshot gets its own file so sessions on the previous one finish undisturbed
+    path = f"{Config.LOCAL_DB_PATH}.{etag[:16]}"
+    etag = minio_storage.download_db(path)
+    if etag is None:
+        return False
+    on_snapshot(path)
+    previous = _state['path']
+    _state.update(etag=etag, path=path)
+    if previous and previous != path and os.path.exists(previous):
+        os.remove(previous)
+    logger.info(f"Loaded database snapshot {etag}")
+    return True
+
+
+def start_follower(on_snapshot) -> bool:
+    """Load the current snapshot, then poll for new ones every REPLICA_POLL_INTERVAL seconds"""
+    loaded = refresh_snapshot(on_snapshot)
+    if not loaded:
+        logger.error("Follower could not load a database snapshot; will keep polling")
+
+    def poll():
+        while not _stop.wait(Config.REPLICA_POLL_INTERVAL):
+            try:
+                refresh_snapshot(on_snapshot)
+            except _SYNC_ERRORS as e:
+                logger.error(f"Snapshot refresh failed: {e}")
+
+    threading.Thread(target=poll, name='replica-poll', daemon=True).start()
+    return loaded
+
+
+def stop():
+    """Stop the background lease or polling thread"""
+    _stop.set()
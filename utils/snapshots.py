@@ -0,0 +1,244 @@
+"""
+Snapshots - Point-in-time copies of the database files in the object store, with retention and restore.
+Each file is split into fixed-size chunks stored compressed under their SHA-256, so a new snapshot
+only uploads the chunks that changed since earlier ones. A JSON manifest per snapshot lists the chunks.
+
+Usage:
+    python -m utils.snapshots list [--user USERNAME]
+    python -m utils.snapshots create [--user USERNAME]
+    python -m utils.snapshots restore SNAPSHOT_ID [--user USERNAME]
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import threading
+import zlib
+from urllib.parse import quote
+
+from config.configure import Config
+from utils.minio_storage import (
+    download_bytes,
+    list_object_times,
+    list_objects,
+    remove_object,
+    submit_upload,
+    upload_bytes,
+)
+from utils.output_log import logger
+
+SNAPSHOT_ID_FORMAT = '%Y%m%dT%H%M%S%fZ'
+_lock = threading.Lock()  # snapshots, pruning and chunk garbage collection in this process run one at a time
+_latest = {}  # owner -> creation time of their newest snapshot, so due checks skip listing the bucket
+
+
+def _root() -> str:
+    return f"{Config.DB_S3_PATH}/snapshots"
+
+
+def manifest_prefix(owner=None) -> str:
+    """Manifests of main.db (owner None) or of a user's shard"""
+    return f"{_root()}/main/" if owner is None else f"{_root()}/users/{quote(owner, safe='')}/"
+
+
+def chunk_object(digest: str) -> str:
+    return f"{_root()}/chunks/{digest[:2]}/{digest}"
+
+
+def snapshot_time(snapshot_id: str) -> datetime.datetime:
+    return datetime.datetime.strptime(snapshot_id, SNAPSHOT_ID_FORMAT).replace(tzinfo=datetime.UTC)
+
+
+def _snapshot_ids(owner=None) -> list:
+    prefix = manifest_prefix(owner)
+    return sorted((name[len(prefix):-len('.json')] for name in list_objects(prefix) if name.endswith('.json')),
+                  reverse=True)
+
+
+def list_snapshots(owner=None) -> list:
+    """Manifests of an owner's snapshots, newest first"""
+    return [get_snapshot(snapshot_id, owner) for snapshot_id in _snapshot_ids(owner)]
+
+
+def get_snapshot(snapshot_id: str, owner=None) -> dict:
+    data = download_bytes(f"{manifest_prefix(owner)}{snapshot_id}.json")
+    if data is None:
+        raise FileNotFoundError(f"No snapshot {snapshot_id}")
+    return json.loads(data)
+
+
+def seconds_since_latest(owner=None) -> float:
+    """Age of the owner's newest snapshot in seconds; infinite when there is none"""
+    if owner not in _latest:
+        ids = _snapshot_ids(owner)
+        _latest[owner] = snapshot_time(ids[0]) if ids else None
+    if _latest[owner] is None:
+        return float('inf')
+    return (datetime.datetime.now(datetime.UTC) - _latest[owner]).total_seconds()
+
+
+def _store_file(path: str, known: set, uploads: list) -> dict:
+    """Chunk a file, queue uploads of the chunks not stored yet and return its manifest entry"""
+    chunks, stored_bytes = [], 0
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(Config.SNAPSHOT_CHUNK_SIZE):
+            file_hash.update(chunk)
+            digest = hashlib.sha256(chunk).hexdigest()
+            chunks.append(digest)
+            if digest in known:
+                continue
+            known.add(digest)
+            data = zlib.compress(chunk)
+            stored_bytes += len(data)
+            # Bound the compressed chunks held in memory by the upload queue
+            in_flight = Config.ARCHIVE_WORKERS * 4
+            if len(uploads) >= in_flight:
+                uploads[-in_flight].result()
+            uploads.append(submit_upload(data, chunk_object(digest)))
+    return {'size': os.path.getsize(path), 'sha256': file_hash.hexdigest(), 'chunks': chunks, 'stored_bytes': stored_bytes}
+
+
+def write_snapshot(files: list, owner=None, reason: str = 'manual', prune: bool = True) -> dict:
+    """
+    Store a snapshot of files, a list of (path, manifest fields) with the database first, then apply
+    the retention policy unless prune is off. Returns the manifest.
+    """
+    with _lock:
+        created = datetime.datetime.now(datetime.UTC)
+        snapshot_id = created.strftime(SNAPSHOT_ID_FORMAT)
+        previous = _snapshot_ids(owner)
+        # Chunks of the previous snapshot are known to be stored; others are checked before uploading
+        known = {digest for entry in get_snapshot(previous[0], owner)['files'] for digest in entry['chunks']} if previous else set()
+        uploads, entries = [], []
+        for path, fields in files:
+            entries.append({**fields, **_store_file(path, known, uploads)})
+        if not all(future.result() for future in uploads):
+            raise RuntimeError(f"Could not upload the chunks of snapshot {snapshot_id}")
+        manifest = {
+            'id': snapshot_id, 'created': created.isoformat(), 'owner': owner, 'reason': reason,
+            'chunk_size': Config.SNAPSHOT_CHUNK_SIZE, 'files': entries,
+        }
+        if not upload_bytes(json.dumps(manifest).encode(), f"{manifest_prefix(owner)}{snapshot_id}.json"):
+            raise RuntimeError(f"Could not upload the manifest of snapshot {snapshot_id}")
+        _latest[owner] = created
+        logger.info(f"Created snapshot {snapshot_id} ({reason}), "
+                    f"uploaded {sum(entry['stored_bytes'] for entry in entries)} new bytes")
+        if prune:
+            _prune(owner)
+    return manifest
+
+
+def retained(snapshot_ids: list, last: int, hourly: int, daily: int, weekly: int) -> set:
+    """
+    Snapshot ids a keep-last/hourly/daily/weekly policy keeps: the `last` newest, plus the newest one in
+    each of the most recent `hourly` hours, `daily` days and `weekly` ISO weeks that have snapshots
+    """
+    created = sorted(((snapshot_time(snapshot_id), snapshot_id) for snapshot_id in snapshot_ids), reverse=True)
+    keep = {snapshot_id for _, snapshot_id in created[:max(last, 1)]}
+    periods = [(hourly, lambda t: (t.date(), t.hour)), (daily, lambda t: t.date()),
+               (weekly, lambda t: t.isocalendar()[:2])]
+    for count, period in periods:
+        seen = set()
+        for time, snapshot_id in created:
+            if period(time) in seen:
+                continue
+            if len(seen) == count:
+                break
+            seen.add(period(time))
+            keep.add(snapshot_id)
+    return keep
+
+
+def prune_snapshots(owner=None) -> int:
+    """Apply the retention policy to an owner's snapshots; returns the number removed"""
+    with _lock:
+        return _prune(owner)
+
+
+def _prune(owner=None) -> int:
+    ids = _snapshot_ids(owner)
+    keep = retained(ids, Config.SNAPSHOT_KEEP_LAST, Config.SNAPSHOT_KEEP_HOURLY,
+                    Config.SNAPSHOT_KEEP_DAILY, Config.SNAPSHOT_KEEP_WEEKLY)
+    expired = [snapshot_id for snapshot_id in ids if snapshot_id not in keep]
+    for snapshot_id in expired:
+        remove_object(f"{manifest_prefix(owner)}{snapshot_id}.json")
+    if expired:
+        _collect_garbage()
+        logger.info(f"Removed {len(expired)} expired snapshots")
+    return len(expired)
+
+
+def _collect_garbage():
+    """
+    Delete chunks no remaining manifest refers to; chunks are shared by every owner's snapshots.
+    Chunks uploaded within SNAPSHOT_GC_GRACE seconds are kept, since another process may be writing
+    a snapshot whose manifest is not stored yet.
+    """
+    cutoff = datetime.datetime.now(datetime.UTC) - datetime.timedelta(seconds=Config.SNAPSHOT_GC_GRACE)
+    chunks = list_object_times(f"{_root()}/chunks/")
+    referenced = set()
+    for name in list_objects(f"{_root()}/"):
+        if name.endswith('.json'):
+            data = download_bytes(name)
+            if data is None:
+                return  # an unreadable manifest might still need its chunks
+            referenced.update(digest for entry in json.loads(data)['files'] for digest in entry['chunks'])
+    removed = 0
+    for name, modified in chunks.items():
+        if name.rsplit('/', 1)[-1] not in referenced and (modified is None or modified < cutoff):
+            remove_object(name)
+            removed += 1
+    logger.debug(f"Removed {removed} unreferenced snapshot chunks")
+
+
+def restore_file(entry: dict, path: str):
+    """Stream a file's chunks from the object store to path, one chunk in memory at a time"""
+    file_hash = hashlib.sha256()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.part', 'wb') as f:
+        for digest in entry['chunks']:
+            data = download_bytes(chunk_object(digest))
+            if data is None:
+                raise FileNotFoundError(f"Snapshot chunk {digest} is missing")
+            chunk = zlib.decompress(data)
+            if hashlib.sha256(chunk).hexdigest() != digest:
+                raise ValueError(f"Snapshot chunk {digest} is corrupt")
+            file_hash.update(chunk)
+            f.write(chunk)
+    if file_hash.hexdigest() != entry['sha256']:
+        os.remove(path + '.part')
+        raise ValueError(f"Restored file does not match the snapshot checksum {entry['sha256']}")
+    os.replace(path + '.part', path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage Peng Finance database snapshots')
+    parser.add_argument('command', choices=['list', 'create', 'prune', 'restore'])
+    parser.add_argument('snapshot_id', nargs='?', help='Snapshot to restore')
+    parser.add_argument('--user', help="A user's shard in sharded mode instead of main.db")
+    args = parser.parse_args(argv)
+    if args.command == 'restore' and not args.snapshot_id:
+        parser.error('restore needs a snapshot id')
+
+    if args.command == 'list':
+        for manifest in list_snapshots(args.user):
+            size = sum(entry['size'] for entry in manifest['files'])
+            print(f"{manifest['id']}  {manifest['created']}  {size:>12} bytes  {manifest['reason']}")
+        return
+    if args.command == 'prune':
+        print(f"Removed {prune_snapshots(args.user)} snapshots")
+        return
+    from utils import sqlite_storage
+    from utils.storage_setup import setup_storage
+    setup_storage()
+    if args.command == 'create':
+        print(f"Created snapshot {sqlite_storage.snapshot_database(args.user)['id']}")
+    else:
+        sqlite_storage.restore_database(args.snapshot_id, args.user)
+        print(f"Restored snapshot {args.snapshot_id}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,72 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float
+import contextlib
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from itertools import pairwise
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    String,
+    create_engine,
+    event,
+    func,
+    select,
+    text,
+)
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+
 from config.configure import Config
+from utils import analytics_storage, replication, snapshots
+from utils.amount_parsing import to_cents
+from utils.category_features import category_terms
+from utils.merchant_names import (
+    clean_merchant,
+    cluster_merchants,
+    display_name,
+    normalize_merchant,
+)
+from utils.minio_storage import (
+    STORE_ERRORS,
+    download_file,
+    object_exists,
+    remove_object,
+    upload_db,
+    upload_file,
+)
 from utils.output_log import logger
-from utils.minio_storage import upload_file
+from utils.transaction_matching import match_transactions as find_matches
+
+_WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER')
+
+
+def _guard_writes(conn, cursor, statement, parameters, context, executemany):
+    # Followers and writers without the lease must not diverge from the shared main.db
+    if statement.lstrip()[:7].upper().startswith(_WRITE_STATEMENTS):
+        replication.check_writable()
+
+
+def _create_engine(path, read_only=False):
+    url = f"sqlite:///file:{path}?mode=ro&uri=true" if read_only else f"sqlite:///{path}"
+    new_engine = create_engine(url, connect_args={"check_same_thread": False}, echo=False)
+    event.listen(new_engine, 'before_cursor_execute', _guard_writes)
+    return new_engine
+
 
 # ORM setup
-engine = create_engine(
-    f"sqlite:///{Config.LOCAL_DB_PATH}",
-    connect_args={"check_same_thread": False},
-    echo=False
-)
+engine = _create_engine(Config.LOCAL_DB_PATH)
 SessionLocal = sessionmaker(bind=engine)
 Base = declarative_base()
 
@@ -27,7 +83,21 @@ class Detail(Base):
     merchant_name = Column(String)
     description = Column(String)
     currency = Column(String, default='CAD')
-    amount = Column(Float)
+    amount = Column(Float)  # amount_cents / 100, kept for display
+    amount_cents = Column(Integer)  # CAD minor units; source of truth for totals and dedupe
+    original_currency = Column(String)
+    original_amount_cents = Column(Integer)  # statement amount before currency conversion
+    month = Column(String)  # YYYY-MM of post_date (falling back to date), '' when neither parses
+    # 'transfer' or 'duplicate' when matched to match_id; matched rows are left out of totals
+    match_type = Column(String, default='')
+    match_id = Column(Integer)
+    canonical_merchant = Column(String)  # MerchantAlias.canonical_name of merchant_name (or description)
+    # Lets a category mapping change touch only the rows matching its triple
+    __table_args__ = (
+        Index('ix_detail_triple', 'original_category', 'merchant_name', 'description'),
+        Index('ix_detail_dedupe', 'username', 'account', 'date', 'amount_cents'),
+        Index('ix_detail_merchant', 'username', 'canonical_merchant'),
+    )
 
 class User(Base):
     __tablename__ = "User"
@@ -44,6 +114,12 @@ class InputMapping(Base):
     source = Column(String)
     target = Column(String)
 
+class InputMappingSignature(Base):
+    __tablename__ = "InputMappingSignature"
+    id = Column(Integer, primary_key=True, index=True)
+    signature = Column(String, unique=True, index=True)  # hash of the normalized, sorted CSV header
+    account = Column(String)
+
 class CategoryMapping(Base):
     __tablename__ = "CategoryMapping"
     id = Column(Integer, primary_key=True, index=True)
@@ -51,16 +127,902 @@ class CategoryMapping(Base):
     merchant_name = Column(String)
     description = Column(String)
     target_category = Column(String)
+    revision = Column(Integer, index=True)  # save_category_mappings call that last set it; shards catch up from it
+    __table_args__ = (Index('ix_category_mapping_triple', 'original_category', 'merchant_name', 'description', unique=True),)
+
+class ImportJournal(Base):
+    """Append-only log of import events; one row per started/committed/archived/completed step"""
+    __tablename__ = "ImportJournal"
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String)
+    account = Column(String)
+    file_hash = Column(String)
+    file_name = Column(String)
+    status = Column(String)  # started | committed | archived | completed
+    row_start = Column(Integer)
+    row_end = Column(Integer)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    __table_args__ = (Index('ix_import_journal_file', 'username', 'account', 'file_hash'),)
+
+class RecurringMerchant(Base):
+    """Running per-(user, merchant) statistics used to spot subscriptions and other recurring charges"""
+    __tablename__ = "RecurringMerchant"
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String)
+    merchant_key = Column(String)  # normalize_merchant() of merchant_name, or of description when empty
+    merchant_name = Column(String)  # latest display name
+    occurrences = Column(Integer, default=0)
+    amount_mean = Column(Float, default=0.0)  # cents; Welford running mean and sum of squared deviations
+    amount_m2 = Column(Float, default=0.0)
+    interval_count = Column(Integer, default=0)
+    interval_mean = Column(Float, default=0.0)  # days between consecutive charges
+    interval_m2 = Column(Float, default=0.0)
+    first_date = Column(String)
+    last_date = Column(String)
+    __table_args__ = (Index('ix_recurring_merchant_user_key', 'username', 'merchant_key', unique=True),)
+
+class Budget(Base):
+    __tablename__ = "Budget"
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String)
+    category = Column(String)
+    monthly_limit_cents = Column(Integer)
+    __table_args__ = (Index('ix_budget_user_category', 'username', 'category', unique=True),)
+
+class CategorySpend(Base):
+    """Net amount per (user, category, month), kept in step with Detail by every write path"""
+    __tablename__ = "CategorySpend"
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String)
+    category = Column(String)
+    month = Column(String)
+    amount_cents = Column(Integer, default=0)  # spending is negative, like Detail.amount_cents
+    transactions = Column(Integer, default=0)
+    __table_args__ = (Index('ix_category_spend_key', 'username', 'category', 'month', unique=True),)
+
+class CategoryModelTerm(Base):
+    """Naive Bayes term counts per category, trained from CategoryMapping"""
+    __tablename__ = "CategoryModelTerm"
+    id = Column(Integer, primary_key=True, index=True)
+    term = Column(String)
+    category = Column(String)
+    count = Column(Integer, default=0)
+    __table_args__ = (Index('ix_category_model_term_key', 'term', 'category', unique=True),)
+
+class CategoryModelClass(Base):
+    """Naive Bayes document and term totals per category"""
+    __tablename__ = "CategoryModelClass"
+    id = Column(Integer, primary_key=True, index=True)
+    category = Column(String, unique=True)
+    documents = Column(Integer, default=0)
+    terms = Column(Integer, default=0)
+
+class MerchantAlias(Base):
+    """Raw statement merchant string -> canonical merchant, resolved once and reused at every import"""
+    __tablename__ = "MerchantAlias"
+    id = Column(Integer, primary_key=True, index=True)
+    raw_name = Column(String)
+    merchant_key = Column(String, index=True)  # clean_merchant() of raw_name
+    canonical_name = Column(String)
+    __table_args__ = (Index('ix_merchant_alias_raw', 'raw_name', unique=True),)
+
+class DetailPartition(Base):
+    """A closed year of Detail rows moved out of the hot database into its own SQLite file"""
+    __tablename__ = "DetailPartition"
+    id = Column(Integer, primary_key=True, index=True)
+    year = Column(String, unique=True)
+    transactions = Column(Integer, default=0)
+    max_id = Column(Integer)  # highest Detail.id in the file
+    version = Column(Integer, default=1)  # files are rewritten as the next version, never in place
+
+class CategoryMappingSync(Base):
+    """Highest CategoryMapping.revision already applied to the Detail rows of a user's shard"""
+    __tablename__ = "CategoryMappingSync"
+    id = Column(Integer, primary_key=True, index=True)
+    revision = Column(Integer, default=0)
+
+# Per-user tables; in sharded mode they live in each user's shard, everything else in main.db (the catalog)
+SHARD_MODELS = (Detail, ImportJournal, RecurringMerchant, CategorySpend, Budget, DetailPartition, CategoryMappingSync)
+SHARD_TABLES = [model.__table__ for model in SHARD_MODELS]
+CATALOG_TABLES = [table for table in Base.metadata.sorted_tables if table not in SHARD_TABLES]
+CATALOG_MODELS = tuple(mapper.class_ for mapper in Base.registry.mappers if mapper.class_ not in SHARD_MODELS)
+
+
+def is_sharded() -> bool:
+    return Config.STORAGE_MODE == 'sharded'
 
 # Database initialization
 def initialize_db():
     logger.debug("Creating database tables via ORM...")
-    Base.metadata.create_all(bind=engine)
+    tables = CATALOG_TABLES if is_sharded() else Base.metadata.sorted_tables
+    Base.metadata.create_all(bind=engine, tables=tables)
+    _migrate_schema(engine, tables)
+    if is_sharded():
+        _split_into_shards()
+    else:
+        archive_closed_years()
     logger.info("Database initialized.")
 
+
+def create_empty_database(path):
+    """
+    Create a database file with the current tables for a read-only replica to open while the object
+    store has no main.db yet; built on its own engine, which the write guard does not cover
+    """
+    tables = CATALOG_TABLES if is_sharded() else Base.metadata.sorted_tables
+    empty_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, echo=False)
+    try:
+        Base.metadata.create_all(bind=empty_engine, tables=tables)
+        if Detail.__table__ in tables:
+            _create_search_index(empty_engine)
+    finally:
+        empty_engine.dispose()
+
+
+def _migrate_schema(target_engine=None, tables=None, username=None):
+    """Bring databases created by older versions (a user's shard when username is given) up to the current models"""
+    target_engine = target_engine or engine
+    tables = tables or Base.metadata.sorted_tables
+    with target_engine.begin() as conn:
+        _add_missing_columns(conn, tables)
+        if CategoryMapping.__table__ in tables:
+            # CategoryMapping used to accept repeated triples; keep only the latest mapping of each
+            removed = conn.execute(text("""
+                DELETE FROM CategoryMapping WHERE id NOT IN (
+                    SELECT max(id) FROM CategoryMapping
+                    GROUP BY original_category, merchant_name, description
+                )
+            """)).rowcount
+            if removed:
+                logger.info(f"Removed {removed} duplicate category mappings")
+    # create_all() skips indexes on tables that already exist
+    for table in tables:
+        for index in table.indexes:
+            index.create(bind=target_engine, checkfirst=True)
+    if Detail.__table__ in tables:
+        _migrate_detail(target_engine, username)
+    if CategoryModelClass.__table__ in tables:
+        with target_engine.connect() as conn:
+            needs_model = (
+                conn.execute(text("SELECT count(*) FROM CategoryModelClass")).scalar() == 0
+                and conn.execute(text("SELECT count(*) FROM CategoryMapping")).scalar() > 0
+            )
+        if needs_model:
+            rebuild_category_model()
+
+
+def _add_missing_columns(conn, tables):
+    # create_all() does not add columns to existing tables
+    for table in tables:
+        existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info('{table.name}')"))}
+        for column in table.columns:
+            if column.name not in existing:
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+                ))
+                logger.info(f"Added column {table.name}.{column.name}")
+
+
+def _migrate_detail(target_engine, username=None):
+    """Backfills for Detail and the tables derived from it"""
+    with target_engine.begin() as conn:
+        # Amounts used to be stored as floats only; convert them to cents once. Rows without an
+        # amount count as zero, since typed frames load amount_cents as a non-nullable int64
+        converted = conn.execute(text("""
+            UPDATE Detail SET
+                amount_cents = coalesce(CAST(round(amount * 100) AS INTEGER), 0),
+                original_currency = coalesce(original_currency, currency),
+                original_amount_cents = coalesce(original_amount_cents, CAST(round(amount * 100) AS INTEGER), 0)
+            WHERE amount_cents IS NULL
+        """)).rowcount
+        if converted:
+            conn.execute(text("UPDATE Detail SET amount = amount_cents / 100.0 WHERE amount_cents IS NOT NULL"))
+            logger.info(f"Converted {converted} transaction amounts to integer cents")
+        conn.execute(text("UPDATE Detail SET match_type = '' WHERE match_type IS NULL"))
+    _create_search_index(target_engine)
+    _backfill_months(target_engine)
+    _backfill_canonical_merchants(target_engine)
+    with target_engine.begin() as conn:
+        if conn.execute(text("SELECT count(*) FROM CategorySpend")).scalar() == 0:
+            built = conn.execute(text("""
+                INSERT INTO CategorySpend (username, category, month, amount_cents, transactions)
+                SELECT username, coalesce(category, ''), month, sum(amount_cents), count(*)
+                FROM Detail WHERE match_type = '' GROUP BY username, coalesce(category, ''), month
+            """)).rowcount
+            if built:
+                logger.info(f"Built {built} category spend counters")
+    with target_engine.connect() as conn:
+        needs_backfill = (
+            conn.execute(text("SELECT count(*) FROM RecurringMerchant")).scalar() == 0
+            and conn.execute(text("SELECT count(*) FROM Detail")).scalar() > 0
+        )
+    if needs_backfill:
+        session = SessionLocal(bind=target_engine)
+        try:
+            _rebuild_recurring(session, username)
+            session.commit()
+        finally:
+            session.close()
+        logger.info("Rebuilt recurring statistics")
+
+
+def _backfill_months(target_engine):
+    """Fill Detail.month for rows imported before the column existed"""
+    rows = pd.read_sql_query("SELECT id, date, post_date FROM Detail WHERE month IS NULL", target_engine)
+    if rows.empty:
+        return
+    rows['month'] = transaction_months(rows)
+    with target_engine.begin() as conn:
+        conn.execute(text("UPDATE Detail SET month = :month WHERE id = :id"),
+                     rows[['id', 'month']].to_dict(orient='records'))
+    logger.info(f"Set the month of {len(rows)} transactions")
+
+
+def _backfill_canonical_merchants(target_engine):
+    """Resolve Detail.canonical_merchant for rows imported before merchant canonicalization"""
+    rows = pd.read_sql_query(
+        "SELECT id, merchant_name, description FROM Detail WHERE canonical_merchant IS NULL", target_engine
+    )
+    if rows.empty:
+        return
+    session = get_session()
+    try:
+        raw_names = merchant_raw_names(rows)
+        canonical = _resolve_merchants(session, raw_names)
+        session.commit()
+    finally:
+        session.close()
+    with target_engine.begin() as conn:
+        conn.execute(text("UPDATE Detail SET canonical_merchant = :canonical WHERE id = :id"), [
+            {'id': int(row_id), 'canonical': canonical.get(raw, '')} for row_id, raw in zip(rows['id'], raw_names)
+        ])
+    logger.info(f"Set the canonical merchant of {len(rows)} transactions")
+
+
+def transaction_months(df) -> pd.Series:
+    """YYYY-MM of each row's post_date, falling back to date; '' when neither parses"""
+    dates = analytics_storage.parse_dates(df.reindex(columns=['date', 'post_date']))
+    return dates.dt.strftime('%Y-%m').fillna('')
+
+
+def _create_search_index(target_engine):
+    """FTS5 index over Detail.merchant_name/description, kept in sync by triggers"""
+    with target_engine.begin() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'DetailSearch'")).first()
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS DetailSearch USING fts5(
+                merchant_name, description, content='Detail', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS DetailSearch_ai AFTER INSERT ON Detail BEGIN
+                INSERT INTO DetailSearch(rowid, merchant_name, description)
+                VALUES (new.id, new.merchant_name, new.description);
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS DetailSearch_ad AFTER DELETE ON Detail BEGIN
+                INSERT INTO DetailSearch(DetailSearch, rowid, merchant_name, description)
+                VALUES ('delete', old.id, old.merchant_name, old.description);
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS DetailSearch_au AFTER UPDATE OF merchant_name, description ON Detail BEGIN
+                INSERT INTO DetailSearch(DetailSearch, rowid, merchant_name, description)
+                VALUES ('delete', old.id, old.merchant_name, old.description);
+                INSERT INTO DetailSearch(rowid, merchant_name, description)
+                VALUES (new.id, new.merchant_name, new.description);
+            END
+        """))
+        if not exists:
+            # Index rows that were imported before the search table existed
+            conn.execute(text("INSERT INTO DetailSearch(DetailSearch) VALUES ('rebuild')"))
+            logger.info("Built full-text search index for Detail")
+
+def sync_analytics_mirror(force=False):
+    """
+    Rebuild the analytics mirror when it has drifted from Detail (e.g. after a crash or DB download),
+    or unconditionally with force, e.g. after a restore that may keep the row count and max id
+    """
+    if not analytics_storage.is_enabled():
+        return
+    session = get_session()
+    count, max_id = session.query(func.count(Detail.id), func.coalesce(func.max(Detail.id), 0)).one()
+    session.close()
+    # The mirror keeps archived rows, so compare it with every partition too
+    partitions = detail_partitions()
+    state = (count + sum(p.transactions for p in partitions), max([max_id] + [p.max_id for p in partitions]))
+    if state == analytics_storage.mirror_state() and not force:
+        return
+    logger.info("Analytics mirror out of date, rebuilding from Detail")
+
+    def frames():
+        for number, batch in enumerate(partition_batches(partitions)):
+            with engine.connect() as conn, attached_partitions(conn.exec_driver_sql, None, batch):
+                yield from pd.read_sql_query(
+                    f"SELECT {', '.join(analytics_storage.MIRROR_COLUMNS)} "
+                    f"FROM {detail_source(batch, hot=number == 0)} ORDER BY id",
+                    conn, chunksize=50000
+                )
+    analytics_storage.rebuild_mirror(frames())
+
 # Session utility
-def get_session():
-    return SessionLocal()
+def get_session(username=None):
+    """
+    Session on main.db. In sharded mode, passing a username binds the per-user tables (and raw SQL)
+    to that user's shard while the catalog tables stay on main.db.
+    """
+    if username is None or not is_sharded():
+        return SessionLocal()
+    return SessionLocal(bind=shard_engine(username), binds={model: engine for model in CATALOG_MODELS})
+
+
+def user_engine(username=None):
+    """Engine holding username's transactions: their shard in sharded mode, else main.db"""
+    return shard_engine(username) if username is not None and is_sharded() else engine
+
+
+def upload_user_db(username):
+    """Upload the database file holding username's transactions, if this instance may write"""
+    if is_sharded():
+        if not replication.writes_allowed():
+            logger.warning(f"Not uploading the shard of {username}: this instance does not hold the writer lease")
+            return False
+        return upload_file(shard_path(username), shard_object(username))
+    return upload_db()
+
+# User shards
+_shards = OrderedDict()
+_shards_lock = threading.RLock()
+_synced_revisions = {}  # username -> CategoryMapping revision their cached shard is known to have applied
+_mapping_revision = {'latest': None}  # newest CategoryMapping.revision, read from main.db once
+
+
+def shard_path(username) -> str:
+    return os.path.join(Config.SHARD_DIR, quote(username, safe='') + '.db')
+
+
+def shard_object(username) -> str:
+    return f"{Config.DB_S3_PATH}/shards/{quote(username, safe='')}.db"
+
+
+def shard_engine(username):
+    """
+    Engine on a user's shard from an LRU cache of SHARD_CACHE_SIZE engines. The shard is downloaded
+    from the object store the first time this process needs it, or created empty for a new user,
+    and catches up with the category mappings saved since it was last used.
+    """
+    with _shards_lock:
+        if username in _shards:
+            _shards.move_to_end(username)
+            new_engine = _shards[username]
+        else:
+            new_engine = _open_shard(username)
+    _sync_category_mappings(username)
+    return new_engine
+
+
+def _open_shard(username):
+    path = shard_path(username)
+    created = not os.path.exists(path)
+    if created:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if download_file(shard_object(username), path):
+            logger.info(f"Downloaded shard for user {username}")
+            created = False
+    new_engine = _create_engine(path)
+    Base.metadata.create_all(bind=new_engine, tables=SHARD_TABLES)
+    _migrate_schema(new_engine, SHARD_TABLES, username)
+    if created:
+        # Imports categorize with the mappings of their day, so a new shard has nothing to catch up on
+        with new_engine.begin() as conn:
+            conn.execute(CategoryMappingSync.__table__.insert().values(revision=latest_mapping_revision()))
+    _shards[username] = new_engine
+    while len(_shards) > Config.SHARD_CACHE_SIZE:
+        evicted_user, evicted = _shards.popitem(last=False)
+        _synced_revisions.pop(evicted_user, None)
+        evicted.dispose()
+    archive_closed_years(username)
+    return new_engine
+
+
+def shard_usernames() -> list:
+    """Users that have a shard, locally or in the object store"""
+    session = get_session()
+    usernames = [row.username for row in session.query(User.username).all()]
+    session.close()
+    return [name for name in usernames if os.path.exists(shard_path(name)) or object_exists(shard_object(name))]
+
+
+def _split_into_shards():
+    """Move per-user rows of a main.db from shared mode, archived years included, into the users' shards, once"""
+    with engine.connect() as conn:
+        present = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+    tables = [table for table in SHARD_TABLES if table.name in present]
+    if not tables:
+        return
+    _migrate_schema(engine, tables)
+    user_tables = [table for table in tables if 'username' in table.columns]
+    with engine.connect() as conn:
+        usernames = sorted({row[0] for table in user_tables for row in conn.execute(
+            text(f"SELECT DISTINCT username FROM {table.name} WHERE username IS NOT NULL")
+        )})
+    partitions = detail_partitions() if DetailPartition.__table__ in tables else []
+    for username in usernames:
+        target = shard_engine(username)
+        # The first batch replaces the user's rows, so a split interrupted between batches starts over
+        for number, batch in enumerate(partition_batches(partitions)):
+            with target.connect() as conn, attached_partitions(conn.exec_driver_sql, None, batch):
+                if number == 0:
+                    conn.exec_driver_sql("ATTACH DATABASE ? AS shared", (os.path.abspath(Config.LOCAL_DB_PATH),))
+                try:
+                    if number == 0:
+                        for table in user_tables:
+                            columns = ', '.join(column.name for column in table.columns)
+                            conn.exec_driver_sql(f"DELETE FROM {table.name} WHERE username = ?", (username,))
+                            conn.exec_driver_sql(
+                                f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM shared.{table.name} WHERE username = ?",
+                                (username,)
+                            )
+                    for partition in batch:
+                        conn.exec_driver_sql(
+                            f"INSERT INTO Detail ({_DETAIL_COLUMNS}) SELECT {_DETAIL_COLUMNS} FROM p{partition.year}.Detail WHERE username = ?",
+                            (username,)
+                        )
+                    conn.commit()
+                finally:
+                    conn.rollback()
+                    if number == 0:
+                        conn.exec_driver_sql("DETACH DATABASE shared")
+        # Shared partitions hold every user's rows; each shard archives its own
+        if not partitions or not archive_closed_years(username):
+            upload_user_db(username)
+    with engine.begin() as conn:
+        for name in ('DetailSearch_ai', 'DetailSearch_ad', 'DetailSearch_au'):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        conn.execute(text("DROP TABLE IF EXISTS DetailSearch"))
+        for table in tables:
+            conn.execute(text(f"DROP TABLE {table.name}"))
+    with engine.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+    upload_db()
+    for partition in partitions:
+        _remove_partition_version(None, partition.year, partition.version)
+    logger.info(f"Moved the transactions of {len(usernames)} users into per-user shards")
+
+
+# Year partitions
+_partition_lock = threading.Lock()
+_checked_partitions = set()  # local partition files whose columns were brought up to date by this process
+_DETAIL_COLUMNS = ', '.join(column.name for column in Detail.__table__.columns)
+ATTACH_BATCH = 8  # partitions attached to one connection; leaves room for e.g. the shared database of a shard split
+
+
+def _partition_owner(username):
+    """Partitions belong to the user's shard in sharded mode, else to main.db (None)"""
+    return username if is_sharded() else None
+
+
+def partition_path(owner, year, version) -> str:
+    folder = Config.PARTITION_DIR if owner is None else os.path.join(Config.PARTITION_DIR, quote(owner, safe=''))
+    return os.path.join(folder, f"{year}.v{version}.db")
+
+
+def partition_object(owner, year, version) -> str:
+    folder = 'partitions' if owner is None else f"partitions/{quote(owner, safe='')}"
+    return f"{Config.DB_S3_PATH}/{folder}/{year}.v{version}.db"
+
+
+def _partition_engine(path):
+    # Local copies of partition files, not main.db: the copy in the object store is only ever replaced
+    # by a new version, so these writes are not guarded by the writer lease
+    return create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, echo=False)
+
+
+def _create_partition_file(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partition_engine = _partition_engine(path)
+    try:
+        Base.metadata.create_all(bind=partition_engine, tables=[Detail.__table__])
+        _create_search_index(partition_engine)
+    finally:
+        partition_engine.dispose()
+
+
+def partition_file(username, partition) -> str:
+    """Local path of a partition, downloaded the first time this process reads it"""
+    path = partition_path(_partition_owner(username), partition.year, partition.version)
+    with _partition_lock:
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not download_file(partition_object(_partition_owner(username), partition.year, partition.version), path + '.part'):
+                raise FileNotFoundError(f"Partition {partition.year} (version {partition.version}) is not in the object store")
+            os.replace(path + '.part', path)
+            logger.info(f"Downloaded partition {partition.year} to {path}")
+        if path not in _checked_partitions:
+            partition_engine = _partition_engine(path)
+            with partition_engine.begin() as conn:
+                _add_missing_columns(conn, [Detail.__table__])
+            partition_engine.dispose()
+            _checked_partitions.add(path)
+    return path
+
+
+def detail_partitions(username=None, start_date=None, end_date=None) -> list:
+    """Archived years holding username's transactions that overlap [start_date, end_date], oldest first"""
+    session = get_session(username)
+    query = session.query(DetailPartition)
+    if start_date is not None:
+        query = query.filter(DetailPartition.year >= str(pd.Timestamp(start_date).year))
+    if end_date is not None:
+        query = query.filter(DetailPartition.year <= str(pd.Timestamp(end_date).year))
+    partitions = query.order_by(DetailPartition.year).all()
+    session.close()
+    return partitions
+
+
+def partition_batches(partitions) -> list:
+    """
+    Partitions in groups of at most ATTACH_BATCH, each few enough to attach to one connection under
+    SQLite's default limit of 10 attached databases. Always at least one group; queries read the hot
+    Detail table with the first.
+    """
+    return [partitions[i:i + ATTACH_BATCH] for i in range(0, len(partitions), ATTACH_BATCH)] or [[]]
+
+
+def detail_source(partitions, hot=True) -> str:
+    """
+    FROM clause over the hot Detail table (unless hot is off) plus the partitions, which the query
+    must run with attached
+    """
+    if not partitions:
+        return 'Detail'
+    selects = [f"SELECT {_DETAIL_COLUMNS} FROM main.Detail"] if hot else []
+    selects += [f"SELECT {_DETAIL_COLUMNS} FROM p{partition.year}.Detail" for partition in partitions]
+    return f"({' UNION ALL '.join(selects)})"
+
+
+@contextlib.contextmanager
+def attached_partitions(execute, username, partitions):
+    """ATTACH each partition as p<year> through execute(sql, params) for the duration of the block"""
+    attached = []
+    try:
+        for partition in partitions:
+            execute(f"ATTACH DATABASE ? AS p{partition.year}", (partition_file(username, partition),))
+            attached.append(partition.year)
+        yield
+    finally:
+        for year in attached:
+            execute(f"DETACH DATABASE p{year}", ())
+
+
+def archive_closed_years(username=None):
+    """
+    Move Detail rows from before the PARTITION_HOT_YEARS most recent calendar years into one SQLite
+    file per year, stored next to the database in the object store and attached only by queries whose
+    date range reaches them. Spend counters, recurring statistics, duplicate removal, transfer matching
+    and the analytics mirror keep covering archived rows. Returns the number of rows moved.
+    """
+    if Config.PARTITION_HOT_YEARS <= 0:
+        return 0
+    logger.debug(f"Archiving closed years{f' for user {username}' if username else ''}")
+    first_hot_month = f"{datetime.date.today().year - Config.PARTITION_HOT_YEARS + 1}-01"
+    target = user_engine(username)
+    with target.connect() as conn:
+        # The newest row always stays hot, so SQLite never hands out an archived id again
+        years = [row[0] for row in conn.execute(text("""
+            SELECT DISTINCT substr(month, 1, 4) FROM Detail
+            WHERE month != '' AND month < :first_hot_month AND id < (SELECT max(id) FROM Detail)
+        """), {'first_hot_month': first_hot_month})]
+    moved = sum(_archive_year(target, username, year) for year in sorted(years))
+    if moved:
+        with target.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+        upload_user_db(username)
+    logger.info(f"Archived {moved} transactions from {len(years)} closed years")
+    return moved
+
+
+def _archive_year(target, username, year):
+    """Append a closed year's hot rows to a new version of its partition, then drop them from Detail"""
+    owner = _partition_owner(username)
+    session = get_session(username)
+    partition = session.query(DetailPartition).filter_by(year=year).first()
+    session.close()
+    version = partition.version + 1 if partition else 1
+    path = partition_path(owner, year, version)
+    if partition:
+        shutil.copyfile(partition_file(username, partition), path)
+    else:
+        _create_partition_file(path)
+    with target.connect() as conn:
+        conn.exec_driver_sql("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            conn.exec_driver_sql(f"""
+                INSERT INTO archive.Detail ({_DETAIL_COLUMNS}) SELECT {_DETAIL_COLUMNS} FROM main.Detail
+                WHERE substr(month, 1, 4) = ? AND id < (SELECT max(id) FROM main.Detail)
+            """, (year,))
+            conn.commit()
+            transactions, max_id = conn.exec_driver_sql("SELECT count(*), max(id) FROM archive.Detail").one()
+        finally:
+            conn.rollback()
+            conn.exec_driver_sql("DETACH DATABASE archive")
+    # Upload before the rows leave the hot database, so no committed state points at a missing file
+    if not upload_file(path, partition_object(owner, year, version)):
+        os.remove(path)
+        raise RuntimeError(f"Could not upload partition {year}; its transactions stay in the hot database")
+    session = get_session(username)
+    try:
+        moved = session.execute(text("DELETE FROM Detail WHERE substr(month, 1, 4) = :year AND id <= :max_id"),
+                                {'year': year, 'max_id': max_id}).rowcount
+        if partition is None:
+            partition = DetailPartition(year=year)
+        partition = session.merge(partition)
+        partition.transactions, partition.max_id, partition.version = transactions, max_id, version
+        session.commit()
+    finally:
+        session.close()
+    if version > 1:
+        _remove_partition_version(owner, year, version - 1)
+    logger.info(f"Archived {moved} transactions into partition {year} (version {version})")
+    return moved
+
+
+def _remove_partition_version(owner, year, version):
+    """Delete a partition version no committed state refers to any more"""
+    path = partition_path(owner, year, version)
+    if os.path.exists(path):
+        os.remove(path)
+    remove_object(partition_object(owner, year, version))
+
+
+def _recategorize_partition(session, username, partition, mappings):
+    """
+    Recategorize an archived year. Matching rows are rewritten in a copy at the next version, which
+    replaces the partition when the session commits (see _remove_replaced_partitions).
+    """
+    current = _partition_engine(partition_file(username, partition))
+    try:
+        with current.connect() as conn:
+            matched = sum(conn.execute(select(func.count()).select_from(Detail).where(
+                Detail.original_category == orig_cat, Detail.merchant_name == merchant,
+                Detail.description == description
+            )).scalar() for orig_cat, merchant, description, _ in mappings)
+    finally:
+        current.dispose()
+    if not matched:
+        return 0
+
+    def recategorize(archived):
+        updated = 0
+        for orig_cat, merchant, description, target_category in mappings:
+            _move_category_spend(session, orig_cat, merchant, description, target_category, source=archived)
+            updated += archived.query(Detail).filter(
+                Detail.original_category == orig_cat,
+                Detail.merchant_name == merchant,
+                Detail.description == description
+            ).update({Detail.category: target_category}, synchronize_session=False)
+        return updated
+
+    return _rewrite_partition(session, username, partition, recategorize)
+
+
+def _rewrite_partition(session, username, partition, apply):
+    """
+    Change an archived year: apply(archived_session) runs on a copy at the next version, which
+    replaces the partition when the session commits (see _remove_replaced_partitions). Returns
+    what apply returns.
+    """
+    owner, version = _partition_owner(username), partition.version + 1
+    path = partition_path(owner, partition.year, version)
+    shutil.copyfile(partition_file(username, partition), path)
+    copy_engine = _partition_engine(path)
+    archived = SessionLocal(bind=copy_engine)
+    try:
+        result = apply(archived)
+        archived.commit()
+    finally:
+        archived.close()
+        copy_engine.dispose()
+    if not upload_file(path, partition_object(owner, partition.year, version)):
+        os.remove(path)
+        raise RuntimeError(f"Could not upload partition {partition.year}")
+    session.info.setdefault('replaced_partitions', []).append((owner, partition.year, partition.version))
+    partition.version = version
+    return result
+
+
+def _detail_frame(session, username, columns, condition, params=None):
+    """
+    Rows of Detail from the hot table and every archived year reachable from the session, with an
+    archive_year column ('' for hot rows). Partition files are read on their own connections, since
+    SQLite cannot attach them inside the session's open transaction.
+    """
+    query = f"SELECT {', '.join(columns)} FROM Detail WHERE {condition}"
+    frames = [pd.DataFrame(session.execute(text(query), params or {}).all(), columns=columns).assign(archive_year='')]
+    for partition in session.query(DetailPartition).order_by(DetailPartition.year):
+        partition_engine = _partition_engine(partition_file(username, partition))
+        try:
+            with partition_engine.connect() as conn:
+                rows = conn.execute(text(query), params or {}).all()
+        finally:
+            partition_engine.dispose()
+        frames.append(pd.DataFrame(rows, columns=columns).assign(archive_year=partition.year))
+    frames = [frame for frame in frames if not frame.empty] or frames[:1]
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def _remove_replaced_partitions(session):
+    """Delete the partition versions a committed session has replaced"""
+    for owner, year, version in session.info.pop('replaced_partitions', []):
+        _remove_partition_version(owner, year, version)
+
+
+# Snapshots
+def snapshot_database(username=None, reason='manual', prune=True) -> dict:
+    """
+    Snapshot the database file holding username's transactions (main.db in shared mode or without a
+    username) together with the partition files it refers to. The copy comes from the SQLite backup
+    API, so it is consistent without stopping writers. Returns the manifest.
+    """
+    owner = _partition_owner(username)
+    fd, copy_path = tempfile.mkstemp(dir=os.path.dirname(Config.LOCAL_DB_PATH) or '.', suffix='.snapshot')
+    os.close(fd)
+    try:
+        source = user_engine(owner).raw_connection()
+        try:
+            copy = sqlite3.connect(copy_path)
+            try:
+                source.driver_connection.backup(copy)
+                has_partitions = copy.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'DetailPartition'"
+                ).fetchone()
+                partitions = copy.execute("SELECT year, version FROM DetailPartition").fetchall() if has_partitions else []
+            finally:
+                copy.close()
+        finally:
+            source.close()
+        files = [(copy_path, {'kind': 'database'})]
+        for year, version in partitions:
+            path = partition_file(owner, DetailPartition(year=year, version=version))
+            files.append((path, {'kind': 'partition', 'year': year, 'version': version}))
+        return snapshots.write_snapshot(files, owner, reason, prune)
+    finally:
+        os.remove(copy_path)
+
+
+def snapshot_if_due(username=None, reason='automatic'):
+    """Snapshot before a destructive operation unless the last one is newer than SNAPSHOT_INTERVAL"""
+    if Config.SNAPSHOT_INTERVAL <= 0:
+        return
+    try:
+        if snapshots.seconds_since_latest(_partition_owner(username)) >= Config.SNAPSHOT_INTERVAL:
+            snapshot_database(username, reason)
+    except (*STORE_ERRORS, RuntimeError, ValueError, sqlite3.Error, SQLAlchemyError) as e:
+        # A missed snapshot must not block the operation itself
+        logger.error(f"Snapshot before {reason} failed: {e}")
+
+
+def restore_database(snapshot_id, username=None):
+    """
+    Replace the database file holding username's transactions, and its partition files, with a
+    snapshot streamed down from the object store. The current state is snapshotted first, so a restore
+    can be undone. Sessions still open on the replaced file lose their writes; restore while idle.
+    """
+    replication.check_writable()
+    owner = _partition_owner(username)
+    manifest = snapshots.get_snapshot(snapshot_id, owner)
+    # Not pruned yet: retention could otherwise expire the snapshot being restored
+    snapshot_database(owner, f'before restoring {snapshot_id}', prune=False)
+    previous = {(p.year, p.version) for p in detail_partitions(owner)}
+    restored = set()
+    for entry in manifest['files'][1:]:
+        path = partition_path(owner, entry['year'], entry['version'])
+        snapshots.restore_file(entry, path)
+        _checked_partitions.discard(path)
+        if not upload_file(path, partition_object(owner, entry['year'], entry['version'])):
+            raise RuntimeError(f"Could not upload restored partition {entry['year']}")
+        restored.add((entry['year'], entry['version']))
+
+    path = shard_path(owner) if owner is not None else Config.LOCAL_DB_PATH
+    snapshots.restore_file(manifest['files'][0], path + '.restore')
+    check = sqlite3.connect(path + '.restore')
+    try:
+        result = check.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        check.close()
+    if result != 'ok':
+        os.remove(path + '.restore')
+        raise ValueError(f"Snapshot {snapshot_id} failed the integrity check: {result}")
+    if owner is None:
+        os.replace(path + '.restore', path)
+        swap_database(path)
+        initialize_db()
+        upload_db()
+        if not is_sharded():
+            sync_analytics_mirror(force=True)
+    else:
+        with _shards_lock:
+            evicted = _shards.pop(owner, None)
+            _synced_revisions.pop(owner, None)
+            if evicted:
+                evicted.dispose()
+            os.replace(path + '.restore', path)
+            shard_engine(owner)
+        upload_user_db(owner)
+    for year, version in previous - restored:
+        _remove_partition_version(owner, year, version)
+    snapshots.prune_snapshots(owner)
+    logger.info(f"Restored snapshot {snapshot_id}{f' for user {owner}' if owner else ''}")
+
+
+def swap_database(path, read_only=False):
+    """Point new sessions at another database file; sessions already open finish on the old one"""
+    global engine
+    new_engine = _create_engine(path, read_only)
+    _mapping_revision['latest'] = None
+    SessionLocal.configure(bind=new_engine)
+    old_engine, engine = engine, new_engine
+    old_engine.dispose()
+    logger.info(f"Switched database to {path}{' (read-only)' if read_only else ''}")
+
+def read_frame(query, params, dtypes: dict, username=None, partitions=()) -> pd.DataFrame:
+    """
+    Run a raw SQL query and build the DataFrame column by column with compact dtypes instead of
+    object columns. dtypes maps each selected column, in order, to one of 'int64', 'float64',
+    'category', 'datetime64', 'string' or 'object'. Queries on per-user tables pass the username
+    so they run on that user's shard in sharded mode, and queries over detail_source() the
+    partitions it names.
+    """
+    conn = user_engine(username).raw_connection()
+    try:
+        cursor = conn.cursor()
+        with attached_partitions(cursor.execute, username, partitions):
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+    finally:
+        conn.close()
+    return frame_from_rows(rows, dtypes)
+
+
+def read_detail_frames(query, params, dtypes: dict, username=None, partitions=()) -> list:
+    """
+    Run a query whose FROM clause is the {source} placeholder over the hot Detail table and the
+    partitions, one partition_batches() group per connection. Returns one typed DataFrame per group,
+    the first over the hot table; callers merge them, e.g. with concat_frames.
+    """
+    return [
+        read_frame(query.format(source=detail_source(batch, hot=number == 0)), params, dtypes, username, batch)
+        for number, batch in enumerate(partition_batches(partitions))
+    ]
+
+
+def concat_frames(frames, dtypes: dict) -> pd.DataFrame:
+    """Concatenate frames from read_detail_frames, keeping the compact dtypes"""
+    if len(frames) == 1:
+        return frames[0]
+    df = pd.concat(frames, ignore_index=True)
+    for name, dtype in dtypes.items():
+        if dtype == 'category':
+            df[name] = df[name].astype('category')
+    return df
+
+
+def frame_from_rows(rows, dtypes: dict) -> pd.DataFrame:
+    """Build a typed DataFrame from result tuples; see read_frame for the supported dtypes"""
+    columns = zip(*rows) if rows else (() for _ in dtypes)
+    data = {}
+    for (name, dtype), values in zip(dtypes.items(), columns):
+        if dtype == 'category':
+            data[name] = pd.Categorical(values)
+        elif dtype == 'datetime64':
+            data[name] = pd.to_datetime(pd.Series(values, dtype=object), format='mixed', errors='coerce')
+        elif dtype == 'string':
+            data[name] = pd.array(values, dtype='string')
+        else:
+            data[name] = np.array(values, dtype=dtype)
+    return pd.DataFrame(data)
 
 # Input mapping functions
 def get_input_mappings(account):
@@ -72,16 +1034,55 @@ def get_input_mappings(account):
     return result
 
 
-def save_input_mappings(account, mappings: dict):
+def get_all_input_mappings():
+    logger.debug("Fetching input mappings for all accounts")
+    session = get_session()
+    result = {}
+    for m in session.query(InputMapping).all():
+        result.setdefault(m.account, {})[m.target] = m.source
+    session.close()
+    return result
+
+
+def get_account_by_signature(signature):
+    logger.debug(f"Looking up account for header signature: {signature}")
+    session = get_session()
+    row = session.query(InputMappingSignature).filter(InputMappingSignature.signature == signature).first()
+    session.close()
+    return row.account if row else None
+
+
+def _upsert_signatures(session, signatures: dict):
+    for signature, account in signatures.items():
+        row = session.query(InputMappingSignature).filter(InputMappingSignature.signature == signature).first()
+        if row:
+            row.account = account
+        else:
+            session.add(InputMappingSignature(signature=signature, account=account))
+
+
+def save_mapping_signatures(signatures: dict):
+    """Record which account each header signature belongs to"""
+    logger.debug(f"Saving {len(signatures)} header signatures")
+    session = get_session()
+    _upsert_signatures(session, signatures)
+    session.commit()
+    session.close()
+    upload_db()
+
+
+def save_input_mappings(account, mappings: dict, signature=None):
     logger.debug(f"Saving input mappings for account: {account}")
     session = get_session()
     session.query(InputMapping).filter(InputMapping.account == account).delete()
     for target, source in mappings.items():
         im = InputMapping(account=account, source=source, target=target)
         session.add(im)
+    if signature:
+        _upsert_signatures(session, {signature: account})
     session.commit()
     session.close()
-    upload_file(Config.LOCAL_DB_PATH, Config.DB_S3_PATH + "/main.db")
+    upload_db()
     logger.info(f"Saved input mappings for account {account}")
 
 # Category mapping functions
@@ -105,54 +1106,190 @@ def get_target_category(orig_cat, merchant, description):
     return mapping.target_category if mapping else ''
 
 
-def save_category_mapping(orig_cat, merchant, description, target_category):
+def _upsert_category_mapping(session, orig_cat, merchant, description, target_category, revision=None):
+    mapping = session.query(CategoryMapping).filter(
+        CategoryMapping.original_category == orig_cat,
+        CategoryMapping.merchant_name == merchant,
+        CategoryMapping.description == description
+    ).first()
+    if mapping and mapping.target_category != target_category:
+        # The model learns the mapping's current target only
+        _train_category_model(session, [(orig_cat, merchant, description, mapping.target_category)], sign=-1)
+    if not mapping or mapping.target_category != target_category:
+        _train_category_model(session, [(orig_cat, merchant, description, target_category)])
+    if mapping:
+        mapping.target_category = target_category
+        mapping.revision = revision
+    else:
+        session.add(CategoryMapping(
+            original_category=orig_cat,
+            merchant_name=merchant,
+            description=description,
+            target_category=target_category,
+            revision=revision
+        ))
+
+
+def save_category_mapping(orig_cat, merchant, description, target_category, username=None):
     logger.debug(f"Saving category mapping: {orig_cat}|{merchant}|{description} -> {target_category}")
-    session = get_session()
-    cm = CategoryMapping(
-        original_category=orig_cat,
-        merchant_name=merchant,
-        description=description,
-        target_category=target_category
-    )
-    session.add(cm)
-    session.query(Detail).filter(
-        Detail.original_category == orig_cat,
-        Detail.merchant_name == merchant,
-        Detail.description == description
-    ).update({Detail.category: target_category})
-    session.commit()
-    session.close()
-    upload_file(Config.LOCAL_DB_PATH, Config.DB_S3_PATH + "/main.db")
+    save_category_mappings([(orig_cat, merchant, description, target_category)], username)
     logger.info(f"Saved category mapping for {orig_cat}|{merchant}|{description}")
 
+
+def save_category_mappings(mappings: list, username=None):
+    """
+    Upsert many (orig_cat, merchant, description, target_category) mappings and recategorize the
+    matching Detail rows in one transaction with a single DB upload. In sharded mode only username's
+    shard is recategorized right away; every other shard catches up the next time it is opened.
+    """
+    logger.debug(f"Saving {len(mappings)} category mappings")
+    snapshot_if_due(reason='recategorization')
+    session = get_session()
+    updated = 0
+    try:
+        revision = session.query(func.coalesce(func.max(CategoryMapping.revision), 0)).scalar() + 1
+        for orig_cat, merchant, description, target_category in mappings:
+            _upsert_category_mapping(session, orig_cat, merchant, description, target_category, revision)
+        if not is_sharded():
+            updated = _recategorize(session, mappings)
+        session.commit()
+        _remove_replaced_partitions(session)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    _mapping_revision['latest'] = revision
+    if analytics_storage.is_enabled():
+        for mapping in mappings:
+            analytics_storage.mirror_recategorize(*mapping)
+    upload_db()
+    if is_sharded() and username is not None:
+        updated = _sync_category_mappings(username)
+    logger.info(f"Saved {len(mappings)} category mappings, recategorized {updated} transactions")
+    return updated
+
+
+def latest_mapping_revision() -> int:
+    """Newest CategoryMapping.revision; read once, then kept current by save_category_mappings"""
+    if _mapping_revision['latest'] is None:
+        session = get_session()
+        _mapping_revision['latest'] = session.query(func.coalesce(func.max(CategoryMapping.revision), 0)).scalar()
+        session.close()
+    return _mapping_revision['latest']
+
+
+def _sync_category_mappings(username) -> int:
+    """
+    Apply the category mappings saved since a user's shard was last recategorized, so a save never
+    has to open every shard. Returns the number of transactions recategorized.
+    """
+    latest = latest_mapping_revision()
+    if _synced_revisions.get(username) == latest or not replication.writes_allowed():
+        return 0
+    # Recorded first: the session below opens the shard through shard_engine again
+    _synced_revisions[username] = latest
+    try:
+        session = get_session(username)
+        try:
+            sync = session.query(CategoryMappingSync).first()
+            applied = sync.revision if sync else 0
+            if applied >= latest:
+                return 0
+            mappings = session.query(
+                CategoryMapping.original_category, CategoryMapping.merchant_name,
+                CategoryMapping.description, CategoryMapping.target_category
+            ).filter(CategoryMapping.revision > applied).all()
+            snapshot_if_due(username, 'recategorization')
+            updated = _recategorize(session, [tuple(mapping) for mapping in mappings], username)
+            if sync is None:
+                session.add(CategoryMappingSync(revision=latest))
+            else:
+                sync.revision = latest
+            session.commit()
+            _remove_replaced_partitions(session)
+        finally:
+            session.close()
+    except Exception:
+        _synced_revisions.pop(username, None)
+        raise
+    upload_user_db(username)
+    logger.info(f"Applied {len(mappings)} new category mappings to {updated} transactions of user {username}")
+    return updated
+
+def _recategorize(session, mappings, username=None):
+    """Apply mappings to the Detail rows (and spend counters) reachable from the session, archived years included"""
+    updated = 0
+    for orig_cat, merchant, description, target_category in mappings:
+        _move_category_spend(session, orig_cat, merchant, description, target_category)
+        updated += session.query(Detail).filter(
+            Detail.original_category == orig_cat,
+            Detail.merchant_name == merchant,
+            Detail.description == description
+        ).update({Detail.category: target_category}, synchronize_session=False)
+    for partition in session.query(DetailPartition).all():
+        updated += _recategorize_partition(session, username, partition, mappings)
+    return updated
+
 # Detail functions
+_DUPLICATE_KEY = ['account', 'date', 'amount_cents', 'post_date', 'category', 'original_category',
+                  'merchant_name', 'description', 'currency']
+
+
 def remove_duplicates(username):
     logger.debug(f"Removing duplicates for user: {username}")
-    session = get_session()
-    rows = session.query(Detail).filter(Detail.username == username).all()
-    seen = set()
-    dup_ids = []
-    for row in rows:
-        key = (row.account, row.date, row.post_date, row.category, row.original_category, row.merchant_name, row.description, row.currency, row.amount)
-        if key in seen:
-            dup_ids.append(row.id)
-        else:
-            seen.add(key)
+    snapshot_if_due(username, 'duplicate removal')
+    session = get_session(username)
+    try:
+        rows = _detail_frame(session, username, ['id', *_DUPLICATE_KEY, 'month', 'match_type', 'match_id'],
+                             "username = :username", {'username': username}).sort_values('id')
+        # Keep the first copy of each transaction, archived years included; NULLs compare equal
+        duplicates = rows[rows.duplicated(_DUPLICATE_KEY, keep='first')]
+        dup_ids = duplicates['id'].tolist()
+        if dup_ids:
+            _add_category_spend(session, duplicates[duplicates['match_type'] == ''].assign(username=username), sign=-1)
+            session.query(Detail).filter(Detail.id.in_(dup_ids)).delete(synchronize_session=False)
+            for partition in session.query(DetailPartition).filter(
+                DetailPartition.year.in_(duplicates['archive_year'].unique().tolist())
+            ):
+                archived_ids = duplicates.loc[duplicates['archive_year'] == partition.year, 'id'].tolist()
+                partition.transactions -= _rewrite_partition(session, username, partition, lambda archived, ids=archived_ids: (
+                    archived.query(Detail).filter(Detail.id.in_(ids)).delete(synchronize_session=False)
+                ))
+            if rows['match_id'].isin(dup_ids).any():
+                # Re-pair the rows whose transfer or duplicate counterpart was just deleted
+                _match_user(session, username, Config.MATCH_WINDOW_DAYS)
+            _rebuild_recurring(session, username)
+            session.commit()
+            _remove_replaced_partitions(session)
+            if analytics_storage.is_enabled():
+                analytics_storage.mirror_delete(dup_ids)
+    finally:
+        session.close()
     if dup_ids:
-        session.query(Detail).filter(Detail.id.in_(dup_ids)).delete(synchronize_session=False)
-        session.commit()
-    session.close()
-    upload_file(Config.LOCAL_DB_PATH, Config.DB_S3_PATH + "/main.db")
+        upload_user_db(username)
     logger.info(f"Removed {len(dup_ids)} duplicate transactions for user {username}")
     return len(dup_ids)
 
 
-def save_transactions(username, account, df, mappings):
-    logger.debug(f"Saving transactions for user {username}, account {account}")
-    session = get_session()
+def _get_category_lookup(session):
+    return {
+        (m.original_category, m.merchant_name, m.description): m.target_category
+        for m in session.query(CategoryMapping).all()
+    }
+
+
+def _build_details(session, username, account, df, category_lookup):
+    if 'amount_cents' not in df.columns:
+        df = df.assign(amount_cents=to_cents(df['amount']) if 'amount' in df.columns else 0)
+    raw_names = merchant_raw_names(df)
+    canonical = _resolve_merchants(session, raw_names)
+    df = df.assign(month=transaction_months(df), canonical_merchant=[canonical.get(raw, '') for raw in raw_names])
+    details = []
     for _, row in df.iterrows():
-        category = get_target_category(row.get('original_category', ''), row.get('merchant_name', ''), row.get('description', ''))
-        detail = Detail(
+        category = category_lookup.get((row.get('original_category', ''), row.get('merchant_name', ''), row.get('description', '')), '')
+        amount_cents = int(row['amount_cents'])
+        details.append(Detail(
             username=username,
             account=account,
             date=row.get('date'),
@@ -162,13 +1299,600 @@ def save_transactions(username, account, df, mappings):
             merchant_name=row.get('merchant_name'),
             description=row.get('description'),
             currency=row.get('currency', 'CAD'),
-            amount=row.get('amount', 0.0),
-        )
-        session.add(detail)
+            amount=amount_cents / 100,
+            amount_cents=amount_cents,
+            original_currency=row.get('original_currency', row.get('currency', 'CAD')),
+            original_amount_cents=int(row.get('original_amount_cents', amount_cents)),
+            month=row['month'],
+            match_type='',
+            canonical_merchant=row['canonical_merchant'],
+        ))
+    return details
+
+
+def _commit_details(session, details):
+    """Commit new Detail rows (plus anything pending in the session) and mirror them for analytics"""
+    session.add_all(details)
+    session.flush()
+    added = pd.DataFrame(
+        [(d.username, d.merchant_name, d.description, d.post_date, d.date, d.amount_cents, d.category, d.month)
+         for d in details],
+        columns=_RECURRING_COLUMNS + ['category', 'month']
+    )
+    _update_recurring(session, added)
+    _add_category_spend(session, added)
+    frame = None
+    if analytics_storage.is_enabled():
+        frame = pd.DataFrame([{col: getattr(d, col) for col in analytics_storage.MIRROR_COLUMNS} for d in details],
+                             columns=analytics_storage.MIRROR_COLUMNS)
     session.commit()
+    if frame is not None:
+        analytics_storage.mirror_insert(frame)
+
+
+def save_transactions(username, account, df, mappings, file_hash=None, file_name=None):
+    """
+    Save mapped transactions. When file_hash is given the import is journaled: rows are
+    committed in chunks of IMPORT_CHUNK_SIZE and an interrupted import resumes after the
+    last committed chunk.
+    """
+    if file_hash is not None:
+        chunks = (df.iloc[start:start + Config.IMPORT_CHUNK_SIZE] for start in range(0, len(df), Config.IMPORT_CHUNK_SIZE))
+        return save_transaction_chunks(username, account, chunks, file_hash, file_name, total=len(df))
+    logger.debug(f"Saving transactions for user {username}, account {account}")
+    session = get_session(username)
+    _commit_details(session, _build_details(session, username, account, df, _get_category_lookup(session)))
     session.close()
-    upload_file(Config.LOCAL_DB_PATH, Config.DB_S3_PATH + "/main.db")
+    _upload_after_import(username)
     logger.info(f"Saved {len(df)} transactions for user {username} and account {account}")
+    return len(df)
+
+
+def save_transaction_chunks(username, account, chunks, file_hash, file_name, total=None):
+    """
+    Journaled import of mapped transactions arriving as an iterable of DataFrames, e.g. parsed from
+    a streaming statement reader. Each chunk commits atomically with its journal row; rows before the
+    last committed one are skipped, so an interrupted import resumes where it stopped.
+    """
+    logger.debug(f"Saving transactions for user {username}, account {account}")
+    session = get_session(username)
+    try:
+        category_lookup = _get_category_lookup(session)
+        state = _get_import_state(session, username, account, file_hash)
+        start = state['committed_rows']
+        if not state['started']:
+            _add_import_event(session, username, account, file_hash, file_name, 'started', 0, total)
+            session.commit()
+        elif start:
+            logger.info(f"Resuming import of {file_name} for user {username} at row {start}")
+        position = saved = 0
+        for chunk in chunks:
+            skip = min(max(start - position, 0), len(chunk))
+            if skip < len(chunk):
+                # The journal row commits atomically with the chunk it describes
+                _add_import_event(session, username, account, file_hash, file_name, 'committed', position + skip, position + len(chunk))
+                _commit_details(session, _build_details(session, username, account, chunk.iloc[skip:], category_lookup))
+                saved += len(chunk) - skip
+            position += len(chunk)
+        _add_import_event(session, username, account, file_hash, file_name, 'completed', 0, position)
+        session.commit()
+    finally:
+        session.close()
+    _upload_after_import(username)
+    logger.info(f"Saved {saved} transactions for user {username} and account {account}")
+    return saved
+
+
+def _upload_after_import(username):
+    upload_user_db(username)
+    if is_sharded():
+        upload_db()  # new merchant aliases
+
+
+def save_transactions_batch(username, batches):
+    """
+    Save several journaled batches in one transaction with a single DB upload.
+    Each batch is a dict with 'account', 'df', 'file_hash', 'file_name' and 'row_start'.
+    """
+    logger.debug(f"Saving {len(batches)} transaction batches for user {username}")
+    session = get_session(username)
+    try:
+        category_lookup = _get_category_lookup(session)
+        total = 0
+        details = []
+        for batch in batches:
+            account, df, row_start = batch['account'], batch['df'], batch['row_start']
+            details += _build_details(session, username, account, df.iloc[row_start:], category_lookup)
+            if row_start == 0:
+                _add_import_event(session, username, account, batch['file_hash'], batch['file_name'], 'started', 0, len(df))
+            _add_import_event(session, username, account, batch['file_hash'], batch['file_name'], 'committed', row_start, len(df))
+            _add_import_event(session, username, account, batch['file_hash'], batch['file_name'], 'completed', 0, len(df))
+            total += len(df) - row_start
+        _commit_details(session, details)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    _upload_after_import(username)
+    logger.info(f"Saved {total} transactions in {len(batches)} batches for user {username}")
+    return total
+
+# Merchant canonicalization functions
+def merchant_raw_names(df) -> list:
+    """The string each row's merchant is resolved from: merchant_name, or description when it is empty"""
+    merchants = df['merchant_name'] if 'merchant_name' in df.columns else [None] * len(df)
+    descriptions = df['description'] if 'description' in df.columns else [None] * len(df)
+    return [m if isinstance(m, str) and m.strip() else d if isinstance(d, str) else ''
+            for m, d in zip(merchants, descriptions)]
+
+
+def _resolve_merchants(session, raw_names):
+    """
+    {raw name: canonical name}. Known names come from MerchantAlias; new ones are cleaned, matched
+    to an existing merchant with the same key, or clustered with MinHash/LSH against existing
+    merchants and each other, and stored as new aliases in the session.
+    """
+    raw_counts = Counter(raw for raw in raw_names if raw)
+    raw_names = sorted(raw_counts)
+    resolved = {}
+    for start in range(0, len(raw_names), 5000):
+        resolved.update(session.query(MerchantAlias.raw_name, MerchantAlias.canonical_name).filter(
+            MerchantAlias.raw_name.in_(raw_names[start:start + 5000])
+        ).all())
+    new = [raw for raw in raw_names if raw not in resolved]
+    if not new:
+        return resolved
+    new_keys = {raw: clean_merchant(raw) for raw in new}
+    known_keys = dict(session.query(MerchantAlias.merchant_key, MerchantAlias.canonical_name).distinct().all())
+    unmatched = sorted({key for key in new_keys.values() if key and key not in known_keys})
+    if unmatched:
+        keys = list(known_keys) + unmatched
+        labels = cluster_merchants(keys)
+        # Each cluster takes the name of a merchant already in use, else its most common new key,
+        # spelled like the most common raw name that needed no cleaning ("IKEA", "WestJet")
+        key_counts, spellings = Counter(), {}
+        for raw, key in new_keys.items():
+            key_counts[key] += raw_counts[raw]
+            if normalize_merchant(raw) == key and not any(char.isdigit() or char in '#*' for char in raw):
+                spellings.setdefault(key, Counter())[raw.strip()] += raw_counts[raw]
+        names = {}
+        for key, label in zip(keys, labels):
+            if key in known_keys:
+                names.setdefault(label, known_keys[key])
+        clusters = pd.DataFrame({'key': keys, 'label': labels})
+        for label, members in clusters.groupby('label')['key']:
+            if label not in names:
+                key = min(members, key=lambda key: (-key_counts[key], len(key), key))
+                names[label] = spellings[key].most_common(1)[0][0] if key in spellings else display_name(key)
+        known_keys.update({key: names[label] for key, label in zip(keys, labels) if key not in known_keys})
+    aliases = [{'raw_name': raw, 'merchant_key': key, 'canonical_name': known_keys.get(key, '') if key else ''}
+               for raw, key in new_keys.items()]
+    session.execute(MerchantAlias.__table__.insert(), aliases)
+    resolved.update({alias['raw_name']: alias['canonical_name'] for alias in aliases})
+    logger.debug(f"Resolved {len(new)} new merchant names to canonical merchants")
+    return resolved
+
+
+def get_merchant_aliases():
+    logger.debug("Fetching merchant aliases")
+    session = get_session()
+    rows = session.query(MerchantAlias).order_by(MerchantAlias.canonical_name, MerchantAlias.raw_name).all()
+    session.close()
+    return rows
+
+# Budget functions
+def _add_category_spend(session, frame, sign=1):
+    """Add (sign=1) or remove (sign=-1) transactions from the per-(user, category, month) counters"""
+    if frame.empty:
+        return
+    frame = frame.assign(category=frame['category'].fillna(''), month=frame['month'].fillna(''))
+    totals = frame.groupby(['username', 'category', 'month'], sort=False).agg(
+        amount_cents=('amount_cents', 'sum'), transactions=('amount_cents', 'size')
+    ).reset_index()
+    session.execute(text("""
+        INSERT INTO CategorySpend (username, category, month, amount_cents, transactions)
+        VALUES (:username, :category, :month, :amount_cents, :transactions)
+        ON CONFLICT (username, category, month) DO UPDATE SET
+            amount_cents = amount_cents + excluded.amount_cents,
+            transactions = transactions + excluded.transactions
+    """), [{
+        'username': username, 'category': category, 'month': month,
+        'amount_cents': sign * int(amount_cents), 'transactions': sign * int(transactions),
+    } for username, category, month, amount_cents, transactions in totals.itertuples(index=False)])
+    if sign < 0:
+        session.execute(text("DELETE FROM CategorySpend WHERE transactions <= 0"))
+
+
+def _move_category_spend(session, orig_cat, merchant, description, target_category, source=None):
+    """Shift the counters of the rows a category mapping is about to recategorize (in source, if given)"""
+    matched = pd.DataFrame((source or session).query(
+        Detail.username, Detail.category, Detail.month, Detail.amount_cents
+    ).filter(
+        Detail.original_category == orig_cat,
+        Detail.merchant_name == merchant,
+        Detail.description == description,
+        Detail.match_type == ''
+    ).all(), columns=['username', 'category', 'month', 'amount_cents'])
+    _add_category_spend(session, matched, sign=-1)
+    _add_category_spend(session, matched.assign(category=target_category))
+
+
+def get_category_spend(username, month):
+    """{category: (amount_cents, transactions)} for one user and month"""
+    logger.debug(f"Fetching category spend for {username} in {month}")
+    session = get_session(username)
+    rows = session.query(CategorySpend).filter(
+        CategorySpend.username == username, CategorySpend.month == month
+    ).all()
+    session.close()
+    return {row.category: (row.amount_cents, row.transactions) for row in rows}
+
+
+def get_budgets(username):
+    logger.debug(f"Fetching budgets for user: {username}")
+    session = get_session(username)
+    rows = session.query(Budget).filter(Budget.username == username).order_by(Budget.category).all()
+    session.close()
+    return rows
+
+
+def save_budget(username, category, monthly_limit_cents):
+    logger.debug(f"Saving budget for {username}: {category} = {monthly_limit_cents}")
+    session = get_session(username)
+    budget = session.query(Budget).filter(Budget.username == username, Budget.category == category).first()
+    if budget:
+        budget.monthly_limit_cents = monthly_limit_cents
+    else:
+        session.add(Budget(username=username, category=category, monthly_limit_cents=monthly_limit_cents))
+    session.commit()
+    session.close()
+    upload_user_db(username)
+    logger.info(f"Saved budget for user {username}, category {category}")
+
+
+def delete_budget(username, category):
+    logger.debug(f"Deleting budget for {username}: {category}")
+    session = get_session(username)
+    session.query(Budget).filter(Budget.username == username, Budget.category == category).delete()
+    session.commit()
+    session.close()
+    upload_user_db(username)
+    logger.info(f"Deleted budget for user {username}, category {category}")
+
+# Category suggestion model functions
+def _train_category_model(session, documents, sign=1):
+    """Add (sign=1) or forget (sign=-1) labelled (orig_cat, merchant, description, category) documents"""
+    term_counts, class_documents, class_terms = Counter(), Counter(), Counter()
+    for orig_cat, merchant, description, category in documents:
+        if not category:
+            continue
+        terms = category_terms(orig_cat, merchant, description)
+        term_counts.update((term, category) for term in terms)
+        class_documents[category] += 1
+        class_terms[category] += len(terms)
+    if not class_documents:
+        return
+    session.execute(text("""
+        INSERT INTO CategoryModelTerm (term, category, count) VALUES (:term, :category, :count)
+        ON CONFLICT (term, category) DO UPDATE SET count = count + excluded.count
+    """), [{'term': term, 'category': category, 'count': sign * count}
+           for (term, category), count in term_counts.items()])
+    session.execute(text("""
+        INSERT INTO CategoryModelClass (category, documents, terms) VALUES (:category, :documents, :terms)
+        ON CONFLICT (category) DO UPDATE SET
+            documents = documents + excluded.documents, terms = terms + excluded.terms
+    """), [{'category': category, 'documents': sign * count, 'terms': sign * class_terms[category]}
+           for category, count in class_documents.items()])
+    if sign < 0:
+        session.execute(text("DELETE FROM CategoryModelTerm WHERE count <= 0"))
+        session.execute(text("DELETE FROM CategoryModelClass WHERE documents <= 0"))
+
+
+def rebuild_category_model():
+    """
+    Retrain the suggestion model from every CategoryMapping plus categorized Detail groups that
+    have no mapping (for example categories set before mappings were kept)
+    """
+    logger.debug("Rebuilding category suggestion model")
+    query = "SELECT original_category, merchant_name, description, target_category FROM CategoryMapping"
+    if not is_sharded():
+        query += """
+            UNION
+            SELECT DISTINCT d.original_category, d.merchant_name, d.description, d.category FROM Detail d
+            WHERE coalesce(d.category, '') != '' AND NOT EXISTS (
+                SELECT 1 FROM CategoryMapping m WHERE m.original_category = d.original_category
+                AND m.merchant_name = d.merchant_name AND m.description = d.description
+            )
+        """
+    session = get_session()
+    try:
+        documents = session.execute(text(query)).all()
+        session.query(CategoryModelTerm).delete()
+        session.query(CategoryModelClass).delete()
+        _train_category_model(session, documents)
+        session.commit()
+    finally:
+        session.close()
+    logger.info(f"Trained category suggestion model on {len(documents)} labelled groups")
+
+
+def get_category_model():
+    """(classes, terms) frames: per-category document/term totals and per-(term, category) counts"""
+    logger.debug("Loading category suggestion model")
+    classes = read_frame(
+        "SELECT category, documents, terms FROM CategoryModelClass ORDER BY category", (),
+        {'category': 'object', 'documents': 'int64', 'terms': 'int64'}
+    )
+    terms = read_frame(
+        "SELECT term, category, count FROM CategoryModelTerm", (),
+        {'term': 'object', 'category': 'object', 'count': 'int64'}
+    )
+    return classes, terms
+
+# Transfer and near-duplicate matching functions
+_MATCH_COLUMNS = ['id', 'account', 'date', 'post_date', 'merchant_name', 'description', 'amount_cents',
+                  'category', 'month', 'match_type', 'match_id']
+
+
+def _match_user(session, username, window_days, clear=False):
+    """
+    Recompute the transfer/duplicate flags of one user's transactions and apply the changes,
+    moving rows in and out of the spend counters and recurring statistics. Returns the
+    number of matched rows and the number of rows whose flags changed.
+    """
+    rows = _detail_frame(session, username, _MATCH_COLUMNS, "username = :username", {'username': username})
+    if rows.empty:
+        return 0, 0
+    if clear:
+        matches = rows[['id']].assign(match_type='', match_id=pd.array([None] * len(rows), dtype='Int64'))
+    else:
+        matches = find_matches(rows, window_days)
+    new = rows[['id', 'category', 'month', 'amount_cents', 'match_type', 'match_id', 'archive_year']].merge(
+        matches, on='id', suffixes=('_old', '')
+    )
+    old_id, new_id = new['match_id_old'].astype('Int64'), new['match_id'].astype('Int64')
+    same_id = (old_id == new_id).fillna(False) | (old_id.isna() & new_id.isna())
+    changed = new[(new['match_type'] != new['match_type_old']) | ~same_id]
+    if not changed.empty:
+        spend = changed.assign(username=username)
+        _add_category_spend(session, spend[(spend['match_type_old'] == '') & (spend['match_type'] != '')], sign=-1)
+        _add_category_spend(session, spend[(spend['match_type_old'] != '') & (spend['match_type'] == '')])
+        update = text("UPDATE Detail SET match_type = :match_type, match_id = :match_id WHERE id = :id")
+        flags = {year: [
+            {'id': int(row.id), 'match_type': row.match_type,
+             'match_id': None if pd.isna(row.match_id) else int(row.match_id)}
+            for row in group.itertuples(index=False)
+        ] for year, group in changed.groupby('archive_year')}
+        if '' in flags:
+            session.execute(update, flags.pop(''))
+        # Archived years are rewritten as new partition versions
+        for partition in session.query(DetailPartition).filter(DetailPartition.year.in_(list(flags))):
+            _rewrite_partition(session, username, partition,
+                               lambda archived, params=flags[partition.year]: archived.execute(update, params))
+        if ((changed['match_type'] == '') != (changed['match_type_old'] == '')).any():
+            _rebuild_recurring(session, username)
+        if analytics_storage.is_enabled():
+            analytics_storage.mirror_set_matches(changed[['id', 'match_type']])
+    logger.debug(f"Updated the match flags of {len(changed)} transactions for user {username}")
+    return int((matches['match_type'] != '').sum()), len(changed)
+
+
+def match_transactions(username, window_days=None):
+    """
+    Flag inter-account transfers (opposite-sign equal amounts in different accounts) and
+    re-exported near-duplicates within window_days so they no longer count in totals
+    """
+    window_days = Config.MATCH_WINDOW_DAYS if window_days is None else window_days
+    logger.debug(f"Matching transfers and near-duplicates for {username} within {window_days} days")
+    session = get_session(username)
+    try:
+        matched, changed = _match_user(session, username, window_days)
+        session.commit()
+        _remove_replaced_partitions(session)
+    finally:
+        session.close()
+    if changed:
+        upload_user_db(username)
+    logger.info(f"Matched {matched} transfer and near-duplicate transactions for user {username}")
+    return matched
+
+
+def clear_matches(username):
+    """Remove every transfer/duplicate flag of a user, counting those rows in totals again"""
+    logger.debug(f"Clearing transaction matches for {username}")
+    session = get_session(username)
+    try:
+        _, changed = _match_user(session, username, 0, clear=True)
+        session.commit()
+        _remove_replaced_partitions(session)
+    finally:
+        session.close()
+    if changed:
+        upload_user_db(username)
+    logger.info(f"Cleared transaction matches for user {username}")
+
+# Recurring transaction functions
+_RECURRING_COLUMNS = ['username', 'merchant_name', 'description', 'post_date', 'date', 'amount_cents']
+
+
+def _welford(count, mean, m2, values):
+    for value in values:
+        count += 1
+        delta = value - mean
+        mean += delta / count
+        m2 += delta * (value - mean)
+    return count, mean, m2
+
+
+def _update_recurring(session, frame):
+    """
+    Fold new transactions into the per-(user, merchant) statistics. Intervals are only extended at
+    either end of a merchant's known date range; charges landing inside it update the amount
+    statistics but cannot be placed between the dates already summarized.
+    """
+    if frame.empty:
+        return
+    frame = frame.assign(merchant_key=[
+        normalize_merchant(m, d) for m, d in zip(frame['merchant_name'], frame['description'])
+    ])
+    frame = frame[frame['merchant_key'] != '']
+    # Proleptic ordinal day numbers (date.toordinal()), NaN where no date parses
+    days_since_epoch = (analytics_storage.parse_dates(frame).dt.normalize() - pd.Timestamp('1970-01-01')).dt.days
+    frame = frame.assign(day=days_since_epoch + datetime.date(1970, 1, 1).toordinal()).sort_values('day', kind='stable')
+    names = frame['merchant_name'].to_numpy(dtype=object)
+    amounts = frame['amount_cents'].to_numpy(dtype=float)
+    all_days = frame['day'].to_numpy(dtype=float)
+    existing = {
+        (row.username, row.merchant_key): row
+        for row in session.query(RecurringMerchant).filter(
+            RecurringMerchant.username.in_(frame['username'].unique().tolist()),
+            RecurringMerchant.merchant_key.in_(frame['merchant_key'].unique().tolist())
+        )
+    }
+    for (username, key), positions in frame.groupby(['username', 'merchant_key'], sort=False).indices.items():
+        row = existing.get((username, key))
+        if row is None:
+            row = RecurringMerchant(username=username, merchant_key=key, occurrences=0, amount_mean=0.0,
+                                    amount_m2=0.0, interval_count=0, interval_mean=0.0, interval_m2=0.0)
+            session.add(row)
+        row.merchant_name = names[positions[-1]] or key
+        row.occurrences, row.amount_mean, row.amount_m2 = _welford(
+            row.occurrences, row.amount_mean, row.amount_m2, amounts[positions].tolist()
+        )
+        days = [int(day) for day in all_days[positions] if pd.notna(day)]
+        if not days:
+            continue
+        if row.last_date is None:
+            intervals = [b - a for a, b in pairwise(days)]
+            first, last = days[0], days[-1]
+        else:
+            first = datetime.date.fromisoformat(row.first_date).toordinal()
+            last = datetime.date.fromisoformat(row.last_date).toordinal()
+            later = [last] + [day for day in days if day >= last]
+            earlier = [day for day in days if day < first] + [first]
+            intervals = [b - a for seq in (earlier, later) for a, b in pairwise(seq)]
+            first, last = min(first, days[0]), max(last, days[-1])
+        row.interval_count, row.interval_mean, row.interval_m2 = _welford(
+            row.interval_count, row.interval_mean, row.interval_m2, intervals
+        )
+        row.first_date = datetime.date.fromordinal(first).isoformat()
+        row.last_date = datetime.date.fromordinal(last).isoformat()
+
+
+def _rebuild_recurring(session, username=None):
+    """Recompute recurring statistics from the hot and archived transactions reachable from the session"""
+    query = session.query(RecurringMerchant)
+    condition, params = "match_type = ''", {}
+    if username is not None:
+        query = query.filter(RecurringMerchant.username == username)
+        condition += " AND username = :username"
+        params['username'] = username
+    query.delete(synchronize_session=False)
+    frame = _detail_frame(session, username, _RECURRING_COLUMNS, condition, params)
+    _update_recurring(session, frame.drop(columns='archive_year'))
+
+
+def rebuild_recurring(username=None):
+    """Recompute recurring statistics from Detail for one user, or for everyone"""
+    logger.debug(f"Rebuilding recurring statistics for {username or 'all users'}")
+    # Sharded: every user's statistics live in their own shard
+    for shard_user in ([username] if username is not None else shard_usernames()) if is_sharded() else [username]:
+        session = get_session(shard_user)
+        try:
+            _rebuild_recurring(session, shard_user)
+            session.commit()
+        finally:
+            session.close()
+    logger.info(f"Rebuilt recurring statistics for {username or 'all users'}")
+
+
+def get_recurring_merchants(username, min_occurrences=3):
+    logger.debug(f"Fetching recurring merchant statistics for user: {username}")
+    session = get_session(username)
+    rows = session.query(RecurringMerchant).filter(
+        RecurringMerchant.username == username,
+        RecurringMerchant.occurrences >= min_occurrences
+    ).all()
+    session.close()
+    return rows
+
+
+def search_details(username, match, filters: dict, limit, offset):
+    """
+    Rank a user's transactions, archived years included, against an FTS5 MATCH expression with bm25.
+    filters may hold 'accounts', 'categories' and 'merchants' lists. Returns (rows, total).
+    """
+    logger.debug(f"Searching transactions for {username}: {match}")
+    where = ["DetailSearch MATCH :match", "d.username = :username"]
+    params = {'match': match, 'username': username}
+    for key, column in (('accounts', 'account'), ('categories', 'category'), ('merchants', 'merchant_name')):
+        values = (filters or {}).get(key)
+        if values:
+            names = [f"{key}_{i}" for i in range(len(values))]
+            where.append(f"d.{column} IN ({', '.join(':' + n for n in names)})")
+            params.update(zip(names, values))
+    clause = ' AND '.join(where)
+    batches = partition_batches(detail_partitions(username))
+    # Over several batches each returns its best offset + limit hits, and the page is cut after merging
+    merged = len(batches) > 1
+    total, rows = 0, []
+    for number, batch in enumerate(batches):
+        # Each partition has its own search index; bm25 is computed per index
+        hits = ' UNION ALL '.join(f"""
+            SELECT d.id, d.account, d.post_date, d.category, d.merchant_name, d.description, d.amount,
+                   bm25(DetailSearch) AS rank
+            FROM {schema}.DetailSearch JOIN {schema}.Detail d ON d.id = DetailSearch.rowid
+            WHERE {clause}
+        """ for schema in (['main'] if number == 0 else []) + [f"p{partition.year}" for partition in batch])
+        with user_engine(username).connect() as conn, attached_partitions(conn.exec_driver_sql, username, batch):
+            total += conn.execute(text(f"SELECT count(*) FROM ({hits})"), params).scalar()
+            rows += conn.execute(text(f"""
+                SELECT id, account, post_date, category, merchant_name, description, amount, rank FROM ({hits})
+                ORDER BY rank, id
+                LIMIT :limit OFFSET :offset
+            """), {**params, 'limit': offset + limit if merged else limit, 'offset': 0 if merged else offset}).all()
+    if merged:
+        rows = sorted(rows, key=lambda row: (row.rank, row.id))[offset:offset + limit]
+    return [tuple(row)[:-1] for row in rows], total
+
+# Import journal functions
+def _add_import_event(session, username, account, file_hash, file_name, status, row_start=None, row_end=None):
+    session.add(ImportJournal(
+        username=username, account=account, file_hash=file_hash, file_name=file_name,
+        status=status, row_start=row_start, row_end=row_end
+    ))
+
+
+def _get_import_state(session, username, account, file_hash):
+    events = session.query(ImportJournal.status, ImportJournal.row_end).filter(
+        ImportJournal.username == username,
+        ImportJournal.account == account,
+        ImportJournal.file_hash == file_hash
+    ).all()
+    return {
+        'started': bool(events),
+        'completed': any(status == 'completed' for status, _ in events),
+        'archived': any(status == 'archived' for status, _ in events),
+        'committed_rows': max((row_end for status, row_end in events if status == 'committed'), default=0),
+    }
+
+
+def get_import_state(username, account, file_hash):
+    """Summarize the journal for one file: started, completed, archived and committed_rows"""
+    logger.debug(f"Fetching import state for {username}/{account}/{file_hash}")
+    session = get_session(username)
+    state = _get_import_state(session, username, account, file_hash)
+    session.close()
+    return state
+
+
+def record_import_archived(username, account, file_hash, file_name):
+    """Journal a successful raw-file upload; persisted to MinIO with the next DB upload"""
+    session = get_session(username)
+    _add_import_event(session, username, account, file_hash, file_name, 'archived')
+    session.commit()
+    session.close()
 
 # User functions
 def create_user(username, hashed_password, email, api_token):
@@ -177,7 +1901,7 @@ def create_user(username, hashed_password, email, api_token):
     user = User(username=username, password=hashed_password, email=email, api_token=api_token)
     session.add(user)
     session.commit()
-    upload_file(Config.LOCAL_DB_PATH, Config.DB_S3_PATH + "/main.db")
+    upload_db()
     session.close()
 
 
@@ -194,7 +1918,7 @@ def update_user_token(username, token):
     session = get_session()
     session.query(User).filter(User.username == username).update({User.api_token: token})
     session.commit()
-    upload_file(Config.LOCAL_DB_PATH, Config.DB_S3_PATH + "/main.db")
+    upload_db()
     session.close()
 
 def get_all_accounts():
@@ -0,0 +1,258 @@
+"""
+Statement Readers - Pluggable parsers that stream uploaded statements (CSV, OFX/QFX, XLSX) as DataFrame chunks.
+Readers are registered by file extension; each yields chunks of raw rows with a running index, so
+the field mapping and journaled insert pipeline never needs the whole file parsed at once.
+"""
+import codecs
+import datetime
+import html
+import os
+import re
+from typing import ClassVar
+from zipfile import BadZipFile
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from config.configure import Config
+
+READERS = {}  # lowercase extension without the dot -> reader class
+
+
+def register_reader(*extensions):
+    """Class decorator registering a reader for the given file extensions"""
+    def register(reader):
+        for extension in extensions:
+            READERS[extension] = reader
+        return reader
+    return register
+
+
+def supported_types() -> list:
+    """Extensions accepted for upload"""
+    return sorted(READERS)
+
+
+def reader_for(file_name: str):
+    """Reader for a file name; files without an extension are read as CSV"""
+    extension = os.path.splitext(file_name or '')[1].lower().lstrip('.') or 'csv'
+    if extension not in READERS:
+        raise ValueError(f"Unsupported statement type '.{extension}'; upload one of: {', '.join(supported_types())}")
+    return READERS[extension]
+
+
+def read_header(uploaded_file) -> list:
+    """Column names of an uploaded statement; leaves the file at the start"""
+    uploaded_file.seek(0)
+    try:
+        return reader_for(uploaded_file.name).header(uploaded_file)
+    finally:
+        uploaded_file.seek(0)
+
+
+def has_fixed_columns(file_name: str) -> bool:
+    """Whether the format's columns are the same for every bank, so the header cannot identify an account"""
+    return getattr(reader_for(file_name), 'fixed_columns', False)
+
+
+def read_account_id(uploaded_file) -> str | None:
+    """Account id the statement declares, for formats that carry one; leaves the file at the start"""
+    reader = reader_for(uploaded_file.name)
+    if not hasattr(reader, 'account_id'):
+        return None
+    uploaded_file.seek(0)
+    try:
+        return reader.account_id(uploaded_file)
+    finally:
+        uploaded_file.seek(0)
+
+
+def iter_chunks(uploaded_file, chunk_size: int | None = None):
+    """DataFrames of at most chunk_size (IMPORT_CHUNK_SIZE) rows, indexed by row position in the file"""
+    uploaded_file.seek(0)
+    yield from reader_for(uploaded_file.name).chunks(uploaded_file, chunk_size or Config.IMPORT_CHUNK_SIZE)
+
+
+def read_frame(uploaded_file) -> pd.DataFrame:
+    """Whole statement as one DataFrame, e.g. for a preview"""
+    chunks = list(iter_chunks(uploaded_file))
+    return pd.concat(chunks) if chunks else pd.DataFrame(columns=read_header(uploaded_file))
+
+
+def suggested_mappings(uploaded_file) -> dict:
+    """Field mapping to prefill for a new account, for formats with fixed columns"""
+    return dict(reader_for(uploaded_file.name).suggested_mappings)
+
+
+def _unique_columns(names) -> list:
+    """Name blank header cells and suffix repeated names like read_csv does ("Amount", "Amount.1")"""
+    columns, seen = [], {}
+    for i, name in enumerate(names):
+        name = str(name).strip() if name is not None and str(name).strip() else f'Column {i + 1}'
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+@register_reader('csv')
+class CSVReader:
+    """Comma-separated statements, parsed by pandas in chunks"""
+    suggested_mappings: ClassVar[dict] = {}
+
+    @staticmethod
+    def header(file) -> list:
+        return pd.read_csv(file, nrows=0).columns.tolist()
+
+    @staticmethod
+    def chunks(file, chunk_size: int):
+        # read_csv continues the index across chunks
+        yield from pd.read_csv(file, chunksize=chunk_size)
+
+
+@register_reader('ofx', 'qfx')
+class OFXReader:
+    """
+    OFX and Quicken QFX statements, both the SGML 1.x form (leaf tags left open) and XML 2.x.
+    Tags are scanned one block at a time like an iterparse; each STMTTRN becomes a row that also
+    carries its statement's ACCTID and CURDEF.
+    """
+    COLUMNS = ('DTPOSTED', 'DTUSER', 'TRNTYPE', 'TRNAMT', 'NAME', 'MEMO', 'FITID', 'CHECKNUM', 'CURDEF', 'ACCTID')
+    fixed_columns = True
+    suggested_mappings: ClassVar[dict] = {
+        'account_type': 'debit',  # OFX amounts are already signed from the account holder's side
+        'date': 'DTPOSTED', 'post_date': 'DTPOSTED', 'original_category': 'TRNTYPE',
+        'merchant_name': 'NAME', 'description': 'MEMO', 'currency': 'CURDEF', 'amount': 'TRNAMT',
+    }
+    _TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+    _BLOCK_SIZE = 1 << 16
+
+    @staticmethod
+    def header(file) -> list:
+        return list(OFXReader.COLUMNS)
+
+    @staticmethod
+    def account_id(file) -> str | None:
+        """ACCTID of the first statement, which comes before its transactions"""
+        for closing, tag, text in OFXReader._events(file):
+            if tag == 'ACCTID' and not closing and text:
+                return text
+            if tag == 'STMTTRN':
+                return None
+        return None
+
+    @staticmethod
+    def _events(file):
+        """(closing, tag, text) for every tag, decoding and scanning the file one block at a time"""
+        head = file.read(OFXReader._BLOCK_SIZE)
+        # SGML headers declare the Windows code page; XML files are UTF-8
+        encoding = 'cp1252' if b'CHARSET:1252' in head.upper() else 'utf-8'
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        buffer = decoder.decode(head)
+        while True:
+            block = file.read(OFXReader._BLOCK_SIZE)
+            buffer += decoder.decode(block, final=not block)
+            # A tag's text runs to the next '<', so the last tag is only complete at the end of the file
+            end = max(buffer.rfind('<'), 0) if block else len(buffer)
+            for match in OFXReader._TAG.finditer(buffer, 0, end):
+                yield match.group(1) == '/', match.group(2).upper(), html.unescape(match.group(3).strip())
+            buffer = buffer[end:]
+            if not block:
+                return
+
+    @staticmethod
+    def _date(value: str) -> str:
+        # YYYYMMDD[HHMMSS[.XXX]][[offset:TZ]]; only the calendar date is kept, like CSV statements
+        return f'{value[:4]}-{value[4:6]}-{value[6:8]}' if len(value) >= 8 and value[:8].isdigit() else value
+
+    @staticmethod
+    def _frame(records: list, offset: int) -> pd.DataFrame:
+        df = pd.DataFrame(records, columns=OFXReader.COLUMNS, index=pd.RangeIndex(offset, offset + len(records)))
+        for column in ('DTPOSTED', 'DTUSER'):
+            df[column] = df[column].map(OFXReader._date, na_action='ignore')
+        return df
+
+    @staticmethod
+    def chunks(file, chunk_size: int):
+        statement, record, records, offset = {}, None, [], 0
+        for closing, tag, text in OFXReader._events(file):
+            if tag == 'STMTTRN':
+                if record is not None:
+                    records.append(record)
+                # CURDEF and the account's ACCTID come before the transaction list
+                record = None if closing else {key: statement[key] for key in ('CURDEF', 'ACCTID') if key in statement}
+                if len(records) == chunk_size:
+                    yield OFXReader._frame(records, offset)
+                    offset += len(records)
+                    records = []
+            elif closing or not text:
+                continue
+            elif record is not None:
+                # NAME and a nested PAYEE NAME are alternatives; keep whichever comes first
+                record.setdefault(tag, text)
+            elif tag in ('CURDEF', 'ACCTID'):
+                statement[tag] = text
+        if record is not None:
+            records.append(record)
+        if records:
+            yield OFXReader._frame(records, offset)
+
+
+@register_reader('xlsx')
+class XLSXReader:
+    """
+    Excel workbooks; the first sheet's first non-empty row is the header. Opened read-only, so
+    openpyxl streams rows from the zipped sheet instead of building every cell of the workbook.
+    """
+    suggested_mappings: ClassVar[dict] = {}
+
+    @staticmethod
+    def _rows(file):
+        try:
+            workbook = load_workbook(file, read_only=True, data_only=True)
+        except (BadZipFile, InvalidFileException, KeyError) as e:
+            raise ValueError(f"Not a readable XLSX workbook: {e}") from e
+        try:
+            for row in workbook.worksheets[0].iter_rows(values_only=True):
+                if any(value is not None and value != '' for value in row):
+                    yield row
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _value(value):
+        # Cells formatted as dates arrive as datetimes; store them as text like CSV dates
+        if isinstance(value, datetime.datetime):
+            return value.date().isoformat() if value.time() == datetime.time() else value.isoformat(sep=' ')
+        if isinstance(value, datetime.date):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def header(file) -> list:
+        rows = XLSXReader._rows(file)
+        try:
+            return _unique_columns(next(rows, ()))
+        finally:
+            rows.close()
+
+    @staticmethod
+    def chunks(file, chunk_size: int):
+        rows = XLSXReader._rows(file)
+        try:
+            columns = _unique_columns(next(rows, ()))
+            width, records, offset = len(columns), [], 0
+            for row in rows:
+                records.append([XLSXReader._value(value) for value in row[:width]] + [None] * (width - len(row)))
+                if len(records) == chunk_size:
+                    yield pd.DataFrame(records, columns=columns, index=pd.RangeIndex(offset, offset + len(records)))
+                    offset += len(records)
+                    records = []
+            if records:
+                yield pd.DataFrame(records, columns=columns, index=pd.RangeIndex(offset, offset + len(records)))
+        finally:
+            rows.close()
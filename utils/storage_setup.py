@@ -0,0 +1,63 @@
+"""
+Storage Setup - Per-process database bootstrap shared by the Streamlit app and the API
+"""
+import os
+
+from config.configure import Config
+from utils import replication
+from utils.minio_storage import download_db
+from utils.sqlite_storage import (
+    create_empty_database,
+    initialize_db,
+    swap_database,
+    sync_analytics_mirror,
+)
+
+
+def load_snapshot(path):
+    swap_database(path, read_only=True)
+    # The writer recategorizes and flags rows in place, which leaves the row count and max id the
+    # mirror's drift check compares unchanged, so every new snapshot rebuilds it
+    sync_analytics_mirror(force=True)
+
+
+def refresh_replica():
+    """Follow the newest main.db snapshot read-only, as followers do"""
+    replication.refresh_snapshot(load_snapshot)
+
+
+def load_empty_replica():
+    # Nothing in the bucket yet: answer reads from empty tables until a writer uploads main.db
+    path = f"{Config.LOCAL_DB_PATH}.empty"
+    if os.path.exists(path):
+        os.remove(path)
+    create_empty_database(path)
+    load_snapshot(path)
+
+
+def load_writer_database():
+    # A new lease holder may be taking over from another writer, so always start from the bucket copy
+    download_db()
+    swap_database(Config.LOCAL_DB_PATH)
+    initialize_db()
+    sync_analytics_mirror(force=True)
+
+
+def setup_storage():
+    """Download on first run, then create any missing tables; followers and writers follow their role"""
+    os.makedirs(os.path.dirname(Config.LOCAL_DB_PATH) or '.', exist_ok=True)
+    if Config.STORAGE_MODE == 'sharded' and Config.DB_ROLE == 'follower':
+        raise ValueError('Followers replicate main.db only; run sharded storage as standalone or writer')
+    if Config.DB_ROLE == 'follower':
+        if not replication.start_follower(load_snapshot):
+            load_empty_replica()
+        return
+    if Config.DB_ROLE == 'writer':
+        # A standby serves reads from snapshots exactly like a follower until the lease frees up
+        if not replication.start_writer(load_writer_database, on_standby=refresh_replica) and replication.snapshot_etag() is None:
+            load_empty_replica()
+        return
+    if not os.path.exists(Config.LOCAL_DB_PATH):
+        download_db()
+    initialize_db()
+    sync_analytics_mirror()
@@ -0,0 +1,107 @@
+"""
+Transaction Matching - Sort-merge detection of inter-account transfers and re-exported near-duplicates
+"""
+from collections import deque
+from itertools import pairwise
+
+import numpy as np
+import pandas as pd
+
+from utils.analytics_storage import parse_dates
+from utils.merchant_names import normalize_merchant
+
+TRANSFER = 'transfer'
+DUPLICATE = 'duplicate'
+
+
+def _days(df: pd.DataFrame) -> pd.Series:
+    """Day number of each row's post_date (falling back to date); NaN when neither parses"""
+    dates = parse_dates(df)
+    return (dates - pd.Timestamp('1970-01-01')).dt.days
+
+
+def _group_starts(keys: list) -> np.ndarray:
+    """Start offsets of runs of equal keys in frames already sorted by those keys"""
+    change = np.zeros(len(keys[0]), dtype=bool)
+    change[0] = True
+    for key in keys:
+        change[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(change)
+
+
+def find_near_duplicates(df: pd.DataFrame, window_days: int) -> dict:
+    """
+    {id: kept id} for rows that repeat an earlier row of the same account, amount, merchant and
+    transaction date with a post_date at most window_days later, as when a statement is re-exported
+    after the bank shifted its posting dates.
+    """
+    frame = df.assign(
+        day=_days(df),
+        merchant_key=[normalize_merchant(m, d) for m, d in zip(df['merchant_name'], df['description'])],
+        txn_date=df['date'].fillna(''),
+        account=df['account'].fillna(''),
+    ).dropna(subset=['day']).sort_values(['account', 'amount_cents', 'merchant_key', 'txn_date', 'day', 'id'])
+    if frame.empty:
+        return {}
+    keys = [frame[col].to_numpy() for col in ('account', 'amount_cents', 'merchant_key', 'txn_date')]
+    ids, days = frame['id'].to_numpy(), frame['day'].to_numpy()
+    bounds = np.r_[_group_starts(keys), len(frame)]
+    matches = {}
+    for start, end in pairwise(bounds):
+        kept = start
+        for i in range(start + 1, end):
+            if days[i] - days[kept] <= window_days:
+                matches[int(ids[i])] = int(ids[kept])
+            else:
+                kept = i
+    return matches
+
+
+def find_transfers(df: pd.DataFrame, window_days: int) -> dict:
+    """
+    {id: counterpart id} pairing each outflow with an inflow of the same absolute amount in a
+    different account at most window_days apart. Rows are sorted by (|amount|, day) and merged in
+    one pass, each side keeping a queue of unmatched rows still inside the window, so the cost is
+    O(n log n) for the sort rather than pairwise.
+    """
+    frame = df.assign(
+        day=_days(df), size=df['amount_cents'].abs(), account=df['account'].fillna('')
+    ).dropna(subset=['day'])
+    frame = frame[frame['size'] > 0].sort_values(['size', 'day', 'id'])
+    if frame.empty:
+        return {}
+    ids, days = frame['id'].to_numpy(), frame['day'].to_numpy()
+    accounts, outflow = frame['account'].to_numpy(), (frame['amount_cents'] < 0).to_numpy()
+    bounds = np.r_[_group_starts([frame['size'].to_numpy()]), len(frame)]
+    matches = {}
+    for start, end in pairwise(bounds):
+        if end - start < 2 or outflow[start:end].all() or not outflow[start:end].any():
+            continue
+        pending = {True: deque(), False: deque()}
+        for i in range(start, end):
+            candidates = pending[not outflow[i]]
+            while candidates and days[i] - days[candidates[0]] > window_days:
+                candidates.popleft()
+            partner = next((j for j in candidates if accounts[j] != accounts[i]), None)
+            if partner is None:
+                pending[bool(outflow[i])].append(i)
+                continue
+            candidates.remove(partner)
+            matches[int(ids[i])], matches[int(ids[partner])] = int(ids[partner]), int(ids[i])
+    return matches
+
+
+def match_transactions(df: pd.DataFrame, window_days: int) -> pd.DataFrame:
+    """
+    match_type ('', 'duplicate' or 'transfer') and match_id for every row of df, which needs id,
+    account, date, post_date, merchant_name, description and amount_cents. Near-duplicates are
+    found first and are not paired as transfers.
+    """
+    duplicates = find_near_duplicates(df, window_days)
+    transfers = find_transfers(df[~df['id'].isin(list(duplicates))], window_days)
+    result = pd.DataFrame({'id': df['id'], 'match_type': '', 'match_id': pd.array([None] * len(df), dtype='Int64')})
+    for kind, matches in ((DUPLICATE, duplicates), (TRANSFER, transfers)):
+        flagged = result['id'].isin(list(matches))
+        result.loc[flagged, 'match_type'] = kind
+        result.loc[flagged, 'match_id'] = result.loc[flagged, 'id'].map(matches)
+    return result